@@ -1,13 +1,16 @@
-from collections import deque
+from bisect import bisect_right
+from itertools import chain
 
 import numpy as np
 #from algorithm.parameters import params
+from representation.arena_tree import NO_NODE, ArenaTree
 from representation.tree import Tree
 from utilities.representation.python_filter import python_filter
 from representation.code_tree import CodeTree, NonTerminal, Terminal
 
 
-def mapper(genome, tree, agent):
+def mapper(genome, tree, agent, checkpoints=None, resume=None,
+           build_tree=True):
     """
     Wheel for mapping. Calls the correct mapper for a given _input. Checks
     the params dict to ensure the correct type of individual is being created.
@@ -18,6 +21,14 @@ def mapper(genome, tree, agent):
 
     :param genome: Genome of an individual.
     :param tree: Tree of an individual.
+    :param checkpoints: MappingCheckpoints to record mapping of the genome
+    into, with GENOME_OPERATIONS only (see map_genome).
+    :param resume: Checkpoints of a parent and the length of the prefix the
+    genome shares with the parent's one, with GENOME_OPERATIONS only (see
+    map_genome).
+    :param build_tree: Without GENOME_OPERATIONS, build the derivation tree
+    of the genome. If False, the returned tree is None, the rest is the same
+    as if the tree was built.
     :return: All components necessary for a fully mapped individual.
     """
 
@@ -37,13 +48,25 @@ def mapper(genome, tree, agent):
             # algorithm.mapper.map_ind_from_genome() if we don't need to
             # store the whole tree.
             phenotype, genome, tree, nodes, invalid, depth, \
-            used_codons = map_ind_from_genome(genome, agent=agent)
+            used_codons = map_ind_from_genome(genome, agent=agent,
+                                              checkpoints=checkpoints,
+                                              resume=resume)
+
+        elif not build_tree:
+            # Map the genome as if the tree was built, without building it.
+            phenotype, genome, tree, nodes, invalid, depth, \
+                used_codons = map_arena_from_genome(genome, agent=agent,
+                                                    build_tree=False)
 
         else:
             # Build the tree using algorithm.mapper.map_tree_from_genome() or algorithm.mapper.map_codetree_from_genome() for attribute grammar.
             if agent.GE_params["ATTRIBUTE_GRAMMAR"]:
                 phenotype, genome, tree, nodes, invalid, depth, \
                     used_codons = map_codetree_from_genome(genome, agent=agent)
+            elif agent.GE_params['ARENA_TREES']:
+                # Store the tree as arrays (representation.arena_tree).
+                phenotype, genome, tree, nodes, invalid, depth, \
+                    used_codons = map_arena_from_genome(genome, agent=agent)
             else:
                 phenotype, genome, tree, nodes, invalid, depth, \
                     used_codons = map_tree_from_genome(genome, agent=agent)
@@ -54,9 +77,12 @@ def mapper(genome, tree, agent):
         # genome, output, invalid, depth, and nodes can all be
         # generated by recursing through the tree once.
 
-        genome, output, invalid, depth, \
-        nodes = tree.get_tree_info(agent.GE_params['BNF_GRAMMAR'].non_terminals.keys(),
-                                   [], [])
+        if isinstance(tree, ArenaTree):
+            genome, output, invalid, depth, nodes = tree.tree_info()
+        else:
+            genome, output, invalid, depth, \
+            nodes = tree.get_tree_info(agent.GE_params['BNF_GRAMMAR'].non_terminals.keys(),
+                                       [], [])
         used_codons, phenotype = len(genome), "".join(output)
 
     if agent.GE_params['BNF_GRAMMAR'].python_mode and not invalid:
@@ -71,13 +97,16 @@ def mapper(genome, tree, agent):
     return phenotype, genome, tree, nodes, invalid, depth, used_codons
 
 
-def map_ind_from_genome(genome, agent):
+def map_ind_from_genome(genome, agent, checkpoints=None, resume=None):
     """
     A fast genotype to phenotype mapping process. Map input via rules to
     output. Does not require the recursive tree class, but still calculates
     tree information, e.g. number of nodes and maximum depth.
 
     :param genome: A genome to be mapped.
+    :param checkpoints: MappingCheckpoints to record the mapping into.
+    :param resume: Checkpoints of a parent and the length of the prefix the
+    genome shares with the parent's one (see map_genome).
     :return: Output in the form of a phenotype string ('None' if invalid),
              Genome,
              None (this is reserved for the derivation tree),
@@ -87,101 +116,377 @@ def map_ind_from_genome(genome, agent):
              The number of used codons.
     """
 
-    # Create local variables to avoid multiple dictionary lookups
-    max_tree_depth, max_wraps = agent.GE_params['MAX_TREE_DEPTH'], agent.GE_params['MAX_WRAPS']
-    bnf_grammar = agent.GE_params['BNF_GRAMMAR']
+    phenotype, nodes, invalid, max_depth, used_input = map_genome(
+        agent.GE_params['BNF_GRAMMAR'].compiled, genome,
+        agent.GE_params['MAX_TREE_DEPTH'], agent.GE_params['MAX_WRAPS'],
+        checkpoints, resume)
 
-    n_input = len(genome)
+    return phenotype, genome, None, nodes, invalid, max_depth, used_input
 
-    # Depth, max_depth, and nodes start from 1 to account for starting root
-    # Initialise number of wraps at -1 (since
-    used_input, current_depth, max_depth, nodes, wraps = 0, 1, 1, 1, -1
 
-    # Initialise output as empty deque list (deque is a list-like container
-    # with fast appends and pops on either end).
-    output = deque()
+class MappingCheckpoints(object):
+    """
+    States of map_genome recorded every interval codons of the first pass
+    over a genome: at the first iteration that reads codon position p, the
+    unexpanded symbols and their depths, the number of output terminals and
+    the depth, node and non-terminal counters. Mapping of a genome that
+    shares the first p codons with the mapped one can be resumed from the
+    state at p. Checkpoints are not changed once the mapping finished, so
+    copies of an individual share them.
+    """
+
+    __slots__ = ("interval", "positions", "states", "output")
+
+    def __init__(self, interval):
+        """
+        :param interval: Number of codons between two checkpoints.
+        """
+
+        self.interval = interval
+        self.positions, self.states = [], []
+        # Output terminals of the whole mapping.
+        self.output = []
 
-    # Initialise the list of unexpanded non-terminals with the start rule.
-    unexpanded_symbols = deque([(bnf_grammar.start_rule, 1)])
-    #code_tree = CodeTree()
+    def latest(self, prefix):
+        """
+        :param prefix: Number of leading codons that did not change.
+        :return: Index of the last checkpoint within the prefix, -1 if none.
+        """
 
-    while (wraps < max_wraps) and unexpanded_symbols:
-        # While there are unexpanded non-terminals, and we are below our
-        # wrapping limit, we can continue to map the genome.
+        return bisect_right(self.positions, prefix) - 1
+
+
+def map_genome(compiled, genome, max_tree_depth, max_wraps,
+               checkpoints=None, resume=None):
+    """
+    Mapping kernel over the integer-coded grammar (see
+    representation.grammar.CompiledGrammar). Expands the leftmost unexpanded
+    symbol first, the same as map_ind_from_genome always did, but keeps
+    only symbol ids and depths on two flat stacks.
+
+    :param compiled: The compiled grammar, Grammar.compiled.
+    :param genome: A genome to be mapped.
+    :param max_tree_depth: The maximum depth of the derivation (0 = none).
+    :param max_wraps: The maximum number of wraps of the genome.
+    :param checkpoints: MappingCheckpoints to record the mapping into, None
+    for no checkpoints.
+    :param resume: Checkpoints of a parent and the number of leading codons
+    the genome shares with the parent's genome, (checkpoints, prefix).
+    Mapping starts from the last checkpoint within the prefix (and before
+    the end of the genome), the earlier checkpoints are taken over.
+    :return: Phenotype (None if invalid), the number of nodes, a boolean
+             flag for whether or not the individual is invalid, the maximum
+             depth and the number of used codons.
+    """
+
+    productions, rule_offsets = compiled.productions, \
+        compiled.rule_offsets_list
+    no_choices, nt_counts = compiled.no_choices_list, compiled.nt_count_list
+    symbols, n_non_terminals = compiled.symbols, compiled.n_non_terminals
+
+    n_input = len(genome)
+
+    # Depth, max_depth, and nodes start from 1 to account for starting root
+    # Initialise number of wraps at -1 (since the first pass is not a wrap).
+    used_input, max_depth, nodes, wraps = 0, 1, 1, -1
+
+    # Unexpanded symbols as two stacks (top = leftmost symbol), with the
+    # number of non-terminals among them kept up to date for the wrap check.
+    stack, depths, unexpanded_nts = [compiled.start], [1], 1
+    output = []
+
+    if resume is not None and resume[0] is not None:
+        # Resume from a state of the parent's mapping, its first used_input
+        # codons are the same as ours.
+        parent, prefix = resume
+        index = parent.latest(min(prefix, n_input - 1))
+        if index >= 0:
+            used_input = parent.positions[index]
+            stack, depths, no_output, max_depth, nodes, unexpanded_nts = \
+                parent.states[index]
+            stack, depths = list(stack), list(depths)
+            output = parent.output[:no_output]
+            if checkpoints is not None:
+                checkpoints.positions = parent.positions[:index + 1]
+                checkpoints.states = parent.states[:index + 1]
+
+    # Codon position of the next checkpoint, -1 = none.
+    next_checkpoint = -1
+    if checkpoints is not None:
+        interval = checkpoints.interval
+        next_checkpoint = (used_input // interval + 1) * interval
+        if next_checkpoint >= n_input:
+            next_checkpoint = -1
+
+    while (wraps < max_wraps) and stack:
+        # While there are unexpanded symbols, and we are below our wrapping
+        # limit, we can continue to map the genome.
+
+        if used_input == next_checkpoint:
+            # Record the state, the loop resumes from here.
+            checkpoints.positions.append(used_input)
+            checkpoints.states.append((tuple(stack), tuple(depths),
+                                       len(output), max_depth, nodes,
+                                       unexpanded_nts))
+            next_checkpoint += interval
+            if next_checkpoint >= n_input:
+                next_checkpoint = -1
 
         if max_tree_depth and (max_depth > max_tree_depth):
             # We have breached our maximum tree depth limit.
             break
 
-        if used_input % n_input == 0 and \
-                used_input > 0 and \
-                any([i[0]["type"] == "NT" for i in unexpanded_symbols]):
+        if used_input % n_input == 0 and used_input > 0 and unexpanded_nts:
             # If we have reached the end of the genome and unexpanded
             # non-terminals remain, then we need to wrap back to the start
-            # of the genome again. Can break the while loop.
+            # of the genome again.
             wraps += 1
 
-        # Expand a production from the list of unexpanded non-terminals.
-        current_item = unexpanded_symbols.popleft()
-        current_symbol, current_depth = current_item[0], current_item[1]
+        symbol, current_depth = stack.pop(), depths.pop()
 
         if max_depth < current_depth:
             # Set the new maximum depth.
             max_depth = current_depth
 
-        # Set output if it is a terminal.
-        if current_symbol["type"] != "NT":
-            output.append(current_symbol["symbol"])
+        if symbol >= n_non_terminals:
+            # Set output if it is a terminal.
+            output.append(symbols[symbol])
 
         else:
-            # Current item is a new non-terminal. Find associated production
-            # choices.
-            production_choices = bnf_grammar.rules[current_symbol[
-                "symbol"]]["choices"]
-            no_choices = bnf_grammar.rules[current_symbol["symbol"]][
-                "no_choices"]
-
             # Select a production based on the next available codon in the
             # genome.
-            current_production = genome[used_input % n_input] % no_choices
-            children = (production_choices[current_production]["choice"][i]["symbol"] for i in range(len(production_choices[current_production]["choice"])))
-            #code_tree.build_node(nt_name=bnf_grammar.start_rule["symbol"], raw_code=production_choices[current_production].attr_code, children=children)
-
-            # Use an input
+            production = rule_offsets[symbol] + \
+                genome[used_input % n_input] % no_choices[symbol]
             used_input += 1
 
-            # Initialise children as empty deque list.
-            children = deque()
-            nt_count = 0
+            # Push the children so that the leftmost one is on the top.
+            children = productions[production]
+            stack.extend(reversed(children))
+            depths.extend([current_depth + 1] * len(children))
 
-            for prod in production_choices[current_production]['choice']:
-                # iterate over all elements of chosen production rule.
+            nt_count = nt_counts[production]
+            unexpanded_nts += nt_count - 1
+            nodes += nt_count if nt_count > 0 else 1
 
-                child = [prod, current_depth + 1]
+    if checkpoints is not None:
+        checkpoints.output = output
 
-                # Extendleft reverses the order, thus reverse adding.
-                children.appendleft(child)
-                if child[0]["type"] == "NT":
-                    nt_count += 1
+    if stack:
+        # All non-terminals have not been completely expanded, invalid
+        # solution.
+        return None, nodes, True, max_depth, used_input
 
-            # Add the new children to the list of unexpanded symbols.
-            # Also here is reversed the reversed order from appendleft :)
-            unexpanded_symbols.extendleft(children)
+    return "".join(output), nodes, False, max_depth, used_input
 
-            if nt_count > 0:
-                nodes += nt_count
-            else:
-                nodes += 1
 
-    # Generate phenotype string.
-    output = "".join(output)
+def genome_matrix(genomes):
+    """
+    Pads genomes of different lengths to one 2-D codon array, as taken by
+    map_genomes.
 
-    if len(unexpanded_symbols) > 0:
-        # All non-terminals have not been completely expanded, invalid
-        # solution.
-        return None, genome, None, nodes, True, max_depth, used_input
+    :param genomes: A list of genomes.
+    :return: The codon array (population x max length, padded with zeros)
+             and the array of the lengths of the genomes.
+    """
+
+    lengths = np.fromiter(map(len, genomes), dtype=np.int64,
+                          count=len(genomes))
+    matrix = np.zeros((len(genomes), lengths.max(initial=0)), dtype=np.int64)
+    matrix[np.arange(matrix.shape[1]) < lengths[:, None]] = np.fromiter(
+        chain.from_iterable(genomes), dtype=np.int64, count=lengths.sum())
+
+    return matrix, lengths
+
+
+def map_genomes(compiled, genomes, lengths, max_tree_depth, max_wraps):
+    """
+    Population-level version of map_genome: maps all the genomes in
+    lockstep, every pass pops one symbol from the stack of each individual
+    still being mapped and expands it with numpy operations over all of
+    them. Stacks are rows of 2-D arrays, rows of finished individuals idle
+    until half of the rows finished and the arrays are compacted. Terminals
+    are logged with their positions and joined to the phenotypes at the end.
+
+    :param compiled: The compiled grammar, Grammar.compiled.
+    :param genomes: A 2-D codon array (population x max length, see
+    genome_matrix).
+    :param lengths: Lengths of the genomes (rows of the codon array), must
+    be positive.
+    :param max_tree_depth: The maximum depth of the derivation (0 = none).
+    :param max_wraps: The maximum number of wraps of the genome.
+    :return: Arrays of the phenotypes (None for invalids), the number of
+             nodes, invalid flags, the maximum depths and the number of
+             used codons, one item per genome.
+    """
+
+    genomes = np.asarray(genomes, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if (lengths <= 0).any():
+        s = "algorithm.mapper.map_genomes\n" \
+            "Error: Genomes to be mapped must not be empty."
+        raise ValueError(s)
+
+    n_non_terminals = compiled.n_non_terminals
+    rule_offsets = compiled.rule_offsets.astype(np.int64)
+    no_choices = compiled.no_choices.astype(np.int64)
+    arity, children = compiled.arity, compiled.children
+    nt_increments = compiled.nt_count - 1
+    node_increments = np.maximum(compiled.nt_count, 1)
+    width = children.shape[1]
+    slots = np.arange(width)
+    # Finished rows pop this terminal (at depth 0) until compacted.
+    idle = n_non_terminals
+
+    size = len(lengths)
+    codons, row_length = genomes.reshape(-1), genomes.shape[1]
+    nodes, invalid = np.empty(size, dtype=np.int64), np.empty(size, dtype=bool)
+    max_depths, used_codons = np.empty(size, dtype=np.int64), \
+        np.empty(size, dtype=np.int64)
+    log_rows, log_positions, log_symbols = [], [], []
+
+    # State of the rows being mapped, the same initial values as map_genome.
+    rows = np.arange(size)
+    capacity = 2 * width + 14
+    stack = np.empty((size, capacity), dtype=np.int32)
+    depths = np.empty((size, capacity), dtype=np.int32)
+    stack[:, 0], depths[:, 0] = compiled.start, 1
+    stack_size = np.ones(size, dtype=np.int64)
+    output_size = np.zeros(size, dtype=np.int64)
+    used_input = np.zeros(size, dtype=np.int64)
+    max_depth = np.ones(size, dtype=np.int64)
+    row_nodes = np.ones(size, dtype=np.int64)
+    wraps = np.full(size, -1, dtype=np.int64)
+    unexpanded_nts = np.ones(size, dtype=np.int64)
+    row_lengths = lengths.copy()
+    finished = np.zeros(size, dtype=bool)
+
+    while True:
+        # The loop condition and depth limit of map_genome.
+        done = (stack_size == 0) | (wraps >= max_wraps)
+        if max_tree_depth:
+            done |= max_depth > max_tree_depth
+        new = np.flatnonzero(done & ~finished)
+        if len(new):
+            # Record the results of the rows finished just now.
+            finished_rows = rows[new]
+            nodes[finished_rows] = row_nodes[new]
+            invalid[finished_rows] = stack_size[new] > 0
+            max_depths[finished_rows] = max_depth[new]
+            used_codons[finished_rows] = used_input[new]
+            finished[new] = True
+            stack[new, 0], depths[new, 0] = idle, 0
+
+            if 2 * np.count_nonzero(finished) >= len(rows):
+                # Compact the state to the rows still being mapped.
+                keep = np.flatnonzero(~finished)
+                if not len(keep):
+                    break
+                rows, stack, depths = rows[keep], stack[keep], depths[keep]
+                stack_size, output_size = stack_size[keep], output_size[keep]
+                used_input, max_depth = used_input[keep], max_depth[keep]
+                row_nodes, wraps = row_nodes[keep], wraps[keep]
+                unexpanded_nts = unexpanded_nts[keep]
+                row_lengths, finished = row_lengths[keep], finished[keep]
+        live = ~finished if finished.any() else None
+        if live is not None:
+            stack_size[finished] = 1
+
+        wraps += (used_input % row_lengths == 0) & (used_input > 0) & \
+            (unexpanded_nts > 0)
+
+        base = np.arange(len(rows)) * capacity
+        flat_stack, flat_depths = stack.reshape(-1), depths.reshape(-1)
+        top = stack_size - 1
+        symbol, current_depth = flat_stack[base + top], flat_depths[base + top]
+        stack_size = top
+        np.maximum(max_depth, current_depth, out=max_depth)
+
+        terminal = symbol >= n_non_terminals
+        if live is not None:
+            terminal &= live
+        t = np.flatnonzero(terminal)
+        if len(t):
+            # Log output of the rows with a terminal.
+            log_rows.append(rows[t])
+            log_positions.append(output_size[t])
+            log_symbols.append(symbol[t])
+            output_size[t] += 1
+
+        e = np.flatnonzero(symbol < n_non_terminals)
+        if not len(e):
+            continue
+
+        # Select productions based on the next available codons.
+        nt_symbol, used = symbol[e], used_input[e]
+        codon = codons[rows[e] * row_length + used % row_lengths[e]]
+        production = rule_offsets[nt_symbol] + codon % no_choices[nt_symbol]
+        used_input[e] = used + 1
+
+        # Push the children so that the leftmost one is on the top.
+        if top[e].max() + width > capacity:
+            stack, depths = _grow(stack), _grow(depths)
+            capacity = stack.shape[1]
+            base = np.arange(len(rows)) * capacity
+            flat_stack, flat_depths = stack.reshape(-1), depths.reshape(-1)
+        slot = (base[e] + top[e])[:, None] + slots
+        flat_stack[slot] = children[production]
+        flat_depths[slot] = (current_depth[e] + 1)[:, None]
+        stack_size[e] = top[e] + arity[production]
+
+        unexpanded_nts[e] += nt_increments[production]
+        row_nodes[e] += node_increments[production]
+
+    # Phenotypes of the valid individuals from the logged terminals.
+    phenotypes = np.empty(size, dtype=object)
+    if log_rows:
+        log_rows = np.concatenate(log_rows)
+        offsets = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(log_rows, minlength=size), out=offsets[1:])
+        output = np.empty(len(log_rows), dtype=np.int64)
+        output[offsets[log_rows] + np.concatenate(log_positions)] = \
+            np.concatenate(log_symbols)
+        terminals = np.array(compiled.symbols, dtype=object)[output].tolist()
+        for row in np.flatnonzero(~invalid).tolist():
+            phenotypes[row] = "".join(terminals[offsets[row]:offsets[row + 1]])
+    else:
+        for row in np.flatnonzero(~invalid).tolist():
+            phenotypes[row] = ""
 
-    return output, genome, None, nodes, False, max_depth, used_input
+    return phenotypes, nodes, invalid, max_depths, used_codons
+
+
+def _grow(array):
+    """
+    Doubles the number of columns of a 2-D array, keeping its content.
+    """
+
+    grown = np.empty((len(array), 2 * array.shape[1]), dtype=array.dtype)
+    grown[:, :array.shape[1]] = array
+    return grown
+
+
+def map_population(genomes, agent):
+    """
+    Maps a population of genomes at once (see map_genomes), filtering the
+    phenotypes of python grammars as mapper() does.
+
+    :param genomes: A list of genomes to be mapped.
+    :param agent: The agent whose parameters and grammar are used.
+    :return: Arrays of the phenotypes, the number of nodes, invalid flags,
+             depths and the number of used codons, one item per genome.
+    """
+
+    matrix, lengths = genome_matrix(genomes)
+    phenotypes, nodes, invalid, depths, used_codons = map_genomes(
+        agent.GE_params['BNF_GRAMMAR'].compiled, matrix, lengths,
+        agent.GE_params['MAX_TREE_DEPTH'], agent.GE_params['MAX_WRAPS'])
+
+    if agent.GE_params['BNF_GRAMMAR'].python_mode:
+        # Grammar contains python code
+        for row in np.flatnonzero(~invalid).tolist():
+            phenotypes[row] = python_filter(phenotypes[row])
+
+    return phenotypes, nodes, invalid, depths, used_codons
 
 
 def map_tree_from_genome(genome, agent=None):
@@ -277,40 +582,40 @@ def genome_codetree_map(tree, genome, output, index, depth, max_depth, nodes,
         depth += 1
         #tree.id, tree.depth = nodes, depth
 
-        # Find all production choices and the number of those production
-        # choices that can be made by the current root non-terminal.
-        productions = agent.GE_params['BNF_GRAMMAR'].rules[tree.root]['choices']
-        no_choices = agent.GE_params['BNF_GRAMMAR'].rules[tree.root]['no_choices']
+        # Find the number of production choices that can be made by the
+        # current root non-terminal (compiled grammar, see map_genome).
+        bnf_grammar = agent.GE_params['BNF_GRAMMAR']
+        compiled = bnf_grammar.compiled
+        nt = compiled.non_terminal_ids[tree.root]
 
         # Set the current codon value from the genome.
         codon = genome[index % len(genome)]
 
         # Select the index of the correct production from the list.
-        selection = codon % no_choices
+        selection = codon % compiled.no_choices_list[nt]
+        production = compiled.rule_offsets_list[nt] + selection
 
         # Set the chosen production
-        chosen_prod = productions[selection]
-        children = (chosen_prod["choice"][i]["symbol"] for i in range(len(chosen_prod["choice"])))
+        chosen_prod = bnf_grammar.rules[tree.root]['choices'][selection]
+        children = [compiled.symbols[symbol] for symbol in compiled.productions[production]]
         tree.build_node(nt_name=tree.root, processed_code=chosen_prod["attr_code"], rhs_sequence=children)
         # was tree.build_node(nt_name=tree.root, raw_code=chosen_prod["attr_code"][1:-1], rhs_sequence=children)
 
         # Increment the index
         index += 1
 
-        for symbol, rhs_symbol in zip(chosen_prod['choice'], tree.rhs):
+        for symbol, rhs_symbol in zip(compiled.productions[production], tree.rhs):
             # Add children to the derivation tree by creating a new instance
             # of the representation.tree.Tree class for each child.
-            if symbol["symbol"] == "<postconditions>":
-                pass
-            if symbol["type"] == "T":
+            if symbol >= compiled.n_non_terminals:
                 # Append the child to the parent node. Child is a terminal, do
                 # not recurse.
-                tree.children.append(CodeTree(root=symbol["symbol"], lhs=rhs_symbol, parent=tree, agent=agent))
-                output.append(symbol["symbol"])
+                tree.children.append(CodeTree(root=compiled.symbols[symbol], lhs=rhs_symbol, parent=tree, agent=agent))
+                output.append(compiled.symbols[symbol])
 
-            elif symbol["type"] == "NT":
+            else:
                 # Append the child to the parent node.
-                tree.children.append(CodeTree(root=symbol["symbol"], lhs=rhs_symbol, parent=tree, agent=agent))
+                tree.children.append(CodeTree(root=compiled.symbols[symbol], lhs=rhs_symbol, parent=tree, agent=agent))
 
                 # Recurse by calling the function again to map the next
                 # non-terminal from the genome.
@@ -323,11 +628,7 @@ def genome_codetree_map(tree, genome, output, index, depth, max_depth, nodes,
         # Mapping incomplete, solution is invalid.
         return output, index, nodes, depth, max_depth, True
 
-    # Find all non-terminals in the chosen production choice.
-    NT_kids = [kid for kid in tree.children if kid.root in
-               agent.GE_params['BNF_GRAMMAR'].non_terminals]
-
-    if not NT_kids:
+    if not compiled.nt_count_list[production]:
         # There are no non-terminals in the chosen production choice, the
         # branch terminates here.
         depth += 1
@@ -383,19 +684,18 @@ def genome_tree_map(tree, genome, output, index, depth, max_depth, nodes,
         depth += 1
         tree.id, tree.depth = nodes, depth
 
-        # Find all production choices and the number of those production
-        # choices that can be made by the current root non-terminal.
-        productions = agent.GE_params['BNF_GRAMMAR'].rules[tree.root]['choices']
-        no_choices = agent.GE_params['BNF_GRAMMAR'].rules[tree.root]['no_choices']
+        # Find the number of production choices that can be made by the
+        # current root non-terminal (compiled grammar, see map_genome).
+        bnf_grammar = agent.GE_params['BNF_GRAMMAR']
+        compiled = bnf_grammar.compiled
+        nt = compiled.non_terminal_ids[tree.root]
 
         # Set the current codon value from the genome.
         tree.codon = genome[index % len(genome)]
 
         # Select the index of the correct production from the list.
-        selection = tree.codon % no_choices
-
-        # Set the chosen production
-        chosen_prod = productions[selection]
+        selection = tree.codon % compiled.no_choices_list[nt]
+        production = compiled.rule_offsets_list[nt] + selection
 
         # Increment the index
         index += 1
@@ -405,21 +705,21 @@ def genome_tree_map(tree, genome, output, index, depth, max_depth, nodes,
         # copy attribute code if attribute grammar is used
         if agent.GE_params["ATTRIBUTE_GRAMMAR"]:
             #tree.attr_code.set_attr_code(chosen_prod["attr_code"])
-            tree.code = chosen_prod["attr_code"]
+            tree.code = bnf_grammar.rules[tree.root]['choices'][selection]["attr_code"]
 
-        for symbol in chosen_prod['choice']:
+        for symbol in compiled.productions[production]:
             # Add children to the derivation tree by creating a new instance
             # of the representation.tree.Tree class for each child.
 
-            if symbol["type"] == "T":
+            if symbol >= compiled.n_non_terminals:
                 # Append the child to the parent node. Child is a terminal, do
                 # not recurse.
-                tree.children.append(Tree(symbol["symbol"], tree, agent=agent))
-                output.append(symbol["symbol"])
+                tree.children.append(Tree(compiled.symbols[symbol], tree, agent=agent))
+                output.append(compiled.symbols[symbol])
 
-            elif symbol["type"] == "NT":
+            else:
                 # Append the child to the parent node.
-                tree.children.append(Tree(symbol["symbol"], tree, agent=agent))
+                tree.children.append(Tree(compiled.symbols[symbol], tree, agent=agent))
 
                 # Recurse by calling the function again to map the next
                 # non-terminal from the genome.
@@ -432,11 +732,7 @@ def genome_tree_map(tree, genome, output, index, depth, max_depth, nodes,
         # Mapping incomplete, solution is invalid.
         return output, index, nodes, depth, max_depth, True
 
-    # Find all non-terminals in the chosen production choice.
-    NT_kids = [kid for kid in tree.children if kid.root in
-               agent.GE_params['BNF_GRAMMAR'].non_terminals]
-
-    if not NT_kids:
+    if not compiled.nt_count_list[production]:
         # There are no non-terminals in the chosen production choice, the
         # branch terminates here.
         depth += 1
@@ -454,3 +750,134 @@ def genome_tree_map(tree, genome, output, index, depth, max_depth, nodes,
             invalid = True
 
     return output, index, nodes, depth, max_depth, invalid
+
+
+def map_arena_from_genome(genome, agent, build_tree=True):
+    """
+    Maps a full tree from a given genome, as map_tree_from_genome, but the
+    tree is a representation.arena_tree.ArenaTree.
+
+    :param genome: A genome to be mapped.
+    :param build_tree: Build the tree, otherwise the tree is None.
+    :return: All components necessary for a fully mapped individual.
+    """
+
+    # Map tree from the given genome
+    tree, output, used_codons, nodes, max_depth, invalid = \
+        genome_arena_map(agent.GE_params['BNF_GRAMMAR'].compiled, genome,
+                         agent.GE_params['MAX_TREE_DEPTH'],
+                         agent.GE_params['MAX_WRAPS'], build_tree)
+
+    if invalid:
+        # Return "None" phenotype if invalid
+        return None, genome, tree, nodes, invalid, max_depth, used_codons
+
+    else:
+        return "".join(output), genome, tree, nodes, invalid, max_depth, \
+               used_codons
+
+
+def genome_arena_map(compiled, genome, max_tree_depth, max_wraps,
+                     build_tree=True):
+    """
+    Builds an ArenaTree using production choices from a given genome. The
+    tree, nodes, depth and validity are the same as those of genome_tree_map,
+    but the recursion is unrolled to a stack of open nodes, so the depth of
+    the tree is not limited by the recursion limit.
+
+    :param compiled: The CompiledGrammar of the grammar.
+    :param genome: A full genome.
+    :param max_tree_depth: The maximum depth of a valid tree, 0 for none.
+    :param max_wraps: The maximum number of times the genome is wrapped.
+    :param build_tree: Build the ArenaTree, otherwise only the information
+    on the tree is returned and the tree is None.
+    :return: tree, the ArenaTree,
+             output, the list of all terminals of the tree,
+             index, the number of used codons,
+             nodes, the total number of nodes in the tree,
+             max_depth, the maximum overall depth in the tree,
+             invalid, a boolean flag indicating whether or not the
+             individual is invalid.
+    """
+
+    n_non_terminals = compiled.n_non_terminals
+    symbols, productions = compiled.symbols, compiled.productions
+    rule_offsets, no_choices = compiled.rule_offsets_list, \
+        compiled.no_choices_list
+    nt_count = compiled.nt_count_list
+    n_input = len(genome)
+    limit = n_input * (max_wraps + 1)
+
+    symbol, codon, parent, depth, end = [compiled.start], [NO_NODE], \
+        [NO_NODE], [1], [1]
+    output = []
+    index = nodes = max_depth = 0
+    invalid = False
+
+    # Open nodes: [node, production, next child, depth of genome_tree_map].
+    stack = []
+    expand, expand_depth = 0, 0
+
+    while True:
+        if expand is not None:
+            # The call of genome_tree_map on the node.
+            if invalid or index >= limit:
+                invalid = True
+
+            else:
+                if max_tree_depth and max_depth > max_tree_depth:
+                    invalid = True
+
+                nodes += 1
+                codon[expand] = genome[index % n_input]
+                nt = symbol[expand]
+                production = rule_offsets[nt] + codon[expand] % no_choices[nt]
+                index += 1
+                stack.append([expand, production, 0, expand_depth + 1])
+
+            expand = None
+
+        if not stack:
+            break
+
+        frame = stack[-1]
+        node, production, child, node_depth = frame
+        children = productions[production]
+
+        if child < len(children):
+            # Add the next child of the node.
+            frame[2] = child + 1
+            child_symbol = children[child]
+            symbol.append(child_symbol)
+            codon.append(NO_NODE)
+            parent.append(node)
+            depth.append(depth[node] + 1)
+            end.append(len(symbol))
+
+            if child_symbol >= n_non_terminals:
+                output.append(symbols[child_symbol])
+            else:
+                expand, expand_depth = len(symbol) - 1, node_depth
+            continue
+
+        # All children are done, return from the call on the node.
+        stack.pop()
+        end[node] = len(symbol)
+
+        if not nt_count[production]:
+            node_depth += 1
+            nodes += 1
+
+        if not invalid:
+            if node_depth > max_depth:
+                max_depth = node_depth
+
+            if max_tree_depth and max_depth > max_tree_depth:
+                invalid = True
+
+    if build_tree:
+        tree = ArenaTree(compiled, symbol, codon, parent, depth, end)
+    else:
+        tree = None
+
+    return tree, output, index, nodes, max_depth, invalid
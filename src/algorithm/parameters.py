@@ -163,8 +163,9 @@ def set_params(command_line_args, create_files=True, agent=None):
                         "fitness functions."
                     raise Exception(s)
 
-        # Parse grammar file and set grammar class.
-        agent.GE_params['BNF_GRAMMAR'] = grammar.Grammar(
+        # Parse grammar file and set grammar class. The grammar is shared
+        # between all agents which use the same grammar and parameters.
+        agent.GE_params['BNF_GRAMMAR'] = grammar.get_grammar(
                 path.join("..", "grammars", agent.GE_params['GRAMMAR_FILE']), agent=agent)
 
         # If OPTIMIZE_CONSTANTS, check that the grammar is suitable
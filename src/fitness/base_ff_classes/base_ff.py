@@ -17,6 +17,10 @@ class base_ff:
     # Default fitness objective is to minimise fitness.
     maximise = False
 
+    # Stateless fitness functions keep no per-run or per-agent data and a
+    # single instance can be shared by all agents in a swarm.
+    stateless = False
+
     def __init__(self, agent=None):
         self.agent=agent
 
@@ -4,6 +4,7 @@ import random
 class swarm_fitness_random(base_ff):
 
     maximise = True
+    stateless = True
 
     def __init__(self):
         """
@@ -2,6 +2,8 @@ from random import choice, randint, random, sample
 
 #from algorithm.parameters import params
 from representation import individual
+from representation.arena_tree import ArenaTree
+from representation.individual import map_individuals
 from representation.latent_tree import latent_tree_crossover, \
     latent_tree_repair
 from utilities.representation.check_methods import check_ind
@@ -22,6 +24,23 @@ def crossover(parents, agent=None):
     # Initialise an empty population.
     cross_pop = []
 
+    if agent.GE_params['BATCH_MAPPING'] and \
+            agent.GE_params['GENOME_OPERATIONS']:
+        # Cross over enough pairs of parents for the rest of the population
+        # and map all the children at once, pairs that fail the checks are
+        # replaced in the next round.
+        while len(cross_pop) < agent.GE_params['GENERATION_SIZE']:
+            no_pairs = -(-(agent.GE_params['GENERATION_SIZE'] -
+                           len(cross_pop)) // 2)
+            pairs = [cross_inds(*sample(parents, 2), agent=agent) for _ in
+                     range(no_pairs)]
+            map_individuals([ind for inds in pairs for ind in inds])
+
+            for inds in pairs:
+                if not any(check_ind(ind, "crossover", agent=agent) for ind
+                           in inds):
+                    cross_pop.extend(inds)
+
     while len(cross_pop) < agent.GE_params['GENERATION_SIZE']:
 
         # Randomly choose two parents from the parent population.
@@ -51,20 +70,8 @@ def crossover_inds(parent_0, parent_1, agent=None):
     :return: Two crossed-over individuals.
     """
 
-    # Create copies of the original parents. This is necessary as the
-    # original parents remain in the parent population and changes will
-    # affect the originals unless they are cloned.
-    ind_0 = parent_0.deep_copy()
-    ind_1 = parent_1.deep_copy()
-
-    # Crossover cannot be performed on invalid individuals.
-    if not agent.GE_params['INVALID_SELECTION'] and (ind_0.invalid or ind_1.invalid):
-        s = "operators.crossover.crossover\nError: invalid individuals " \
-            "selected for crossover."
-        raise Exception(s)
-
-    # Perform crossover on ind_0 and ind_1.
-    inds = agent.GE_params['CROSSOVER'](ind_0, ind_1, agent=agent)
+    # Perform crossover on copies of the parents.
+    inds = cross_inds(parent_0, parent_1, agent=agent)
 
     # Check each individual is ok (i.e. does not violate specified limits).
     checks = [check_ind(ind, "crossover", agent=agent) for ind in inds]
@@ -78,6 +85,35 @@ def crossover_inds(parent_0, parent_1, agent=None):
         return inds
 
 
+def cross_inds(parent_0, parent_1, agent=None):
+    """
+    Perform crossover on copies of two selected individuals, without checking
+    the children.
+
+    :param parent_0: Parent 0 selected for crossover.
+    :param parent_1: Parent 1 selected for crossover.
+    :return: Two crossed-over individuals (not mapped yet with
+    BATCH_MAPPING, see representation.individual.map_individuals).
+    """
+
+    # Create copies of the original parents. This is necessary as the
+    # original parents remain in the parent population and changes will
+    # affect the originals unless they are cloned. Linear crossovers make
+    # the children from the genomes, their trees are not copied.
+    copy_tree = agent.GE_params['CROSSOVER'].representation != "linear"
+    ind_0 = parent_0.deep_copy(copy_tree)
+    ind_1 = parent_1.deep_copy(copy_tree)
+
+    # Crossover cannot be performed on invalid individuals.
+    if not agent.GE_params['INVALID_SELECTION'] and (ind_0.invalid or ind_1.invalid):
+        s = "operators.crossover.crossover\nError: invalid individuals " \
+            "selected for crossover."
+        raise Exception(s)
+
+    # Perform crossover on ind_0 and ind_1.
+    return agent.GE_params['CROSSOVER'](ind_0, ind_1, agent=agent)
+
+
 def variable_onepoint(p_0, p_1, agent=None):
     """
     Given two individuals, create two children using one-point crossover and
@@ -107,10 +143,14 @@ def variable_onepoint(p_0, p_1, agent=None):
         c_1 = genome_1[:pt_1] + genome_0[pt_0:]
     else:
         c_0, c_1 = genome_0[:], genome_1[:]
+        pt_0, pt_1 = len(genome_0), len(genome_1)
 
-    # Put the new chromosomes into new individuals.
-    ind_0 = individual.Individual(c_0, None, agent=agent)
-    ind_1 = individual.Individual(c_1, None, agent=agent)
+    # Put the new chromosomes into new individuals, mapping resumes from the
+    # parents' checkpoints before the crossover points.
+    ind_0 = individual.Individual(c_0, None, agent=agent, lazy=True,
+                                  resume=(p_0.checkpoints, pt_0))
+    ind_1 = individual.Individual(c_1, None, agent=agent, lazy=True,
+                                  resume=(p_1.checkpoints, pt_1))
 
     return [ind_0, ind_1]
 
@@ -318,6 +358,27 @@ def subtree(p_0, p_1, agent=None):
 
         return tree0, tree1
 
+    def arena_crossover(tree0, tree1, shared_nodes):
+        """
+        do_crossover for ArenaTrees. The chosen subtrees are swapped in new
+        trees, the trees of the parents are not changed.
+
+        :param tree0: The derivation tree of individual 0.
+        :param tree1: The derivation tree of individual 1.
+        :param shared_nodes: The sorted list of all non-terminal nodes that are
+        in both derivation trees.
+        :return: The new derivation trees after subtree crossover has been
+        performed.
+        """
+
+        # Randomly choose a non-terminal and a node of it in both trees.
+        crossover_choice = choice(shared_nodes)
+        t0 = choice(tree0.target_nodes([crossover_choice]))
+        t1 = choice(tree1.target_nodes([crossover_choice]))
+
+        return tree0.replace(t0, tree1.subtree(t1)), \
+            tree1.replace(t1, tree0.subtree(t0))
+
     def intersect(l0, l1, agent=None):
         """
         Returns the intersection of two sets of labels of nodes of
@@ -364,14 +425,27 @@ def subtree(p_0, p_1, agent=None):
             # Save tail of each genome.
             tail_1 = p_1.genome[p_1.used_codons:]
 
+        arena = isinstance(p_0.code_tree, ArenaTree)
+
         # Get the set of labels of non terminals for each tree.
-        labels1 = p_0.code_tree.get_node_labels(set())
-        labels2 = p_1.code_tree.get_node_labels(set())
+        if arena:
+            labels1 = p_0.code_tree.node_labels()
+            labels2 = p_1.code_tree.node_labels()
+
+        else:
+            labels1 = p_0.code_tree.get_node_labels(set())
+            labels2 = p_1.code_tree.get_node_labels(set())
 
         # Find overlapping non-terminals across both trees.
-        shared_nodes = intersect(labels1, labels2)
+        shared_nodes = intersect(labels1, labels2, agent=agent)
+
+        if len(shared_nodes) != 0 and arena:
+            # There are overlapping NTs, cross over parts of trees.
+            ret_tree0, ret_tree1 = arena_crossover(p_0.code_tree,
+                                                   p_1.code_tree,
+                                                   shared_nodes)
 
-        if len(shared_nodes) != 0:
+        elif len(shared_nodes) != 0:
             # There are overlapping NTs, cross over parts of trees.
             ret_tree0, ret_tree1 = do_crossover(p_0.code_tree, p_1.code_tree,
                                                 shared_nodes)
@@ -381,8 +455,8 @@ def subtree(p_0, p_1, agent=None):
             ret_tree0, ret_tree1 = p_1.code_tree, p_0.code_tree
 
         # Initialise new individuals using the new trees.
-        ind0 = individual.Individual(None, ret_tree0)
-        ind1 = individual.Individual(None, ret_tree1)
+        ind0 = individual.Individual(None, ret_tree0, agent=agent)
+        ind1 = individual.Individual(None, ret_tree1, agent=agent)
 
         # Preserve tails.
         ind0.genome = ind0.genome + tail_0
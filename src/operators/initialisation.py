@@ -56,7 +56,9 @@ def uniform_genome(size, agent):
     :return: A full population composed of randomly generated individuals.
     """
 
-    return [individual.Individual(genome=sample_genome(agent), ind_tree=None, agent=agent) for _ in range(size)]
+    return individual.map_individuals(
+        [individual.Individual(genome=sample_genome(agent), ind_tree=None, agent=agent, lazy=True)
+         for _ in range(size)])
 
 
 def uniform_tree(size, agent=None):
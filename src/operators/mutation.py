@@ -2,7 +2,10 @@ from random import choice, randint, random
 
 #from algorithm.parameters import params
 from representation import individual
+from representation.arena_tree import ArenaTree
+from representation.individual import map_individuals
 from representation.derivation import generate_tree
+from representation.tree import Tree
 from representation.latent_tree import latent_tree_mutate, latent_tree_repair
 from utilities.representation.check_methods import check_ind
 
@@ -16,6 +19,25 @@ def mutation(pop, agent=None):
     :return: A fully mutated population.
     """
 
+    if agent.GE_params['BATCH_MAPPING'] and \
+            agent.GE_params['GENOME_OPERATIONS']:
+        # Mutate the whole population and map the mutated individuals at
+        # once, those violating the limits are mutated again until they
+        # pass all tests.
+        new_pop = map_individuals([agent.GE_params['MUTATION'](
+            ind, agent=agent) for ind in pop])
+        redo = [i for i, new_ind in enumerate(new_pop) if
+                check_ind(new_ind, "mutation", agent=agent)]
+
+        while redo:
+            for i in redo:
+                new_pop[i] = agent.GE_params['MUTATION'](pop[i], agent=agent)
+            map_individuals([new_pop[i] for i in redo])
+            redo = [i for i in redo if
+                    check_ind(new_pop[i], "mutation", agent=agent)]
+
+        return new_pop
+
     # Initialise empty pop for mutated individuals.
     new_pop = []
 
@@ -24,7 +46,7 @@ def mutation(pop, agent=None):
 
         # If individual has no genome, default to subtree mutation.
         if not ind.genome and agent.GE_params['NO_MUTATION_INVALIDS']:
-            new_ind = subtree(ind)
+            new_ind = subtree(ind, agent=agent)
 
         else:
             # Perform mutation.
@@ -38,14 +60,14 @@ def mutation(pop, agent=None):
 
             # If individual has no genome, default to subtree mutation.
             if not ind.genome and agent.GE_params['NO_MUTATION_INVALIDS']:
-                new_ind = subtree(ind)
+                new_ind = subtree(ind, agent=agent)
 
             else:
                 # Perform mutation.
-                new_ind = agent.GE_params['MUTATION'](ind)
+                new_ind = agent.GE_params['MUTATION'](ind, agent=agent)
 
             # Check ind does not violate specified limits.
-            check = check_ind(new_ind, "mutation")
+            check = check_ind(new_ind, "mutation", agent=agent)
 
         # Append mutated individual to population.
         new_pop.append(new_ind)
@@ -80,12 +102,19 @@ def int_flip_per_codon(ind, agent=None):
 
     # Mutation probability works per-codon over the portion of the
     # genome as defined by the within_used flag.
+    first = len(ind.genome)  # the first mutated codon
     for i in range(eff_length):
         if random() < p_mut:
             ind.genome[i] = randint(0, agent.GE_params['CODON_SIZE'])
+            first = min(first, i)
 
-    # Re-build a new individual with the newly mutated genetic information.
-    new_ind = individual.Individual(ind.genome, None, agent=agent)
+    # Re-build a new individual with the newly mutated genetic information,
+    # mapping resumes from before the first mutated codon.
+    new_ind = individual.Individual(ind.genome, None, agent=agent, lazy=True,
+                                    resume=(ind.checkpoints, first))
+
+    # The genome was changed in place, checkpoints of ind do not apply.
+    ind.checkpoints = None
 
     return new_ind
 
@@ -118,7 +147,7 @@ def int_flip_per_ind(ind):
     return new_ind
 
 
-def subtree(ind):
+def subtree(ind, agent=None):
     """
     Mutate the individual by replacing a randomly selected subtree with a
     new randomly generated subtree. Guaranteed one event per individual, unless
@@ -155,10 +184,38 @@ def subtree(ind):
             max_depth = None
 
         # Mutate a new subtree.
-        generate_tree(new_tree, [], [], "random", 0, 0, 0, max_depth)
+        generate_tree(new_tree, [], [], "random", 0, 0, 0, max_depth, agent)
 
         return ind_tree
 
+    def arena_subtree_mutate(ind_tree):
+        """
+        subtree_mutate for an ArenaTree. The new subtree is generated as a
+        Tree and replaces the subtree of the chosen node in a new tree, the
+        mutated individual's tree is not changed.
+
+        :param ind_tree: The full tree of an individual.
+        :return: The full mutated tree.
+        """
+
+        # Pick a node from the nodes we can mutate.
+        node = ind_tree.node(choice(ind_tree.target_nodes(agent.GE_params[
+            'BNF_GRAMMAR'].non_terminals)))
+
+        # Set the depth limits for the new subtree.
+        if agent.GE_params['MAX_TREE_DEPTH']:
+            max_depth = agent.GE_params['MAX_TREE_DEPTH'] - node.depth
+
+        else:
+            max_depth = None
+
+        # Generate a new subtree and graft it in place of the node.
+        new_tree = Tree(node.root, None, agent=agent)
+        generate_tree(new_tree, [], [], "random", 0, 0, 0, max_depth, agent)
+
+        return ind_tree.replace(node.index, ArenaTree.from_tree(
+            new_tree, ind_tree.compiled))
+
     if ind.invalid:
         # The individual is invalid.
         tail = []
@@ -168,11 +225,16 @@ def subtree(ind):
         tail = ind.genome[ind.used_codons:]
 
     # Allows for multiple mutation events should that be desired.
+    ind_tree = ind.code_tree
     for i in range(agent.GE_params['MUTATION_EVENTS']):
-        ind.code_tree = subtree_mutate(ind.code_tree)
+        if isinstance(ind_tree, ArenaTree):
+            ind_tree = arena_subtree_mutate(ind_tree)
+
+        else:
+            ind_tree = subtree_mutate(ind_tree)
 
     # Re-build a new individual with the newly mutated genetic information.
-    ind = individual.Individual(None, ind.code_tree)
+    ind = individual.Individual(None, ind_tree, agent=agent)
 
     # Add in the previous tail.
     ind.genome = ind.genome + tail
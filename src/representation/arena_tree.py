@@ -0,0 +1,363 @@
+import numpy as np
+
+# Index of a missing node (parent of the root, first child of a leaf, next
+# sibling of the last child) and codon of a node that was not expanded.
+NO_NODE = -1
+
+
+class ArenaTree(object):
+    """
+    A derivation tree stored as parallel arrays, one entry per node, instead
+    of one representation.tree.Tree object per node.
+
+    Nodes are kept in preorder, so the subtree of node i is the slice
+    [i, end[i]) of the arrays. For every node the arrays hold the id of its
+    symbol in the compiled grammar (representation.grammar.CompiledGrammar),
+    its codon (NO_NODE for terminals and non-terminals that were not
+    expanded), its parent, first child and next sibling (NO_NODE if none)
+    and its depth (the root is at depth 1).
+
+    Trees are not changed in place: subtree() and replace() return new
+    trees, copying the tree is copying the arrays. Nodes are accessed through
+    NodeView objects (see node()).
+    """
+    __slots__ = ("compiled", "symbol", "codon", "parent", "first_child",
+                 "next_sibling", "depth", "end")
+
+    def __init__(self, compiled, symbol, codon, parent, depth, end):
+        """
+        Initialise an instance of the arena tree class from the arrays of
+        the nodes in preorder, the first child and next sibling of the nodes
+        are derived from them.
+
+        :param compiled: The CompiledGrammar the symbol ids refer to.
+        :param symbol: The symbol id of every node.
+        :param codon: The codon of every node.
+        :param parent: The index of the parent of every node.
+        :param depth: The depth of every node.
+        :param end: The index after the last node of the subtree of every
+        node.
+        """
+
+        self.compiled = compiled
+        self.symbol = np.asarray(symbol, dtype=np.int32)
+        self.codon = np.asarray(codon, dtype=np.int64)
+        self.parent = np.asarray(parent, dtype=np.int32)
+        self.depth = np.asarray(depth, dtype=np.int32)
+        self.end = np.asarray(end, dtype=np.int32)
+        self._link()
+
+    def _link(self):
+        """
+        Sets first_child and next_sibling from parent and end: in preorder
+        the first child of a node is the next node and the next sibling of
+        a node follows its subtree.
+        """
+
+        n = len(self.symbol)
+        following = np.arange(1, n + 1, dtype=np.int32)
+        has_child = self.end > following
+        self.first_child = np.where(has_child, following, NO_NODE).astype(
+            np.int32)
+        sibling = np.minimum(self.end, n - 1)
+        has_sibling = (self.end < n) & (self.parent[sibling] == self.parent)
+        self.next_sibling = np.where(has_sibling, self.end, NO_NODE).astype(
+            np.int32)
+
+    @classmethod
+    def from_tree(cls, tree, compiled):
+        """
+        Converts a representation.tree.Tree to an arena tree. The tree is
+        traversed with an explicit stack, so it can be of any depth.
+
+        :param tree: The root of the tree.
+        :param compiled: The CompiledGrammar of the tree's grammar.
+        :return: The arena tree.
+        """
+
+        nt_ids, ids = compiled.non_terminal_ids, compiled.symbol_ids
+        symbol, codon, parent, depth, end = [], [], [], [], []
+        stack = [(tree, NO_NODE, 1)]
+        closing = []  # (node index, stack size when its subtree is done)
+
+        while stack:
+            node, node_parent, node_depth = stack.pop()
+            index = len(symbol)
+            symbol.append(nt_ids[node.root] if node.root in nt_ids else
+                          ids[(node.root, "T")])
+            codon.append(NO_NODE if node.codon is None else node.codon)
+            parent.append(node_parent)
+            depth.append(node_depth)
+            end.append(index + 1)
+
+            while closing and closing[-1][1] > len(stack):
+                end[closing.pop()[0]] = index
+            if node.children:
+                closing.append((index, len(stack)))
+                stack.extend((child, index, node_depth + 1) for child in
+                             reversed(node.children))
+
+        for index, _ in closing:
+            end[index] = len(symbol)
+
+        return cls(compiled, symbol, codon, parent, depth, end)
+
+    def to_tree(self, agent):
+        """
+        Converts the arena tree to a representation.tree.Tree.
+
+        :param agent: The agent of the Tree nodes.
+        :return: The root of the Tree.
+        """
+
+        from representation.tree import Tree
+
+        symbols = self.compiled.symbols
+        nodes = []
+        for symbol, codon, parent, depth in zip(
+                self.symbol.tolist(), self.codon.tolist(),
+                self.parent.tolist(), self.depth.tolist()):
+            node = Tree(symbols[symbol],
+                        nodes[parent] if parent != NO_NODE else None,
+                        agent=agent)
+            node.depth = depth
+            if codon != NO_NODE:
+                node.codon = codon
+            if parent != NO_NODE:
+                nodes[parent].children.append(node)
+            nodes.append(node)
+
+        return nodes[0]
+
+    def __len__(self):
+        return len(self.symbol)
+
+    @property
+    def root(self):
+        """
+        The view of the root node.
+        """
+        return NodeView(self, 0)
+
+    def node(self, index):
+        """
+        Returns the view of the node at the given index.
+        """
+        return NodeView(self, index)
+
+    def __copy__(self, parent=None):
+        """
+        Creates a new unique copy of self.
+
+        :param parent: Unused, for the signature of CodeTree.__copy__.
+        :return: A new unique copy of self.
+        """
+
+        tree_copy = ArenaTree.__new__(ArenaTree)
+        tree_copy.compiled = self.compiled
+        for name in ArenaTree.__slots__[1:]:
+            setattr(tree_copy, name, getattr(self, name).copy())
+
+        return tree_copy
+
+    def __eq__(self, other):
+        """
+        Two trees are equal if they have the same nodes (symbols and codons)
+        in the same shape.
+        """
+
+        if not isinstance(other, ArenaTree):
+            return NotImplemented
+
+        return np.array_equal(self.symbol, other.symbol) and \
+            np.array_equal(self.codon, other.codon) and \
+            np.array_equal(self.parent, other.parent)
+
+    __hash__ = None
+
+    def __str__(self):
+        """
+        Builds a string of the tree, the same as str() of the Tree.
+
+        :return: A string of the tree.
+        """
+
+        symbols = self.compiled.symbols
+        result = []
+        closing = []  # end of the subtrees of the open nodes
+
+        for index, (symbol, end) in enumerate(zip(self.symbol.tolist(),
+                                                  self.end.tolist())):
+            while closing and closing[-1] == index:
+                closing.pop()
+                result.append(")")
+            if index:
+                result.append(" ")
+            if end > index + 1 or not index:
+                result.append("(" + str(symbols[symbol]))
+                closing.append(end)
+            else:
+                result.append(str(symbols[symbol]))
+
+        result.append(")" * len(closing))
+
+        return "".join(result)
+
+    def subtree(self, index):
+        """
+        Returns a copy of the subtree of a node as a new tree.
+
+        :param index: The index of the root of the subtree.
+        :return: The subtree.
+        """
+
+        end = self.end[index]
+        parent = self.parent[index:end] - index
+        parent[0] = NO_NODE
+
+        return ArenaTree(self.compiled, self.symbol[index:end].copy(),
+                         self.codon[index:end].copy(), parent,
+                         self.depth[index:end] - self.depth[index] + 1,
+                         self.end[index:end] - index)
+
+    def replace(self, index, other):
+        """
+        Returns a new tree with the subtree of a node replaced by another
+        tree (e.g. a subtree of another tree, see subtree()).
+
+        :param index: The index of the root of the subtree to replace.
+        :param other: The tree to put in its place.
+        :return: The new tree.
+        """
+
+        end = self.end[index]
+        shift = len(other) - (end - index)
+
+        def kept(array):
+            # Indexes past the replaced subtree move by the size difference.
+            return np.where(array >= end, array + shift, array)
+
+        parent = other.parent + index
+        parent[0] = self.parent[index]
+
+        return ArenaTree(
+            self.compiled,
+            np.concatenate((self.symbol[:index], other.symbol,
+                            self.symbol[end:])),
+            np.concatenate((self.codon[:index], other.codon,
+                            self.codon[end:])),
+            np.concatenate((self.parent[:index], parent,
+                            kept(self.parent[end:]))),
+            np.concatenate((self.depth[:index],
+                            other.depth + self.depth[index] - 1,
+                            self.depth[end:])),
+            np.concatenate((kept(self.end[:index]), other.end + index,
+                            self.end[end:] + shift)))
+
+    def target_nodes(self, targets):
+        """
+        Returns the indexes of all nodes of the given non-terminals, the
+        same nodes in the same order as Tree.get_target_nodes.
+
+        :param targets: The names of the non-terminals.
+        :return: The array of the indexes of the matching nodes.
+        """
+
+        ids = self.compiled.non_terminal_ids
+        targets = [ids[target] for target in targets if target in ids]
+
+        return np.flatnonzero(np.isin(self.symbol, targets))
+
+    def node_labels(self):
+        """
+        Returns the set of the symbols of all nodes, as
+        Tree.get_node_labels.
+        """
+
+        symbols = self.compiled.symbols
+
+        return {symbols[symbol] for symbol in np.unique(self.symbol).tolist()}
+
+    def tree_info(self):
+        """
+        Returns all information on the tree required to generate an
+        individual, as Tree.get_tree_info.
+
+        :return: genome, output, invalid, max_depth, nodes.
+        """
+
+        n_non_terminals = self.compiled.n_non_terminals
+        symbols = self.compiled.symbols
+
+        leaf = self.first_child == NO_NODE
+        # Nodes visited by get_tree_info: the expanded ones and the root.
+        visited = ~leaf
+        visited[0] = True
+        non_terminal = self.symbol < n_non_terminals
+        has_nt_child = np.zeros(len(self), dtype=bool)
+        has_nt_child[self.parent[1:][non_terminal[1:]]] = True
+        ends_branch = visited & ~has_nt_child
+
+        genome = self.codon[self.codon != NO_NODE].tolist()
+        leaves = np.flatnonzero(leaf)
+        if leaves.size and leaves[0] == 0:
+            leaves = leaves[1:]
+        output = [symbols[symbol] for symbol in self.symbol[leaves].tolist()]
+        invalid = bool((leaf & non_terminal).any())
+        max_depth = int(max(self.depth[visited].max(),
+                            self.depth[ends_branch].max(initial=0) + 1))
+        nodes = int(visited.sum() + ends_branch.sum())
+
+        return genome, output, invalid, max_depth, nodes
+
+
+class NodeView(object):
+    """
+    A node of an ArenaTree, with the attributes of a representation.tree.Tree
+    node read from the tree's arrays.
+    """
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def root(self):
+        """
+        The symbol of the node.
+        """
+        return self.tree.compiled.symbols[self.tree.symbol[self.index]]
+
+    @property
+    def codon(self):
+        codon = int(self.tree.codon[self.index])
+        return None if codon == NO_NODE else codon
+
+    @property
+    def depth(self):
+        return int(self.tree.depth[self.index])
+
+    @property
+    def parent(self):
+        parent = int(self.tree.parent[self.index])
+        return None if parent == NO_NODE else NodeView(self.tree, parent)
+
+    @property
+    def children(self):
+        children = []
+        child = int(self.tree.first_child[self.index])
+        while child != NO_NODE:
+            children.append(NodeView(self.tree, child))
+            child = int(self.tree.next_sibling[child])
+        return children
+
+    def __eq__(self, other):
+        return isinstance(other, NodeView) and self.tree is other.tree and \
+            self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __str__(self):
+        return str(self.tree.subtree(self.index))
@@ -1,7 +1,11 @@
+from hashlib import sha1
 from math import floor
+from os import path
 from re import DOTALL, MULTILINE, finditer, match
 from sys import maxsize
 
+import numpy as np
+
 #from algorithm.parameters import params
 
 
@@ -73,6 +77,9 @@ class Grammar(object):
         # Enables faster tree operations.
         self.set_grammar_properties()
 
+        # Integer-coded form of the production rules for the mapping kernels.
+        self.compiled = CompiledGrammar(self)
+
         # Calculate the total number of derivation tree permutations and
         # combinations that can be created by a grammar at a range of depths.
         self.check_permutations()
@@ -728,3 +735,130 @@ class Grammar(object):
             if self.agent.GE_params["ATTRIBUTE_GRAMMAR"]:
                 self.non_terminals[non_terminal]['attributes'] = {}
 
+
+
+class CompiledGrammar(object):
+    """
+    Integer-coded form of the production rules of a Grammar, used by the
+    mapping kernels instead of the nested dicts of Grammar.rules.
+
+    Symbols are numbered non-terminals first (0 .. n_non_terminals - 1, in
+    the order of the rules), then terminals. Productions are numbered rule
+    by rule in the order of their choices, so production
+    rule_offsets[nt] + i is Grammar.rules[symbols[nt]]['choices'][i].
+    """
+
+    def __init__(self, grammar):
+        """
+        :param grammar: A parsed instance of the Grammar class.
+        """
+
+        non_terminals = list(grammar.rules)
+        self.n_non_terminals = len(non_terminals)
+        self.symbols = list(non_terminals)
+        self.symbol_ids = {(nt, "NT"): i for i, nt in enumerate(non_terminals)}
+        self.non_terminal_ids = {nt: i for i, nt in enumerate(non_terminals)}
+
+        rule_offsets, productions = [0], []
+        for nt in non_terminals:
+            for choice in grammar.rules[nt]['choices']:
+                production = []
+                for symbol in choice['choice']:
+                    key = (symbol['symbol'], symbol['type'])
+                    if key not in self.symbol_ids:
+                        # New terminal.
+                        self.symbol_ids[key] = len(self.symbols)
+                        self.symbols.append(symbol['symbol'])
+                    production.append(self.symbol_ids[key])
+                productions.append(tuple(production))
+            rule_offsets.append(len(productions))
+
+        self.start = self.symbol_ids[(grammar.start_rule['symbol'], "NT")]
+
+        # Tables of the rules (per non-terminal) and productions.
+        self.rule_offsets = np.array(rule_offsets, dtype=np.int32)
+        self.no_choices = np.diff(self.rule_offsets)
+        self.arity = np.array([len(p) for p in productions], dtype=np.int32)
+        self.production_offsets = np.concatenate(
+            ([0], np.cumsum(self.arity))).astype(np.int32)
+        self.production_symbols = np.array(
+            [symbol for p in productions for symbol in p], dtype=np.int32)
+        self.nt_count = np.array(
+            [sum(symbol < self.n_non_terminals for symbol in p) for p in
+             productions], dtype=np.int32)
+        # Children of the productions right to left (the order they are
+        # pushed to a stack in), padded with zeros to the maximum arity.
+        self.children = np.zeros(
+            (len(productions), max(self.arity.max(initial=0), 1)),
+            dtype=np.int32)
+        for i, p in enumerate(productions):
+            self.children[i, :len(p)] = p[::-1]
+
+        # The same tables as tuples, scalar kernels index them faster than
+        # numpy arrays.
+        self.productions = tuple(productions)
+        self.rule_offsets_list = tuple(rule_offsets)
+        self.no_choices_list = tuple(self.no_choices.tolist())
+        self.nt_count_list = tuple(self.nt_count.tolist())
+
+
+# Process-wide registry of fully analysed grammars. In swarm runs every agent
+# would otherwise parse and analyse the very same BNF file on its own. Grammars
+# stored here are shared between all agents and must be treated as read-only.
+grammar_registry = {}
+
+# Parameters which influence how a grammar is parsed and analysed. Two agents
+# can share one Grammar instance only if all of these are equal.
+GRAMMAR_PARAMS = ['CODON_SIZE', 'ATTRIBUTE_GRAMMAR', 'PERMUTATION_RAMPS',
+                  'MIN_INIT_TREE_DEPTH', 'MAX_INIT_TREE_DEPTH',
+                  'POPULATION_SIZE', 'REVERSE_MAPPING_TARGET',
+                  'TARGET_SEED_FOLDER']
+
+
+def grammar_key(file_name, agent):
+    """
+    Builds the registry key for a grammar file parsed with the parameters of
+    the given agent. The key consists of the absolute path of the file, the
+    hash of its content and the values of all grammar-affecting parameters.
+
+    :param file_name: A specified BNF grammar file.
+    :param agent: The agent whose parameters are used to parse the grammar.
+    :return: A hashable key identifying the parsed grammar.
+    """
+
+    with open(file_name, 'rb') as bnf:
+        content_hash = sha1(bnf.read()).hexdigest()
+
+    params = tuple(repr(agent.GE_params.get(param)) for param in
+                   GRAMMAR_PARAMS)
+
+    # Ramping initialisers trigger additional analysis of the grammar.
+    ramping = hasattr(agent.GE_params['INITIALISATION'], "ramping")
+
+    # GE_RANGE productions can depend on the dataset of the fitness function.
+    fitness_function = agent.GE_params['FITNESS_FUNCTION']
+    dataset = tuple(getattr(fitness_function, attr, None) for attr in
+                    ("n_vars", "n_is", "n_os"))
+
+    return path.abspath(file_name), content_hash, params, ramping, dataset
+
+
+def get_grammar(file_name, agent=None):
+    """
+    Returns a fully analysed grammar for the given file. The grammar is
+    parsed only the first time it is requested with a given set of
+    grammar-affecting parameters, all subsequent requests return the shared
+    instance from the registry.
+
+    :param file_name: A specified BNF grammar file.
+    :param agent: The agent requesting the grammar.
+    :return: An instance of the representation.grammar.Grammar class.
+    """
+
+    key = grammar_key(file_name, agent)
+
+    if key not in grammar_registry:
+        # The grammar has not been parsed yet, parse and store it.
+        grammar_registry[key] = Grammar(file_name, agent=agent)
+
+    return grammar_registry[key]
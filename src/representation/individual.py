@@ -1,16 +1,24 @@
 import numpy as np
 
-from algorithm.mapper import mapper
+from algorithm.mapper import MappingCheckpoints, mapper, map_population, \
+    map_arena_from_genome, map_codetree_from_genome, map_tree_from_genome
 #from algorithm.parameters import params
 from representation.code_tree import CodeTree
 
+# Attributes set by mapping the genome, resolved on first access for
+# individuals created with lazy=True (see map_individuals).
+MAPPED_ATTRIBUTES = ("phenotype", "nodes", "invalid", "depth", "used_codons")
+
 
 class Individual(object):
     """
     A GE individual.
     """
+    shared = False  # True for read-only snapshots (see IndividualSnapshot)
+    checkpoints = None  # MappingCheckpoints of the genome, if recorded
 
-    def __init__(self, genome, ind_tree, map_ind=True, agent=None):
+    def __init__(self, genome, ind_tree, map_ind=True, agent=None,
+                 lazy=False, resume=None):
         """
         Initialise an instance of the individual class (i.e. create a new
         individual).
@@ -20,18 +28,46 @@ class Individual(object):
         of the representation.tree.Tree class.
         :param map_ind: A boolean flag that indicates whether or not an
         individual needs to be mapped.
+        :param lazy: Postpone mapping of the genome until map_individuals is
+        called on the population (or a mapped attribute is read). Only used
+        with BATCH_MAPPING and GENOME_OPERATIONS, the individual is mapped
+        right away otherwise.
+        :param resume: The checkpoints of a parent and the number of leading
+        codons the genome shares with the parent's genome. Mapping resumes
+        from the last checkpoint within them (see algorithm.mapper.map_genome).
         """
         self.agent = agent
 
-        if map_ind:
+        if map_ind and lazy and genome and \
+                self.agent.GE_params['BATCH_MAPPING'] and \
+                self.agent.GE_params['GENOME_OPERATIONS']:
+            # The individual is mapped later, together with others.
+            self.genome, self.code_tree = list(genome), None
+            self._pending = True
+
+        elif map_ind:
+            if genome and self.agent.GE_params['GENOME_OPERATIONS'] and \
+                    self.agent.GE_params['MAPPING_CHECKPOINTS']:
+                # Record checkpoints for re-mapping of the offspring.
+                self.checkpoints = MappingCheckpoints(
+                    self.agent.GE_params['MAPPING_CHECKPOINTS'])
+
             # The individual needs to be mapped from the given input
             # parameters.
-            if self.agent.GE_params["ATTRIBUTE_GRAMMAR"]:
+            if genome and not self.agent.GE_params['GENOME_OPERATIONS'] and \
+                    not self.agent.GE_params['ARENA_TREES']:
+                # The derivation tree is built when it is first needed.
+                self.phenotype, self.genome, _, self.nodes, self.invalid, \
+                    self.depth, self.used_codons = mapper(
+                        genome, None, agent=self.agent, build_tree=False)
+                self._defer_tree()
+            elif self.agent.GE_params["ATTRIBUTE_GRAMMAR"]:
                 self.phenotype, self.genome, self.code_tree, self.nodes, self.invalid, \
                     self.depth, self.used_codons = mapper(genome, ind_tree, agent=self.agent)
             else:
                 self.phenotype, self.genome, self.code_tree, self.nodes, self.invalid, \
-                    self.depth, self.used_codons = mapper(genome, ind_tree, agent=self.agent)
+                    self.depth, self.used_codons = mapper(genome, ind_tree, agent=self.agent,
+                                                          checkpoints=self.checkpoints, resume=resume)
 
         else:
             # The individual does not need to be mapped.
@@ -42,6 +78,40 @@ class Individual(object):
         self.runtime_error = False
         self.name = None
 
+    def __getattr__(self, name):
+        """
+        Maps an individual created with lazy=True on its own when one of
+        the mapped attributes is needed before map_individuals was called.
+        """
+        if name in MAPPED_ATTRIBUTES and self.__dict__.get("_pending"):
+            map_individuals([self])
+            return getattr(self, name)
+        if name == "code_tree" and self.__dict__.get("_tree_pending"):
+            # Build the derivation tree of the genome, once, of the kind
+            # mapper builds.
+            if self.agent.GE_params["ATTRIBUTE_GRAMMAR"]:
+                self.code_tree = map_codetree_from_genome(
+                    self.genome, agent=self.agent)[2]
+            elif self.agent.GE_params['ARENA_TREES']:
+                self.code_tree = map_arena_from_genome(
+                    self.genome, agent=self.agent)[2]
+            else:
+                self.code_tree = map_tree_from_genome(
+                    self.genome, agent=self.agent)[2]
+            del self._tree_pending
+            return self.code_tree
+        raise AttributeError(name)
+
+    def _defer_tree(self):
+        """
+        Drops the derivation tree of the individual, it is built from the
+        genome when code_tree is first read. Linear operators and genome
+        exchange never read it, tree operators, attribute checks and export
+        of the tree do.
+        """
+        self.__dict__.pop("code_tree", None)
+        self._tree_pending = True
+
     def perform_attribute_check(self):
         if self.agent.GE_params["ATTRIBUTE_GRAMMAR"]:
             self.code_tree.run()
@@ -105,17 +175,28 @@ class Individual(object):
         except AttributeError:
             self.invalid = self.code_tree.invalid
 
-    def deep_copy(self):
+    def deep_copy(self, copy_tree=True):
         """
         Copy an individual and return a unique version of that individual.
 
+        :param copy_tree: Copy the derivation tree. If False, the copy builds
+        a new tree from the genome when it needs one (see _defer_tree), e.g.
+        for copies made only for linear operators.
         :return: A unique copy of the individual.
         """
 
-        if not self.agent.GE_params['GENOME_OPERATIONS']:
+        deferred = not copy_tree or "code_tree" not in self.__dict__
+        if deferred:
+            # The tree is not copied, the copy builds its own if needed.
+            new_tree = None
+
+        elif not self.agent.GE_params['GENOME_OPERATIONS'] and self.code_tree:
             # Create a new unique copy of the tree.
             new_tree = self.code_tree.__copy__(None)
 
+        elif self.agent.GE_params["ATTRIBUTE_GRAMMAR"] and self.code_tree:
+            new_tree = self.code_tree.__copy__(None)  # copy.deepcopy(self.code_tree)
+
         else:
             new_tree = None
 
@@ -128,10 +209,32 @@ class Individual(object):
         new_ind.depth, new_ind.nodes = self.depth, self.nodes
         new_ind.used_codons = self.used_codons
         new_ind.runtime_error = self.runtime_error
+        new_ind.checkpoints = self.checkpoints
+        if deferred:
+            new_ind._defer_tree()
 
-        if self.agent.GE_params["ATTRIBUTE_GRAMMAR"] and self.code_tree:
-            new_ind.code_tree = self.code_tree.__copy__(None) #copy.deepcopy(self.code_tree)
+        return new_ind
 
+    def snapshot(self):
+        """
+        Read-only snapshot of the individual, shared by reference (see IndividualSnapshot). The snapshot is made
+        once and handed out to everyone asking.
+
+        :return: IndividualSnapshot of the individual.
+        """
+        snapshot = self.__dict__.get("_snapshot")
+        if snapshot is None:
+            snapshot = self._snapshot = IndividualSnapshot(self)
+        return snapshot
+
+    def own(self):
+        """
+        Private copy of the individual that can be changed, including its fitness.
+
+        :return: A unique copy of the individual.
+        """
+        new_ind = self.deep_copy()
+        new_ind.fitness = self.fitness
         return new_ind
 
     def evaluate(self):
@@ -150,3 +253,83 @@ class Individual(object):
 
         if self.agent.GE_params['MULTICORE']:
             return self
+
+
+class IndividualSnapshot(Individual):
+    """
+    Read-only view of an individual for genome exchange. Genome and derivation tree are shared with the original
+    individual, not copied - operators copy (deep_copy) individuals before changing them, so the shared parts stay
+    untouched. Setting any attribute raises AttributeError; own() returns a private, changeable copy.
+    As with deep_copy, fitness of the snapshot is the default one.
+    """
+    shared = True
+
+    def __init__(self, ind):
+        built = "code_tree" in ind.__dict__
+        super(IndividualSnapshot, self).__init__(ind.genome, ind.code_tree if built else None, map_ind=False,
+                                                 agent=ind.agent)
+        if not built:
+            # The tree is built by the individual when first needed (see Individual._defer_tree) and shared then.
+            del self.code_tree
+            self._source = ind
+        self.phenotype, self.invalid = ind.phenotype, ind.invalid
+        self.depth, self.nodes = ind.depth, ind.nodes
+        self.used_codons = ind.used_codons
+        self.runtime_error = ind.runtime_error
+        self.checkpoints = ind.checkpoints
+        self._frozen = True
+
+    def __setattr__(self, key, value):
+        if self.__dict__.get("_frozen"):
+            raise AttributeError(f"Individual snapshot is read-only, cannot set {key}")
+        super(IndividualSnapshot, self).__setattr__(key, value)
+
+    def __getattr__(self, name):
+        if name == "code_tree" and "_source" in self.__dict__:
+            return self._source.code_tree
+        return super(IndividualSnapshot, self).__getattr__(name)
+
+    def snapshot(self):
+        return self
+
+
+def map_individuals(individuals):
+    """
+    Maps the genomes of all the individuals created with lazy=True that were
+    not mapped yet, those of one agent at once with
+    algorithm.mapper.map_population.
+
+    :param individuals: A population of individuals.
+    :return: The same population, all of it mapped.
+    """
+
+    pending = dict()  # agent -> individuals to map
+    for ind in individuals:
+        if ind.__dict__.get("_pending"):
+            pending.setdefault(ind.agent, []).append(ind)
+
+    for agent, inds in pending.items():
+        if len(inds) == 1:
+            # Not worth the numpy overhead.
+            ind = inds[0]
+            ind.phenotype, ind.genome, ind.code_tree, ind.nodes, \
+                ind.invalid, ind.depth, ind.used_codons = \
+                mapper(ind.genome, None, agent=agent)
+            del ind._pending
+            continue
+
+        phenotypes, nodes, invalid, depths, used_codons = map_population(
+            [ind.genome for ind in inds], agent)
+
+        for ind, phenotype, ind_nodes, ind_invalid, depth, used in zip(
+                inds, phenotypes.tolist(), nodes.tolist(), invalid.tolist(),
+                depths.tolist(), used_codons.tolist()):
+            if ind_invalid:
+                # Set values for invalid individuals, as mapper() does.
+                ind_nodes, depth, used = np.NaN, np.NaN, np.NaN
+            ind.phenotype, ind.nodes, ind.invalid = phenotype, ind_nodes, \
+                ind_invalid
+            ind.depth, ind.used_codons = depth, used
+            del ind._pending
+
+    return individuals
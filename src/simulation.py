@@ -5,27 +5,56 @@ import random
 import sys
 
 import py_trees.trees
-from PyQt5.QtWidgets import QApplication
 from py_trees.composites import Sequence, Selector
 
 from swarm.backend import TestBackend
-from swarm.gui import SimulationWindow
+from swarm.checkpoint import load_checkpoint
 import  cProfile
 
 NUM_OF_AGENS = 100
 BOARD_SIZE = 100
 DETERMINISTIC = True  # False
 PARAM_FILE = "AG_params.txt"   # "AG_params.txt" "parameters.txt
+HEADLESS = False  # True to run NUM_OF_STEPS steps without GUI as fast as possible
+NUM_OF_STEPS = 1000  # Used only in headless mode
+GUI_FPS = 10  # Max. number of GUI updates per second
+TWO_PHASE = False  # True to let all the agents decide against the same board and commit their actions afterwards
+SEED = None  # Seed of the simulation (agents are seeded by RANDOM_SEED in PARAM_FILE)
+TIMING = False  # True to measure time spent in the phases of the simulation (exported to the results folder)
+TRACE = False  # True to record agents' events to one binary trace instead of per-agent log files (python -m swarm.trace)
+CHECKPOINT_EVERY = 0  # > 0 to save the simulation every this number of steps (checkpoint.npz in the results folder)
+RESUME = None  # Checkpoint to continue from (e.g. "../results/latest/checkpoint.npz") instead of a new simulation
 if __name__ == '__main__':
 
     logging.basicConfig(level=logging.DEBUG)
     py_trees.logging.level = py_trees.logging.Level.INFO
 
+    if HEADLESS:
+        if RESUME:
+            backend = load_checkpoint(RESUME, two_phase=TWO_PHASE, timing=TIMING, trace=TRACE,
+                                      checkpoint_every=CHECKPOINT_EVERY)
+        else:
+            backend = TestBackend(None, deterministic=DETERMINISTIC, dimension=BOARD_SIZE, two_phase=TWO_PHASE,
+                                  seed=SEED, timing=TIMING, trace=TRACE, checkpoint_every=CHECKPOINT_EVERY)
+            backend.setup_simulation(NUM_OF_AGENS, PARAM_FILE)
+        stats = backend.run_headless(NUM_OF_STEPS)
+        print(f"Steps: {stats['steps']}, food picked: {stats['food_picked']}, food dropped: {stats['food_dropped']}, "
+              f"food inside base: {stats['food_inside_base']}")
+        sys.exit(0)
+
+    from PyQt5.QtWidgets import QApplication
+    from swarm.gui import SimulationWindow
+
     app = QApplication(sys.argv)
 
     gui = SimulationWindow(BOARD_SIZE)
-    backend = TestBackend(gui, deterministic=DETERMINISTIC)
-    backend.setup_simulation(NUM_OF_AGENS, PARAM_FILE)
+    if RESUME:
+        backend = load_checkpoint(RESUME, gui, fps=GUI_FPS, two_phase=TWO_PHASE, timing=TIMING, trace=TRACE,
+                                  checkpoint_every=CHECKPOINT_EVERY)
+    else:
+        backend = TestBackend(gui, deterministic=DETERMINISTIC, fps=GUI_FPS, two_phase=TWO_PHASE, seed=SEED,
+                              timing=TIMING, trace=TRACE, checkpoint_every=CHECKPOINT_EVERY)
+        backend.setup_simulation(NUM_OF_AGENS, PARAM_FILE)
     gui.register_backend(backend)
 
     backend.start()
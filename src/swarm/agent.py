@@ -13,7 +13,7 @@ from swarm.bt import BTConstruct
 from swarm.models import TileModel
 from swarm.neighbourhood import Neighbourhood, LocalMap
 from swarm.packets import *
-from swarm.types import ObjectType
+from swarm.types import ObjectType, Color
 
 # GE
 from swarm.default_params import default_params
@@ -27,8 +27,8 @@ from operators.selection import selection
 from representation.individual import Individual
 
 # Other
-from PyQt5 import QtCore
 import math
+from swarm.math import DecayedSum
 
 if TYPE_CHECKING:
     from swarm.backend import TestBackend
@@ -39,7 +39,7 @@ class EvoAgent:
     """
     GE_params: dict[str | Any, str | int | None | Any]
 
-    def __init__(self, name, sense_radius=1, max_speed=1, color=QtCore.Qt.black, level=logging.DEBUG, exchange_prob=1,
+    def __init__(self, name, sense_radius=1, max_speed=1, color=Color.BLACK, level=logging.DEBUG, exchange_prob=1,
                  genome_storage_threshold=2, init_genome=None, params_file="parameters.txt", init_position=None):
 
         # Basic agent properties
@@ -84,6 +84,8 @@ class EvoAgent:
         self.exchanged_individuals = dict()
         self.num_of_truly_exchanged_individuals = 0
         self.exploration_fitness_coeff = {"a":2, "b":0.3}
+        # Exponential exploration fitness kept up to date with position_history
+        self.exploration_sum = DecayedSum(self.exploration_fitness_coeff["a"], self.exploration_fitness_coeff["b"])
 
         # Logging
         self.logger = logging.getLogger(name)
@@ -96,6 +98,11 @@ class EvoAgent:
         # agent.home_base = None
 
     def setup_logging(self):
+        if self.backend.trace:
+            # Events are recorded to the shared trace instead, text log is kept for warnings and errors only
+            self.logger.setLevel(max(self.logger.level, logging.WARNING))
+            return
+
         # Prepare logger - for stderr and file
         if not os.path.exists(f"../results/{self.GE_params['LOG_FOLDER']}"):
             os.makedirs(f"../results/{self.GE_params['LOG_FOLDER']}")
@@ -126,17 +133,7 @@ class EvoAgent:
         self.local_map = LocalMap(self, self.backend.board_model.dimension)
 
     def init_GE(self):  # noqa
-        # Init GE parameters
-        algorithm.parameters.load_params(self.param_file, agent=self)
-        algorithm.parameters.set_params(None, create_files=True, agent=self)
-
-        for key in self.GE_params.keys():
-            val = self.GE_params[key]
-            try:
-                val = eval(val)
-            except Exception:  # If error arises here, change TypeError to Exception
-                pass
-            self.GE_params[key] = val
+        self.load_GE_params(self.backend.params)
 
         if self.init_genome:
             individuals = [Individual(genome=self.init_genome, ind_tree=None, agent=self)]
@@ -151,6 +148,23 @@ class EvoAgent:
                 individuals = evaluate_fitness(individuals, self)
                 change_ok = self.choose_new_individual(individuals)
 
+    def load_GE_params(self, overrides=None):
+        """
+        Loads GE parameters from the params file, values in overrides (name -> value) replace the loaded ones.
+        """
+        algorithm.parameters.load_params(self.param_file, agent=self)
+        if overrides:
+            self.GE_params.update({key: str(value) for key, value in overrides.items()})
+        algorithm.parameters.set_params(None, create_files=True, agent=self)
+
+        for key in self.GE_params.keys():
+            val = self.GE_params[key]
+            try:
+                val = eval(val)
+            except Exception:  # If error arises here, change TypeError to Exception
+                pass
+            self.GE_params[key] = val
+
     def choose_new_individual(self, individuals):
         individuals.sort(reverse=True)
 
@@ -171,8 +185,13 @@ class EvoAgent:
         if not self.individual or self.individual.invalid or self.individual.fitness <= self.individuals[0].fitness:
             self.logger.debug("[IND_CHG] Current individual changed (fitness {} -> {})".format(
                 self.individual.fitness if self.individual else "nan", self.individuals[0].fitness))
-            self.individual = self.individuals[0]  # first = best
+            best = self.individuals[0]  # first = best
+            if best.shared:
+                # genome of a neighbour kept as is, the agent gets its own copy of it
+                best = self.individuals[0] = best.own()
+            self.individual = best
             self.position_history = dict()
+            self.exploration_sum.reset()
         else:
             self.logger.debug("[IND_CHG] Current individual not changed.")
 
@@ -184,11 +203,16 @@ class EvoAgent:
         self.exchanged_individuals = {self.name: self.individual}
         self.num_of_truly_exchanged_individuals = 1
 
-        # Prepare BT
-        self.bt_wrapper.xmlstring = self.individual.phenotype
-        self.bt_wrapper.bt_from_xml()
+        self.build_bt()
         return True
 
+    def build_bt(self):
+        """
+        Builds the behaviour tree from the phenotype of the current individual.
+        """
+        self.bt_wrapper.xmlstring = self.individual.phenotype
+        self.bt_wrapper.bt_from_xml(flat=self.GE_params["BT_EXECUTOR"] == "flat")
+
     def make_final_stats(self):
         # TODO :)
         # Určitě logovat historii fitness funkcí
@@ -203,42 +227,65 @@ class EvoAgent:
         """
         self.logger.info("--------------------------------")
         start_time = time.perf_counter()
+        timer = self.backend.timer
+        if timer:
+            phase_start = timer.start()
 
         # SENSE()
         self.steps += 1
         self.steps_without_evolution += 1
-        self.position_history[tuple(self.position)] = self.steps
-        self.logger.info(f"[S{self.steps}] Step {self.steps}")
-        self.logger.debug(f"[POS] Position: {self.position}")
-        self.logger.debug(
-            f"[SWE{self.steps_without_evolution}] Step without evolution {self.steps_without_evolution}")
-        self.logger.debug(f"[F] Current fitness at the start: {self.individual.fitness}")
-        self.logger.debug(f"[G] Goal: {self.goal}")
-        self.logger.debug(f"[NS] Next step: {self.next_step}")
+        position = tuple(self.position)
+        self.exploration_sum.refresh(self.steps, self.position_history.get(position))
+        self.position_history[position] = self.steps
+        if self.backend.trace:
+            self.backend.trace.step(self.name, self.steps, self.position, self.steps_without_evolution,
+                                    self.individual.fitness)
+        self.logger.info("[S%s] Step %s", self.steps, self.steps)
+        self.logger.debug("[POS] Position: %s", self.position)
+        self.logger.debug("[SWE%s] Step without evolution %s", self.steps_without_evolution,
+                          self.steps_without_evolution)
+        self.logger.debug("[F] Current fitness at the start: %s", self.individual.fitness)
+        self.logger.debug("[G] Goal: %s", self.goal)
+        self.logger.debug("[NS] Next step: %s", self.next_step)
         # actually sense
         resp = self.backend.sense_object_neighbourhood(self)
         self.neighbourhood.set_neighbourhood(resp.neighbourhood)
         self.local_map.update(self.neighbourhood)
-        self.logger.debug(f"[NEIGH] Neighbourhood: {self.neighbourhood}")
-        self.logger.debug(f"[LM] Local map: {self.local_map}")
+        if timer:
+            timer.lap(self.name, self.steps, "sense", phase_start)
+        # Rendered only if the message is logged
+        self.logger.debug("[NEIGH] Neighbourhood: %s", self.neighbourhood)
+        self.logger.debug("[LM] Local map: %s", self.local_map)
 
         # Try to exchange genomes
-        agents_present, neighbouring_agent_cells = self.neighbourhood.get(ObjectType.AGENT)
-        if agents_present:
+        if timer:
+            phase_start = timer.start()
+        neighbouring_agent_cells = [cell for cell, _ in
+                                    self.backend.objects_within(ObjectType.AGENT, self.position, self.sense_radius)]
+        if neighbouring_agent_cells:
             for cell in neighbouring_agent_cells:
                 if cell.object.name not in self.exchanged_individuals.keys():
                     neighbour_genome = cell.object.ask_for_genome()
                     # add the genome no matter if the neighbour was willing to share - it serves as an info about asking
                     self.exchanged_individuals[cell.object.name] = neighbour_genome
                     self.num_of_truly_exchanged_individuals += 1 if neighbour_genome else 0
+        if timer:
+            timer.lap(self.name, self.steps, "exchange", phase_start)
 
         # ACT()
         # actually act
-        self.logger.debug(f"[TREE] Tree: {py_trees.display.ascii_tree(self.bt_wrapper.behaviour_tree.root)}")
-        self.logger.debug(f"[GENOME] {self.individual.genome}")
-        self.bt_wrapper.behaviour_tree.tick()
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"[TREE] Tree: {py_trees.display.ascii_tree(self.bt_wrapper.behaviour_tree.root)}")
+        self.logger.debug("[GENOME] %s", self.individual.genome)
+        if timer:
+            phase_start = timer.start()
+        self.bt_wrapper.tick()
+        if timer:
+            phase_start = timer.lap(self.name, self.steps, "bt_tick", phase_start)
         self.compute_fitness()
-        self.logger.debug(f"[GOAL] Goal is: {self.goal}")
+        if timer:
+            timer.lap(self.name, self.steps, "fitness", phase_start)
+        self.logger.debug("[GOAL] Goal is: %s", self.goal)
 
         # UPDATE()
         # If there is enough genomes to perform evolution AND current behavior was at least tried...
@@ -249,8 +296,7 @@ class EvoAgent:
                            self.exchanged_individuals[k] is not None]
             # TODO do the individuals have their fitness functions?
             self.individuals = individuals
-            self.evolution_step(individuals)
-            self.logger.debug("[EVO] Evolution step finished")
+            self.evolve(individuals, False)
         # else if evolution was not performed for too long...
         elif self.steps_without_evolution > self.GE_params["MAX_STEPS_WITHOUT_EVOLUTION"]:
             self.logger.debug("[EVO] Reached MAX_STEPS_WITHOUT_EVOLUTION ({}), reinitialising genome (exchanged "
@@ -260,13 +306,17 @@ class EvoAgent:
             individuals = [self.exchanged_individuals[k] for k in self.exchanged_individuals.keys() if
                            self.exchanged_individuals[k] is not None]
             # It does not need to be exactly POPULATION_SIZE, but it is a good start (we just need some number of valid individuals)
+            if timer:
+                phase_start = timer.start()
             individuals += self._extend_population()
+            if timer:
+                timer.lap(self.name, self.steps, "initialisation", phase_start)
             self.individuals = individuals
-            self.evolution_step(individuals)
-            
-        self.logger.debug(f"[F] Current fitness: {self.individual.fitness}")
+            self.evolve(individuals, True)
+
+        self.logger.debug("[F] Current fitness: %s", self.individual.fitness)
         duration = time.perf_counter() - start_time
-        self.logger.debug(f"[TIME] Step took {duration} s")
+        self.logger.debug("[TIME] Step took %s s", duration)
 
     def _extend_population(self):
         new_individuals = initialisation(size=self.GE_params["POPULATION_SIZE"]-self.num_of_truly_exchanged_individuals, agent=self)
@@ -278,35 +328,89 @@ class EvoAgent:
             valid_inds = [ind for ind in new_individuals if not ind.invalid]
         return valid_inds
     
+    def evolve(self, individuals, reinitialised):
+        """
+        Evolution step of the agent, now or (EVOLUTION "batched") together with the other agents at the end
+        of the simulation step (see swarm.evolution.EvolutionBatch).
+        """
+        fitness_before = self.individual.fitness
+        if self.GE_params["EVOLUTION"] == "batched":
+            self.backend.evolution.request(self, individuals, reinitialised, fitness_before)
+        else:
+            self.evolution_step(individuals)
+            self.evolution_finished(len(individuals), reinitialised, fitness_before)
+
+    def evolution_finished(self, num_of_genomes, reinitialised, fitness_before):
+        if self.backend.trace:
+            self.backend.trace.evolve(self.name, self.steps, reinitialised, num_of_genomes, fitness_before,
+                                      self.individual.fitness)
+        self.logger.debug("[EVO] Evolution step finished")
+
     def evolution_step(self, individuals):
         # NOTE: below is copied and slightly changed code from ponyge/step.py/step()
+        new_pop = self.variation(individuals)
+
+        timer = self.backend.timer
+        if timer:
+            phase_start = timer.start()
+        # Evaluate  the fitness of the new population.
+        new_pop = evaluate_fitness(new_pop, self)
+        if timer:
+            timer.lap(self.name, self.steps, "evaluation", phase_start)
+
+        self.replace_population(new_pop)
+
+    def variation(self, individuals):
+        """
+        Selection, crossover, mutation and attribute check of the first half of evolution_step.
+        Returns the new population, not evaluated yet.
+        """
+        timer = self.backend.timer
+        if timer:
+            phase_start = timer.start()
         # no new individuals created, just parents chosen
         parents = selection(individuals, self)
+        if timer:
+            phase_start = timer.lap(self.name, self.steps, "selection", phase_start)
 
         # Crossover parents and add to the new population.
         cross_pop = crossover(parents, self)
+        if timer:
+            phase_start = timer.lap(self.name, self.steps, "crossover", phase_start)
 
         # Mutate the new population.
         new_pop = mutation(cross_pop, self)
+        if timer:
+            phase_start = timer.lap(self.name, self.steps, "mutation", phase_start)
 
         # NOTE: Here, attribute grammar gets involved
         for ind in new_pop:
             ind.perform_attribute_check()
+        if timer:
+            timer.lap(self.name, self.steps, "attribute_check", phase_start)
+        return new_pop
 
-        # Evaluate  the fitness of the new population.
-        new_pop = evaluate_fitness(new_pop, self)
-
+    def replace_population(self, new_pop):
+        """
+        Replacement and choice of the new individual, the second half of evolution_step.
+        """
+        timer = self.backend.timer
+        if timer:
+            phase_start = timer.start()
         # Replace the old population with the new population.
         individuals = replacement(new_pop, self.individuals, self)
 
         self.choose_new_individual(individuals)
+        if timer:
+            timer.lap(self.name, self.steps, "replacement", phase_start)
         
     def ask_for_genome(self):
         """
-        This function is called by another agents trying to acquire this agent's genome
+        This function is called by another agents trying to acquire this agent's genome.
+        Returns read-only snapshot of the individual shared by all the askers, operators copy it before any change.
         """
         if random.random() < self.exchange_prob and not self.individual.invalid:
-            return self.individual.deep_copy()
+            return self.individual.snapshot()
         else:
             return None
 
@@ -318,19 +422,24 @@ class EvoAgent:
         BT_feedback_fitness = self.compute_BT_feedback_fitness()
         self.individual.fitness = self.GE_params[
                                       "BETA"] * self.individual.fitness + exploration_fitness + BT_feedback_fitness
-        self.logger.debug("[F] EX: {}, BT: {}, BETA*previous+current: {}".format(exploration_fitness, BT_feedback_fitness,
-                                                                     self.individual.fitness))
+        self.logger.debug("[F] EX: %s, BT: %s, BETA*previous+current: %s", exploration_fitness, BT_feedback_fitness,
+                          self.individual.fitness)
+        if self.backend.trace:
+            self.backend.trace.fitness(self.name, self.steps, exploration_fitness, BT_feedback_fitness,
+                                       self.individual.fitness)
 
     def compute_exploration_fitness(self):
         """
         Exploration fitness: number of locations/tiles visited
         """
-        self.logger.debug(f"[HISTORY] Position history: {self.position_history}")
+        self.logger.debug("[HISTORY] Position history: %s", self.position_history)
         exploration_fitness = 0
         if self.GE_params["EXPLORATION_FITNESS_FUNCTION"] == "linear":
             exploration_fitness = self._exploration_fitness_linear()
         elif self.GE_params["EXPLORATION_FITNESS_FUNCTION"] == "exponential":
             exploration_fitness = self._exploration_fitness_exponential()
+        elif self.GE_params["EXPLORATION_FITNESS_FUNCTION"] == "exponential_incremental":
+            exploration_fitness = self.exploration_sum.value(self.steps)
         else:
             self.logger.error(f"Unknown exploration fitness function: {self.GE_params['EXPLORATION_FITNESS_FUNCTION']}")
         return exploration_fitness
@@ -347,6 +456,9 @@ class EvoAgent:
         """
         details n fitness/swarm_diversity.py (or something like that) in PonyGE2
         """
+        if self.bt_wrapper.flat_tree is not None:
+            return self.bt_wrapper.flat_tree.feedback(self.GE_params["PENALTY"])
+
         all_nodes = list(self.bt_wrapper.behaviour_tree.root.iterate())
         selectors = list(filter(
             lambda x: isinstance(x, py_trees.composites.Selector), all_nodes)
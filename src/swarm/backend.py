@@ -1,4 +1,3 @@
-import cProfile
 import os
 import sys
 
@@ -8,9 +7,15 @@ import threading
 from typing import Optional
 
 from swarm.agent import EvoAgent
+from swarm.evolution import EvolutionBatch
 from swarm.math import compute_distance
 from swarm.models import BoardModel, TileModel
+from swarm.navigation import NavigationService
+from swarm.population import MotionBatch
+from swarm.neighbourhood import SensedArea
 from swarm.packets import *
+from swarm.profiling import PhaseTimer, BACKEND
+from swarm.trace import EventTrace
 from swarm.objects import *
 from swarm.types import ObjectType
 import random
@@ -18,11 +23,27 @@ import random
 GENOME = [79242, 75288, 93946, 83682, 80172, 11178, 75654, 24507, 16904, 10288, 17401, 75438, 702, 37977, 15383, 32074, 97093, 85682, 80665, 6155, 92769, 19285, 19954, 8903, 52532, 16624, 72056, 20582, 50856, 52945, 95519, 77299, 34370, 19326, 48349, 70714, 51384, 8460, 32414, 52821, 36896, 43539, 2803, 12593, 78952, 84255, 90838, 86875, 44221, 59373]
 
 class Backend(threading.Thread):
-    def __init__(self, gui, level):
+    def __init__(self, gui, level, dimension=None, fps=10, timing=False, trace=False):
+        """
+        :param gui: SimulationWindow observing the simulation or None for headless run.
+        :param level: Logging level.
+        :param dimension: Size of the board. If not set, dimension of the GUI is used.
+        :param fps: Maximal number of GUI updates per second.
+        :param timing: If True, time spent in the phases of the simulation is measured (see PhaseTimer) and exported
+        to the results folder with the final stats.
+        :param trace: If True, agents and backend record events to the shared EventTrace (trace.bin in the results
+        folder) instead of writing their own text log files.
+        """
         super(Backend, self).__init__()
         self.gui = gui
+        self.dimension = dimension if dimension else gui.dimension
+        self.frame_period = 1 / fps if fps else 0
+        self.last_frame_time = None
 
         self.board_model: Optional[BoardModel] = None  # BoardModel(gui.dimension)
+        self.navigation: Optional[NavigationService] = None  # distance fields to the static objects on the board
+        self.evolution: Optional[EvolutionBatch] = None  # evolution steps of the agents evolving in batch
+        self.motion: Optional[MotionBatch] = None  # random walks of the agents moving in batch
         self.agents = list()
         self.random = random
 
@@ -30,6 +51,7 @@ class Backend(threading.Thread):
         self.stop = True  # True if wait for buttons, False for autostart
         self.end = False  # When comes True, simulation will end
         self.restart = False
+        self.step_number = 0
 
         # Logging
         self.logger = logging.getLogger("backend")
@@ -40,16 +62,20 @@ class Backend(threading.Thread):
         self.food_dropped_history = []
         self.fitness_history = []
 
+        # Timing, None = off
+        self.timer: Optional[PhaseTimer] = PhaseTimer() if timing else None
+
+        # Event trace, None = agents log to their own files
+        self.trace: Optional[EventTrace] = EventTrace() if trace else None
 
     def setup(self):
         if not os.path.exists(f"../results/{self.agents[0].GE_params['LOG_FOLDER']}"):
             os.makedirs(f"../results/{self.agents[0].GE_params['LOG_FOLDER']}")
 
-        try:
-            os.symlink(f"../results/{self.agents[0].GE_params['LOG_FOLDER']}", f"../results/latest", target_is_directory=True)
-        except FileExistsError:
-            os.unlink(f"../results/latest")
-            os.symlink(f"../results/{self.agents[0].GE_params['LOG_FOLDER']}", f"../results/latest", target_is_directory=True)
+        # Replaced atomically, simulations of a sweep start in parallel
+        os.symlink(f"../results/{self.agents[0].GE_params['LOG_FOLDER']}", f"../results/latest.{os.getpid()}",
+                   target_is_directory=True)
+        os.replace(f"../results/latest.{os.getpid()}", f"../results/latest")
 
         file_formatter = logging.Formatter("%(levelname)s:%(message)s")
         file_handler = logging.FileHandler(
@@ -59,19 +85,34 @@ class Backend(threading.Thread):
 
         self.logger.addHandler(file_handler)
 
+        if self.trace:
+            self.trace.open(f"../results/{self.agents[0].GE_params['LOG_FOLDER']}/trace.bin")
+
     def register_agent(self, agent):
         if agent not in self.agents:
             self.agents.append(agent)
+            if self.motion is not None:
+                self.motion.store.add(agent)
             agent.backend = self
             agent.setup()
             pass  # place for breakpoint
         else:
             raise KeyError("Agent name already registered: {}", agent.name)
 
-    def update_gui(self):
-        timer = threading.Timer(0.1, self.update_gui)
-        timer.start()
-        self.gui.update(self.board_model)
+    def update_gui(self, force=False):
+        """
+        Renders the board in GUI, at most once per frame period (unless forced). Does nothing in headless mode.
+        """
+        if not self.gui:
+            return
+        now = time.perf_counter()
+        if force or self.last_frame_time is None or now - self.last_frame_time >= self.frame_period:
+            self.last_frame_time = now
+            if self.timer:
+                start = self.timer.start()
+            self.gui.update(self.board_model)
+            if self.timer:
+                self.timer.lap(BACKEND, self.step_number, "gui", start)
 
     def run(self):
         raise NotImplemented
@@ -89,52 +130,75 @@ class Backend(threading.Thread):
         if not pos_ok:
             raise ValueError(
                 f"Object {obj.type.value} of radius {obj.radius} cannot be placed at {position} due to occupancy.")
-        for r in range(position[0] - obj.radius, position[0] + obj.radius + 1):
-            for c in range(position[1] - obj.radius, position[1] + obj.radius + 1):
-                if r < 0 or c < 0 or r >= self.board_model.dimension or c >= self.board_model.dimension:
-                    continue
-                tile = self.board_model.tiles[r][c]
-                if compute_distance(tile.position, position) <= obj.radius:
-                    tile.place_object(obj)
+        self.board_model.place_object_area(obj, position, obj.radius)
         obj.set_place(position, self.board_model)
 
     def check_occupancy(self, position, radius):
-        pos_min = [position[0] - radius, position[1] - radius]
-        pos_max = [position[0] + radius, position[1] + radius]
-        for r in range(pos_min[0], pos_max[0]):
-            for c in range(pos_min[1], pos_max[1]):
-                if r < 0 or c < 0 or r >= self.board_model.dimension or c >= self.board_model.dimension:
-                    continue
-                tile = self.board_model.tiles[r][c]
-                if compute_distance(position, tile.position) <= radius and tile.occupied:
-                    return False
-        return True
+        return self.board_model.is_free(position, radius)
+
+    def objects_within(self, object_type, position, radius):
+        """
+        Returns list of (tile, distance) for all tiles with object of the given type no farther than radius.
+        """
+        return [(self.board_model.tile(*pos), distance)
+                for pos, _, distance in self.board_model.index.within(object_type, position, radius)]
+
+    def nearest_objects(self, object_type, position, k=1, max_distance=None):
+        """
+        Returns list of (tile, distance) for (at most) k tiles with object of the given type closest to the position.
+        """
+        return [(self.board_model.tile(*pos), distance)
+                for pos, _, distance in self.board_model.index.nearest(object_type, position, k, max_distance)]
 
 
 class TestBackend(Backend):
-    def __init__(self, gui, deterministic=False, level=logging.DEBUG):
-        super(TestBackend, self).__init__(gui, level)
+    def __init__(self, gui, deterministic=False, level=logging.DEBUG, dimension=None, fps=10, min_step_duration=0.2,
+                 two_phase=False, seed=None, timing=False, trace=False, params=None, checkpoint_every=0):
+        """
+        :param min_step_duration: Steps shorter than this are padded by sleeping to make the simulation reasonably
+        slow to watch. Ignored in headless mode (gui=None), where the simulation runs as fast as possible.
+        :param two_phase: If True, every step is done in two phases (see two_phase_step): all the agents decide
+        against the same board, then their actions are committed to it. False = every agent sees the actions of the
+        agents before it.
+        :param seed: Seed of the random module (set after the agents are created) and of the conflict policy
+        of the two phase stepping. None = not seeded.
+        :param params: GE parameters (name -> value) of all the agents overriding the ones of the params file.
+        :param checkpoint_every: If > 0, the simulation is saved every this number of steps to checkpoint.npz
+        in the results folder (see swarm.checkpoint, load_checkpoint resumes it).
+        """
+        super(TestBackend, self).__init__(gui, level, dimension, fps, timing, trace)
         self.param_file = None
         self.deterministic = deterministic
+        self.min_step_duration = min_step_duration if gui else 0
+
+        # Two phase stepping
+        self.two_phase = two_phase
+        self.seed = seed
+        self.conflict_random = random.Random(seed)  # own generator, does not affect the agents' random numbers
+        self.deferred = False  # True during the decision phase, actions are only recorded
+        self.intents = dict()  # agent -> actions recorded during the decision phase
+
+        self.params = dict(params) if params else None
+        self.checkpoint_every = checkpoint_every
 
     def setup(self):
         super().setup()
 
     def run(self):
         self.run_wrapper()
-        # cProfile.runctx("self.run_wrapper()", globals(), locals(), "backend_stats_{}".format(time.time()))
         self.do_final_stats()
         print("End")
         sys.exit(0)
 
-    def setup_simulation(self, num_of_agents, param_file, reset_gui=False):
-        if reset_gui:
-            self.gui.reset_board(self.gui.dimension)
+    def setup_simulation(self, num_of_agents, param_file, reset_gui=False, sense_radius=10, food_position=(32, 32)):
+        if reset_gui and self.gui:
+            self.gui.reset_board(self.dimension)
         self.restart = False
         self.param_file = param_file
+        self.step_number = 0
 
-        self.board_model = BoardModel(self.gui.dimension)
-        self.update_gui()
+        self.new_board()
+        self.update_gui(force=True)
         for i in range(num_of_agents):
 
             """if i == 0:
@@ -144,22 +208,49 @@ class TestBackend(Backend):
                 agent = EvoAgent("agent" + str(i), sense_radius=10, genome_storage_threshold=7, init_genome=None,
                                  params_file=param_file)"""
 
-            agent = EvoAgent("agent" + str(i), sense_radius=10, genome_storage_threshold=7, init_genome=None,
-                             params_file=param_file)
+            agent = EvoAgent("agent" + str(i), sense_radius=sense_radius, genome_storage_threshold=7,
+                             init_genome=None, params_file=param_file)
 
             self.register_agent(agent)
         #food = [FoodSource("jidlo" + str(random.randint(0, 100)), ObjectType.FOOD, 2) for _ in range(1)]
         food = FoodSource("jidlo", ObjectType.FOOD, 7)
         hub = Hub("hub", ObjectType.HUB, 10)
 
+        if self.seed is not None:
+            # Agents reseed the random module during their setup
+            random.seed(self.seed)
+            self.conflict_random.seed(self.seed)
+
         self.place_object(hub, (self.board_model.dimension//2, self.board_model.dimension//2))
         #self.place_object(food, (5,5))
-        self.place_object(food, (32, 32))
-        self.update_gui()
+        self.place_object(food, tuple(food_position))
         self.place_agents()
-        self.update_gui()
+        self.update_gui(force=True)
+
+    def new_board(self):
+        """
+        Creates an empty board and the services working on it.
+        """
+        self.board_model = BoardModel(self.dimension)
+        self.navigation = NavigationService(self.board_model)
+        self.evolution = EvolutionBatch(self)
+        self.motion = MotionBatch(self, self.seed)
+
+    def checkpoint(self, filename=None):
+        """
+        Saves the simulation (see swarm.checkpoint), by default to checkpoint.npz in the results folder.
+        """
+        from swarm.checkpoint import save_checkpoint
+        if filename is None:
+            filename = f"../results/{self.agents[0].GE_params['LOG_FOLDER']}/checkpoint.npz"
+        save_checkpoint(self, filename)
+        self.logger.debug(f"[CHK] Simulation saved to {filename}")
+        return filename
 
     def do_final_stats(self):
+        """
+        Logs the final report and returns its summary as a dict.
+        """
         self.logger.debug("---------Final report----------")
 
         # Food
@@ -185,10 +276,24 @@ class TestBackend(Backend):
         #    self.logger.debug("Fitness stats")
         #    self.logger.debug(agent.make_final_stats())
 
+        if self.timer:
+            folder = f"../results/{self.agents[0].GE_params['LOG_FOLDER']}"
+            self.timer.export_csv(f"{folder}/timing.csv")
+            self.timer.export_json(f"{folder}/timing.json")
+            self.logger.debug(f"[TIME] Timing exported to {folder}/timing.csv and {folder}/timing.json")
+            self.timer.clear()
+        if self.trace:
+            self.trace.close()
+
         # TODO more final stats?
+        return {"steps": len(self.fitness_history),
+                "food_picked": len(self.food_picked_history),
+                "food_dropped": len(self.food_dropped_history),
+                "food_inside_base": number_of_food_inside_base,
+                "fitness_history": list(self.fitness_history)}
 
     def run_wrapper(self):
-        cnt = 1
+        cnt = self.step_number + 1  # a loaded checkpoint continues with its next step
         self.setup()
         self.logger.debug(f"Number of agents: {len(self.agents)}")
         while True:
@@ -200,41 +305,17 @@ class TestBackend(Backend):
                 self.agents = []
                 self.setup_simulation(num_of_agents, self.param_file, reset_gui=True)
                 self.setup()
+                cnt = 1
             if not self.stop:
                 if self.step:
                     self.stop = True
-                self.logger.debug(f"[S{cnt}] Step number {cnt}")
                 step_start_time = time.perf_counter()
-
-                # Stats
-                fitnesses = tuple(agent.individual.fitness for agent in self.agents)
-                best_fitness = max(fitnesses)
-                idx_best = fitnesses.index(best_fitness)
-                avg_fitness = sum(fitnesses) / len(fitnesses)
-                self.fitness_history.append((avg_fitness, best_fitness))
-                self.logger.debug(
-                    f"[BST_F] Best fitness at the start: {best_fitness} ({self.agents[idx_best]})")
-                self.logger.debug(f"[AVG_F] Average fitness at the start: {avg_fitness}")
-                number_of_food_inside_base = len([line for line in self.food_dropped_history if line[-1]])
-                self.logger.debug(f"[FOOD] Overall food dropped: {len(self.food_dropped_history)}")
-                self.logger.debug(f"[FOOD] Overall food inside base: {number_of_food_inside_base}")
-                self.logger.debug(f"[FOOD] Overall food picked: {len(self.food_picked_history)}")
-
-                if not self.deterministic:
-                    random.shuffle(
-                        self.agents)  # change order every round to simulate non deterministic order of action for every agent
-                    self.logger.debug(f"Agents order for this step: {[a.name[-1] for a in self.agents]}")
-                for agent in self.agents:
-                    if agent.name == "agent0":
-                        pass  # NOTE just a place to control and observe one agent
-                    agent.step()
-                    self.gui.update(self.board_model)
-                step_end_time = time.perf_counter()
-                duration = step_end_time - step_start_time
-                self.logger.debug(f"[TIME] Step {cnt} took {duration} s")
-                if duration < 0.2:  # NOTE Arbitrary value to make the simulation reasonably slow
-                    time.sleep(0.2 - duration)
-                self.logger.info("---------------------------------------")
+                self.simulation_step(cnt)
+                # In step mode, always show the state after the step
+                self.update_gui(force=self.stop)
+                duration = time.perf_counter() - step_start_time
+                if duration < self.min_step_duration:  # NOTE Arbitrary value to make the simulation reasonably slow
+                    time.sleep(self.min_step_duration - duration)
                 cnt += 1
                 """if cnt > 5:  # TODO oddelat stopku
                     self.stop = True
@@ -242,6 +323,141 @@ class TestBackend(Backend):
             else:
                 time.sleep(0.2)
 
+    def run_headless(self, num_of_steps):
+        """
+        Runs the given number of simulation steps as fast as possible, without GUI and without waiting for
+        the control buttons. Returns the final stats (see do_final_stats).
+        """
+        self.setup()
+        self.logger.debug(f"Number of agents: {len(self.agents)}")
+        first = self.step_number + 1  # a loaded checkpoint continues with its next step
+        for cnt in range(first, first + num_of_steps):
+            if self.end:
+                break
+            self.simulation_step(cnt)
+        self.update_gui(force=True)
+        return self.do_final_stats()
+
+    def simulation_step(self, cnt):
+        """
+        Performs one simulation step = one step of every agent.
+        """
+        self.logger.debug(f"[S{cnt}] Step number {cnt}")
+        self.step_number = cnt
+        step_start_time = time.perf_counter()
+
+        # Stats
+        fitnesses = tuple(agent.individual.fitness for agent in self.agents)
+        best_fitness = max(fitnesses)
+        idx_best = fitnesses.index(best_fitness)
+        avg_fitness = sum(fitnesses) / len(fitnesses)
+        self.fitness_history.append((avg_fitness, best_fitness))
+        self.logger.debug(
+            f"[BST_F] Best fitness at the start: {best_fitness} ({self.agents[idx_best]})")
+        self.logger.debug(f"[AVG_F] Average fitness at the start: {avg_fitness}")
+        number_of_food_inside_base = len([line for line in self.food_dropped_history if line[-1]])
+        self.logger.debug(f"[FOOD] Overall food dropped: {len(self.food_dropped_history)}")
+        self.logger.debug(f"[FOOD] Overall food inside base: {number_of_food_inside_base}")
+        self.logger.debug(f"[FOOD] Overall food picked: {len(self.food_picked_history)}")
+
+        if self.two_phase:
+            self.two_phase_step()
+            self.motion.run()
+            self.evolution.run()
+            self.update_gui()
+        else:
+            if not self.deterministic:
+                random.shuffle(
+                    self.agents)  # change order every round to simulate non deterministic order of action for every agent
+                self.logger.debug(f"Agents order for this step: {[a.name[-1] for a in self.agents]}")
+            for agent in self.agents:
+                if agent.name == "agent0":
+                    pass  # NOTE just a place to control and observe one agent
+                agent.step()
+                # GUI samples the board at most at its frame rate, not after every agent
+                self.update_gui()
+            # Agents with vectorised motion and batched evolution move and evolve together at the end of the step
+            self.motion.run()
+            self.evolution.run()
+        if self.checkpoint_every and cnt % self.checkpoint_every == 0:
+            self.checkpoint()
+        duration = time.perf_counter() - step_start_time
+        self.logger.debug(f"[TIME] Step {cnt} took {duration} s")
+        self.logger.info("---------------------------------------")
+
+    def two_phase_step(self):
+        """
+        One simulation step in two phases:
+        1) Decision: every agent does its whole step (sense, genome exchange, BT tick, fitness, evolution) against
+        the board as it was at the start of the step. Moves, pick ups and drops are not applied to the board, only
+        recorded, and the agents get optimistic responses. Agents decide one by one, in order of their names if the
+        backend is deterministic. The order does not change what the agents see, only their draws from the shared
+        random module.
+        2) Commit: the recorded actions are applied agent by agent, in order drawn by the seeded conflict_random.
+        Actions that are no longer possible (tile taken, object picked up by an agent committed earlier) are
+        rejected and the agent is told (moved back, item removed from or returned to its inventory).
+        """
+        agents = sorted(self.agents, key=lambda a: a.name) if self.deterministic else list(self.agents)
+        self.intents = {agent: [] for agent in agents}
+        positions = {agent: tuple(agent.position) for agent in agents}  # positions on the board
+        self.deferred = True
+        try:
+            for agent in agents:
+                agent.step()
+        finally:
+            self.deferred = False
+
+        order = self.conflict_random.sample(agents, len(agents))
+        self.logger.debug(f"Commit order for this step: {[a.name for a in order]}")
+        for agent in order:
+            self._commit_intents(agent, self.intents[agent], positions[agent])
+        self.intents = dict()
+
+    def _commit_intents(self, agent, intents, position):
+        for intent in intents:
+            action = intent[0]
+            if action == "move":
+                old_position, new_position = intent[1], intent[2]
+                if tuple(old_position) == position and not self.board_model.occupancy[new_position[0], new_position[1]]:
+                    self.board_model.remove_object(agent, position)
+                    self.board_model.place_object(agent, new_position)
+                    position = tuple(new_position)
+                    moved = True
+                    self.logger.debug(f"{agent.name} moved from {old_position} to {new_position}")
+                else:
+                    moved = False
+                    self.logger.debug(f"[CONFLICT] {agent.name} cannot move from {old_position} to {new_position}")
+                if self.trace:
+                    self.trace.move(agent.name, agent.steps, old_position, new_position, moved)
+            elif action == "pick":
+                pos, obj = intent[1], intent[2]
+                picked = self.board_model.get_object(pos) is obj
+                if self.trace:
+                    self.trace.pick(agent.name, agent.steps, pos, picked)
+                if picked:
+                    self.board_model.remove_object(obj, pos)
+                    self.food_picked_history.append((agent.name, list(position), pos))
+                else:
+                    self.logger.debug(f"[CONFLICT] {agent.name} cannot pick {obj} at {pos}, already picked")
+                    if obj in agent.inventory:
+                        agent.inventory.remove(obj)
+            elif action == "drop":
+                pos, into_hub, item, possible = intent[1], intent[2], intent[3], intent[4]
+                # The tile was free at the start of the step, an agent committed earlier may have taken it
+                dropped = possible and (into_hub or not self.board_model.occupancy[pos[0], pos[1]])
+                if self.trace:
+                    self.trace.drop(agent.name, agent.steps, pos, into_hub, dropped)
+                if possible and not dropped:
+                    self.logger.debug(f"[CONFLICT] {agent.name} cannot drop {item} at {pos}, tile taken")
+                    agent.inventory.append(item)
+                    continue
+                if dropped and not into_hub:
+                    FoodSource(name=f"food_dropped_by_{agent.name}", radius=0).set_place(pos, self.board_model)
+                self.food_dropped_history.append((agent.name, pos, into_hub))
+        if list(position) != list(agent.position):
+            agent.set_position(position)
+            agent.neighbourhood.valid = False
+
     def pick_up_req(self, agent, pos):
         tile = self.board_model.tiles[pos[0]][pos[1]]
         resp = PickUpResp(agent.name, None)
@@ -252,8 +468,13 @@ class TestBackend(Backend):
                 raise TypeError(f"Agent at {agent.position} wants to grab hub at {tile.position}")
 
             resp = PickUpResp(agent.name, tile.object)
+            if self.deferred:
+                self.intents[agent].append(("pick", tuple(pos), tile.object))
+                return resp
             tile.remove_object(tile.object)
             self.food_picked_history.append((agent.name, agent.position, pos))
+            if self.trace:
+                self.trace.pick(agent.name, agent.steps, pos, True)
         return resp
 
     def drop_out_resp(self, agent, req):
@@ -265,8 +486,9 @@ class TestBackend(Backend):
         cnd_food_to_hub = self.board_model.tiles[pos[0]][pos[1]].type == ObjectType.HUB and item_type == ObjectType.FOOD
         if not cnd_tile_occupied:
             if item_type == ObjectType.FOOD:
-                new_object = FoodSource(name=f"food_dropped_by_{agent.name}", radius=0)
-                new_object.set_place(pos, self.board_model)
+                if not self.deferred:  # in the decision phase, the food is placed when the drop is committed
+                    new_object = FoodSource(name=f"food_dropped_by_{agent.name}", radius=0)
+                    new_object.set_place(pos, self.board_model)
                 resp.dropped = True
             else:
                 raise TypeError("This object cannot be dropped :)")
@@ -274,6 +496,12 @@ class TestBackend(Backend):
             resp.dropped = True
             self.logger.info("{} dropped food to the base".format(agent.name, pos))
             # TODO maybe notify base that food arrived?
+        if self.deferred:
+            # Checked against the board at the start of the step, the drop may still be rejected when committed
+            self.intents[agent].append(("drop", pos, cnd_food_to_hub, agent.dropping_item, resp.dropped))
+            return resp
+        if self.trace:
+            self.trace.drop(agent.name, agent.steps, pos, cnd_food_to_hub, resp.dropped)
         self.food_dropped_history.append((agent.name, pos, cnd_food_to_hub))
         return resp
 
@@ -305,32 +533,10 @@ class TestBackend(Backend):
                 self._randomly_place_object(agent)
 
     def sense_object_neighbourhood(self, obj):
-        pos = obj.position
-        radius = obj.sense_radius
-        neighbourhood = list()
-        for r in range(obj.position[0] - radius, obj.position[0] + radius + 1):
-            row = list()
-            for c in range(obj.position[1] - radius, obj.position[1] + radius + 1):
-                # Supposing "circular" neighbourhood in square matrix -> some elements will be None:
-                # NOTE If the board should be "infinite" with wrapping, use modulo to wrap the coordinates - here,
-                #  in sense...
-
-                #  1) test for out of the board/board overflow
-                try:
-                    tile = self.board_model.tiles[r][c]
-                except IndexError:
-                    tile = None
-
-                # The same, but for "negative" AKA board underflow
-                if r < 0 or c < 0:
-                    tile = None
-
-                if tile and abs(pos[0] - tile.position[0]) + abs(pos[1] - tile.position[1]) <= radius:
-                    row.append(tile)
-                else:
-                    row.append(None)
-            neighbourhood.append(row)
-        msg = NeighbourhoodResp(obj.name, neighbourhood)
+        # Supposing "circular" neighbourhood -> only the tiles within the sense radius (and on the board) are sensed
+        # NOTE If the board should be "infinite" with wrapping, use modulo to wrap the coordinates - here,
+        #  in sense...
+        msg = NeighbourhoodResp(obj.name, SensedArea(self.board_model, obj.position, obj.sense_radius))
         return msg
 
     def move_agent(self, agent, old_position, new_position):
@@ -348,15 +554,26 @@ class TestBackend(Backend):
 
         if new_position[0] >= self.board_model.dimension or new_position[1] >= self.board_model.dimension:
             resp.position = agent.position
-        elif not self.board_model.tiles[new_position[0]][new_position[1]].occupied:
-            self.board_model.tiles[agent.position[0]][agent.position[1]].remove_object(agent)
-            agent_placed = self.board_model.tiles[new_position[0]][new_position[1]].place_object(agent)
+        elif self.deferred:
+            # Checked against the board at the start of the step, the move may still be rejected when committed
+            if not self.board_model.occupancy[new_position[0], new_position[1]]:
+                self.intents[agent].append(("move", tuple(old_position), tuple(new_position)))
+                resp.position = new_position
+            elif self.trace:
+                self.trace.move(agent.name, agent.steps, old_position, new_position, False)
+        elif not self.board_model.occupancy[new_position[0], new_position[1]]:
+            self.board_model.remove_object(agent, agent.position)
+            agent_placed = self.board_model.place_object(agent, new_position)
             if agent_placed:
                 resp.position = new_position
                 self.logger.debug(f"{agent.name} moved from {old_position} to {new_position}")
             else:
                 raise RuntimeError(f"Agent {agent.name} not placed in desired location")
+            if self.trace:
+                self.trace.move(agent.name, agent.steps, old_position, new_position, True)
         else:
             resp.position = agent.position
+            if self.trace:
+                self.trace.move(agent.name, agent.steps, old_position, new_position, False)
 
         return resp
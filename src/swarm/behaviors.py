@@ -231,6 +231,12 @@ class SetNextStep(py_trees.behaviour.Behaviour):
 
         if self.agent.goal:
             goal = self.agent.goal
+            if self.agent.GE_params["NAVIGATION"] == "fields":
+                step = self.agent.backend.navigation.next_step(goal.position, self.agent.position, self.towards)
+                if step:
+                    self.agent.next_step, heading = step
+                    self.agent.heading = heading or self.agent.heading
+                    return py_trees.common.Status.SUCCESS
             self.agent.heading = heading_from_pos(self.agent.position, goal.position, towards=self.towards)
         else:
             self.logger.warning("No goal set, not moving")
@@ -572,17 +578,29 @@ class SetGoal(py_trees.behaviour.Behaviour):
 ###
 
 class GoTo(py_trees.behaviour.Behaviour):
+    """
+    One step to the goal. With MOTION "vectorised", only the goal is set here, the step is enqueued to the
+    backend's MotionBatch (done with the other agents at the end of the simulation step) and the behaviour succeeds.
+    """
     def __init__(self, name):
         super(GoTo, self).__init__(name)
         self.bt = None
         self.item_type = None
         self.agent = None
+        self.vectorised = False  # True = no sub-tree is built (FlatBT compiles the behaviour as a leaf)
+        self.set_goal = None
 
     def setup(self, agent, item=None, item_type=None):
         self.agent = agent
         self.item_type = item_type
+        self.vectorised = agent.GE_params["MOTION"] == "vectorised"
+        if self.vectorised:
+            self.set_goal = SetGoal("GT_set_goal")
+            self.set_goal.setup(agent, item_type=item_type)
 
     def initialise(self):
+        if self.vectorised:
+            return
         set_goal = SetGoal("GT_set_goal")
         set_goal.setup(self.agent, item_type=self.item_type)
 
@@ -597,6 +615,11 @@ class GoTo(py_trees.behaviour.Behaviour):
         self.bt = py_trees.trees.BehaviourTree(root=sequence)
 
     def update(self):
+        if self.vectorised:
+            if self.set_goal.update() != py_trees.common.Status.SUCCESS:
+                return py_trees.common.Status.FAILURE
+            self.agent.backend.motion.request_goal(self.agent, self.agent.goal.position, towards=True)
+            return py_trees.common.Status.SUCCESS
         self.bt.tick()
         return self.bt.root.status
 
@@ -605,17 +628,29 @@ class GoTo(py_trees.behaviour.Behaviour):
 
 
 class GoAway(py_trees.behaviour.Behaviour):
+    """
+    One step away from the goal. With MOTION "vectorised", only the goal is set here, the step is enqueued to the
+    backend's MotionBatch (done with the other agents at the end of the simulation step) and the behaviour succeeds.
+    """
     def __init__(self, name):
         super(GoAway, self).__init__(name)
         self.bt = None
         self.item_type = None
         self.agent = None
+        self.vectorised = False  # True = no sub-tree is built (FlatBT compiles the behaviour as a leaf)
+        self.set_goal = None
 
     def setup(self, agent, item=None, item_type=None):
         self.agent = agent
         self.item_type = item_type
+        self.vectorised = agent.GE_params["MOTION"] == "vectorised"
+        if self.vectorised:
+            self.set_goal = SetGoal("GA_set_goal")
+            self.set_goal.setup(agent, item_type=item_type)
 
     def initialise(self):
+        if self.vectorised:
+            return
         set_goal = SetGoal("GA_set_goal")
         set_goal.setup(self.agent, item_type=self.item_type)
         set_next_step = SetNextStep("GA_setnextstep")
@@ -629,6 +664,11 @@ class GoAway(py_trees.behaviour.Behaviour):
         self.bt = py_trees.trees.BehaviourTree(root=sequence)
 
     def update(self):
+        if self.vectorised:
+            if self.set_goal.update() != py_trees.common.Status.SUCCESS:
+                return py_trees.common.Status.FAILURE
+            self.agent.backend.motion.request_goal(self.agent, self.agent.goal.position, towards=False)
+            return py_trees.common.Status.SUCCESS
         self.bt.tick()
         return self.bt.root.status
 
@@ -641,11 +681,20 @@ class GoAway(py_trees.behaviour.Behaviour):
 ###
 
 class PPARandomWalk(py_trees.behaviour.Behaviour): 
+    """
+    Random walk step. With MOTION "vectorised", the walk is only enqueued to the backend's MotionBatch (done with
+    the other agents at the end of the simulation step) and the behaviour succeeds.
+    """
     def __init__(self, name):
         super(PPARandomWalk, self).__init__(name)
         self.bt = None
+        self.agent = None
+        self.change_prob = None
+        self.vectorised = False  # True = no sub-tree is ticked (FlatBT compiles the behaviour as a leaf)
 
     def setup(self, agent, item=None, item_type=None):
+        self.agent = agent
+        self.vectorised = agent.GE_params["MOTION"] == "vectorised"
         rw = RandomWalk(name="PPA_random_walk_random_walk")
         rw.setup(agent, item, item_type)
         sns = SetNextStep(name="PPA_random_walk_next_step")
@@ -658,11 +707,15 @@ class PPARandomWalk(py_trees.behaviour.Behaviour):
         sequence.add_children([rw, sns, move])
 
         self.bt = py_trees.trees.BehaviourTree(root=sequence)
+        self.change_prob = rw.change_prob
 
     def initialise(self):
         pass
 
     def update(self):
+        if self.vectorised:
+            self.agent.backend.motion.request(self.agent, self.change_prob)
+            return py_trees.common.Status.SUCCESS
         self.bt.tick()
         return self.bt.root.status
 
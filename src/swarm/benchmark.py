@@ -0,0 +1,169 @@
+"""
+Scalability benchmarks of the swarm simulation.
+
+Every scenario (SCENARIOS) is a headless TestBackend run with the given number of agents, board size and sense radius,
+done in a fresh process (so peak RSS is the scenario's own). Measured are steps per second, time spent in the phases
+of the simulation (PhaseTimer), peak RSS and percentiles of the evolution step latency (time of all the evolution
+phases of one agent in one step):
+
+    python -m swarm.benchmark [--scenarios NAME ...] [--output results.json] [--baseline baseline.json]
+
+The results (JSON) of one run serve as the baseline of the next ones: with --baseline, every metric in THRESHOLDS is
+compared to the baseline and the benchmark fails (exit status 1) if a scenario got worse by more than the threshold
+(relative change, --threshold overrides all of them).
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+# name -> TestBackend run; params override the params file, evolution is made frequent enough for the short runs
+SCENARIOS = {
+    "agents10_board50": {"agents": 10, "board_size": 50, "sense_radius": 10, "steps": 60},
+    "agents100_board200": {"agents": 100, "board_size": 200, "sense_radius": 10, "steps": 30},
+    "agents100_board200_radius5": {"agents": 100, "board_size": 200, "sense_radius": 5, "steps": 30},
+    "agents100_board200_radius20": {"agents": 100, "board_size": 200, "sense_radius": 20, "steps": 30},
+    "agents100_board1000": {"agents": 100, "board_size": 1000, "sense_radius": 10, "steps": 30},
+    "agents1000_board1000": {"agents": 1000, "board_size": 1000, "sense_radius": 10, "steps": 12},
+}
+SCENARIO_PARAMS = {"MIN_STEPS_WITHOUT_EVOLUTION": 5, "MAX_STEPS_WITHOUT_EVOLUTION": 10}
+EVOLUTION_PHASES = ("selection", "crossover", "mutation", "attribute_check", "evaluation", "replacement")
+# metric -> (allowed relative change, True if higher is better)
+THRESHOLDS = {
+    "steps_per_second": (0.2, True),
+    "peak_rss": (0.2, False),
+    "evolution_p50": (0.3, False),
+    "evolution_p95": (0.3, False),
+}
+
+
+def run_scenario(name, param_file, seed=1):
+    """
+    Runs the scenario in the calling process and returns its metrics.
+    """
+    from swarm.backend import TestBackend
+    from swarm.profiling import PHASE_CODES
+
+    scenario = SCENARIOS[name]
+    sys.argv = sys.argv[:1]  # PonyGE would parse the benchmark's arguments
+    params = dict(SCENARIO_PARAMS, LOG_FOLDER=f"benchmark/{name}", RANDOM_SEED=seed)
+    backend = TestBackend(None, deterministic=True, level=logging.WARNING, dimension=scenario["board_size"],
+                          seed=seed, timing=True, params=params)
+
+    start = time.perf_counter()
+    # Food placed relative to the board (the default position is for boards of 40-100 tiles)
+    food_position = (scenario["board_size"] // 5, scenario["board_size"] // 5)
+    backend.setup_simulation(scenario["agents"], param_file, sense_radius=scenario["sense_radius"],
+                             food_position=food_position)
+    backend.setup()
+    setup_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for cnt in range(1, scenario["steps"] + 1):
+        backend.simulation_step(cnt)
+    duration = time.perf_counter() - start
+
+    timer = backend.timer
+    summary = timer.summary()
+    phases = dict()
+    for totals in summary["per_owner"].values():
+        for phase, values in totals.items():
+            phases[phase] = phases.get(phase, 0.0) + values["wall"]
+
+    steps, owners, phase_codes, wall, _ = timer.records()
+    evolution = np.isin(phase_codes, [PHASE_CODES[phase] for phase in EVOLUTION_PHASES])
+    latencies = dict()  # (owner, step) -> time of the evolution step
+    for key, value in zip(zip(owners[evolution].tolist(), steps[evolution].tolist()), wall[evolution].tolist()):
+        latencies[key] = latencies.get(key, 0.0) + value
+    latencies = np.array(list(latencies.values()))
+
+    return {
+        "scenario": dict(scenario, params=SCENARIO_PARAMS, param_file=param_file, seed=seed),
+        "setup_time": setup_time,
+        "duration": duration,
+        "steps_per_second": scenario["steps"] / duration,
+        "phases": phases,
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,  # kB
+        "evolution_steps": len(latencies),
+        "evolution_p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "evolution_p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+        "evolution_p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+    }
+
+
+def run_benchmark(names, param_file, seed=1):
+    """
+    Runs the scenarios one after another, each in a new process. Returns the results with the environment.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = dict()
+    for name in names:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(run_scenario, (name, param_file, seed))
+        print(f"{name}: {results[name]['steps_per_second']:.2f} steps/s, peak RSS {results[name]['peak_rss']} kB, "
+              f"evolution p95 {results[name]['evolution_p95']} s", file=sys.stderr)
+    return {"environment": {"python": platform.python_version(), "numpy": np.__version__,
+                            "machine": platform.machine(), "cpus": os.cpu_count()},
+            "results": results}
+
+
+def compare(results, baseline, threshold=None):
+    """
+    Returns list of regressions (scenario, metric, baseline value, value, relative change) of the results against
+    the baseline. Scenarios and metrics missing in either of them are skipped.
+    """
+    regressions = list()
+    for name, result in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        if base["scenario"] != result["scenario"]:
+            print(f"{name}: scenario differs from the baseline, not compared", file=sys.stderr)
+            continue
+        for metric, (allowed, higher_is_better) in THRESHOLDS.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > (allowed if threshold is None else threshold):
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Runs scalability benchmarks of the swarm simulation.")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS),
+                        help="scenarios to run (default: all)")
+    parser.add_argument("--param-file", default="AG_params.txt", help="params file of the agents")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="file to write the results to (usable as a baseline)")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, help="allowed relative change of all the metrics "
+                                                        "(default: per metric, see THRESHOLDS)")
+    args = parser.parse_args(args)
+
+    results = run_benchmark(args.scenarios, args.param_file, args.seed)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, old, new, change in regressions:
+            print(f"REGRESSION {name} {metric}: {old:.4g} -> {new:.4g} ({change:+.1%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 """This is the mapper class which maps the xml file."""
 
 
+from collections import OrderedDict
+from threading import Lock
 from typing import Type
 import xml.etree.ElementTree as ET
 import py_trees
@@ -24,6 +26,7 @@ from swarms.behaviors.sbehaviors import (       # noqa: F401
     )
 """
 import swarm.types as types
+from swarm.flatbt import FlatBT
 from swarm.behaviors import ( # noqa 401
     IsVisitedBefore,
     ObjectAtDist as NeighbourObjects,
@@ -41,6 +44,57 @@ from swarm.behaviors import ( # noqa 401
 
 from py_trees.decorators import SuccessIsRunning, Inverter
 
+# Blueprints of already built trees shared by all agents in a process, keyed by phenotype, least recently used first.
+BLUEPRINT_CACHE_SIZE = 512
+blueprint_cache = OrderedDict()
+blueprint_cache_lock = Lock()
+
+
+class BTBlueprint:
+    """Factory plan of a behaviour tree, recorded when the tree is built from xml for the first time.
+
+    ops are the nodes in the order they were created (which is also the order of the random numbers drawn
+    for their names), children holds the final children of every composite (indices to ops).
+    """
+
+    def __init__(self, root_tag, ops, children, root_children):
+        self.root_tag = root_tag
+        self.ops = ops
+        self.children = children
+        self.root_children = root_children
+
+    def instantiate(self, agent):
+        """Create fresh nodes for the agent and wire them to the same tree as the recorded one."""
+        nodes = []
+        for op in self.ops:
+            if op[0] == "leaf":
+                _, behaviour_class, method, item, inverted, tag = op
+                nodes.append(BTConstruct.make_leaf(agent, behaviour_class, method, item, inverted, tag))
+            else:
+                _, composite_class, tag = op
+                nodes.append(BTConstruct.make_composite(agent, composite_class, tag))
+        for idx, children in self.children.items():
+            nodes[idx].add_children([nodes[child] for child in children])
+        top = eval(self.root_tag)('Root' + self.root_tag, memory=True if self.root_tag == "Sequence" else False)
+        top.add_children([nodes[child] for child in self.root_children])
+        return py_trees.trees.BehaviourTree(top)
+
+
+def get_blueprint(phenotype):
+    with blueprint_cache_lock:
+        blueprint = blueprint_cache.get(phenotype)
+        if blueprint is not None:
+            blueprint_cache.move_to_end(phenotype)
+        return blueprint
+
+
+def store_blueprint(phenotype, blueprint):
+    with blueprint_cache_lock:
+        blueprint_cache[phenotype] = blueprint
+        blueprint_cache.move_to_end(phenotype)
+        while len(blueprint_cache) > BLUEPRINT_CACHE_SIZE:
+            blueprint_cache.popitem(last=False)
+
 
 class BTConstruct:
     """Mapper to map from xml to BT.
@@ -60,6 +114,7 @@ class BTConstruct:
         self.filename = filename
         self.xmlstring = xmlstring
         self.agent = agent
+        self.flat_tree = None
 
     def xmlfy(self):
         """Convert [] to <>."""
@@ -67,8 +122,37 @@ class BTConstruct:
         self.xmlstring = self.xmlstring.replace(']', '>')
         self.xmlstring = self.xmlstring.replace('%', '"')
 
-    def create_bt(self, root):
-        """Recursive method to construct BT."""
+    @staticmethod
+    def make_leaf(agent, behaviour_class, method, item, inverted, tag):
+        """Create and set up a leaf behaviour (wrapped in Inverter if inverted)."""
+        if item is None:
+            behavior = behaviour_class(method + str(agent.backend.random.randint(100, 200)))
+            behavior.setup(agent=agent)
+        elif not inverted:
+            behavior = behaviour_class(method + str(
+                agent.backend.random.randint(
+                    100, 200)) + '_' + item + '_' + tag)
+            behavior.setup(agent=agent, item_type=types.ObjectType.str2enum(item))
+        else:
+            behavior = behaviour_class(
+                method + str(
+                    agent.backend.random.randint(
+                        100, 200)) + '_' + item + '_inv' + '_' + tag)
+            behavior.setup(agent=agent, item_type=types.ObjectType.str2enum(item))
+            behavior = Inverter(name="Inverter", child=behavior)
+            behavior.setup()
+        return behavior
+
+    @staticmethod
+    def make_composite(agent, composite_class, tag):
+        return composite_class(tag + str(
+            agent.backend.random.randint(10, 90)), memory=True if tag == "Sequence" else False)
+
+    def create_bt(self, root, ops=None):
+        """Recursive method to construct BT.
+
+        If ops is given, every created node is recorded there (see BTBlueprint).
+        """
         #print('root',root, len(root))
         def leafnode(root):
             node_text = root.text
@@ -78,29 +162,17 @@ class BTConstruct:
                 # Check for behavior inversion
                 if len(nodeval) == 2:
                     method, item = nodeval
-                    behavior = eval(method)(method + str(
-                        self.agent.backend.random.randint(
-                            100, 200)) + '_' + item + '_' + root.tag)
-                    item = types.ObjectType.str2enum(item)
-                    behavior.setup(agent=self.agent, item_type=item)
+                    inverted = False
                 else:
                     method, item, _ = nodeval
-                    behavior = eval(method)(
-                        method + str(
-                            self.agent.backend.random.randint(
-                                100, 200)) + '_' + item + '_inv' + '_' + root.tag)
-                    item = types.ObjectType.str2enum(item)
-                    behavior.setup(agent=self.agent, item_type=item)
-                    behavior = Inverter(name="Inverter", child=behavior)
-                    behavior.setup()
-                if type(item) is str:
-                    item = types.ObjectType.str2enum(item)
-
+                    inverted = True
             else:
-                method = node_text
-                behavior = eval(method)(method + str(
-                    self.agent.backend.random.randint(100, 200)))
-                behavior.setup(agent=self.agent)
+                method, item, inverted = node_text, None, False
+            behaviour_class = eval(method)
+            behavior = self.make_leaf(self.agent, behaviour_class, method, item, inverted, root.tag)
+            if ops is not None:
+                ops.append(("leaf", behaviour_class, method, item, inverted, root.tag))
+                self._recorded[id(behavior)] = len(ops) - 1
             return behavior
 
         if len(list(root)) == 0:
@@ -109,10 +181,12 @@ class BTConstruct:
             list1 = []
             for node in list(root):
                 if node.tag in ['Selector', 'Sequence']:
-                    composits = eval(node.tag)(node.tag + str(
-                        self.agent.backend.random.randint(10, 90)), memory=True if node.tag == "Sequence" else False)
+                    composits = self.make_composite(self.agent, eval(node.tag), node.tag)
+                    if ops is not None:
+                        ops.append(("composite", eval(node.tag), node.tag))
+                        self._recorded[id(composits)] = len(ops) - 1
                     # print('composits', composits, node)
-                list1.append(self.create_bt(node))
+                list1.append(self.create_bt(node, ops))
                 try:
                     if composits:
                         nodepop = list1.pop()
@@ -126,8 +200,22 @@ class BTConstruct:
                     pass
             return list1
 
-    def bt_from_xml(self):
-        """Create a tree from xml."""
+    def bt_from_xml(self, flat=False):
+        """Create a tree from xml.
+
+        Trees built from xmlstring (phenotype) are recorded as blueprints, the next tree with the same phenotype
+        is created from the blueprint without parsing the xml.
+        If flat is set, the tree is also compiled to FlatBT, which is then ticked instead of the py_trees tree.
+        """
+        phenotype = self.xmlstring
+        if phenotype is not None:
+            blueprint = get_blueprint(phenotype)
+            if blueprint is not None:
+                self.behaviour_tree = blueprint.instantiate(self.agent)
+                self.root = None
+                self.flat_tree = FlatBT(self.behaviour_tree) if flat else None
+                return
+
         if self.xmlstring is not None:
             self.xmlfy()
             tree = ET.fromstring(self.xmlstring)
@@ -140,15 +228,31 @@ class BTConstruct:
             print("Cannot create BT. Check the filename or stream")
             exit()
         # print('root tree', self.root)
-        whole_list = self.create_bt(self.root)
+        ops = [] if phenotype is not None else None
+        self._recorded = dict()
+        whole_list = self.create_bt(self.root, ops)
         top = eval(self.root.tag)('Root' + self.root.tag,memory=True if self.root.tag == "Sequence" else False)
         # print('whole list', whole_list)
         # print(dir(top))
         top.add_children(whole_list)
         self.behaviour_tree = py_trees.trees.BehaviourTree(top)
+        if ops is not None:
+            children = {self._recorded[id(node)]: tuple(self._recorded[id(child)] for child in node.children)
+                        for node in top.iterate() if node is not top and id(node) in self._recorded
+                        and isinstance(node, py_trees.composites.Composite)}
+            store_blueprint(phenotype, BTBlueprint(self.root.tag, ops, children,
+                                                   tuple(self._recorded[id(child)] for child in top.children)))
+        self._recorded = dict()
+        self.flat_tree = FlatBT(self.behaviour_tree) if flat else None
         # py_trees.logging.level = py_trees.logging.Level.DEBUG
         # py_trees.display.print_ascii_tree(top)
 
+    def tick(self):
+        if self.flat_tree is not None:
+            self.flat_tree.tick()
+        else:
+            self.behaviour_tree.tick()
+
     def visualize(self, name='bt.png', mode="d"):
         """Save bt graph to a file."""
         if mode == "d": # display
@@ -0,0 +1,353 @@
+"""
+Checkpoints of the whole simulation (TestBackend with its board and agents).
+
+A checkpoint is one compressed .npz file: the board layers, local maps and genomes are stored as arrays, everything
+else (objects, agents' scalar state, histories, states of the random generators) as one JSON document under "meta".
+Individuals are stored as genomes with their phenotype and fitness and mapped again when loaded, behaviour trees are
+built again from the phenotypes and get back the statuses and current children of their nodes (read by the BT
+feedback fitness and the composites) and the per-behaviour attributes listed in BEHAVIOUR_STATE.
+
+    save_checkpoint(backend, "warm.npz")
+    backend = load_checkpoint("warm.npz")  # resume
+    variant = load_checkpoint("warm.npz", params={"EVOLUTION": "batched"})  # fork with changed parameters
+"""
+import json
+import os
+import random
+
+import numpy as np
+from py_trees.common import Status
+
+from representation.individual import Individual
+from swarm.agent import EvoAgent
+from swarm.math import DecayedSum
+from swarm.models import NO_OBJECT
+from swarm.neighbourhood import LocalMap
+from swarm.objects import EnvironmentObject, FoodSource, Hub
+from swarm.population import HEADINGS, heading_code, NO_HEADING
+from swarm.types import ObjectType, Color
+
+FORMAT_VERSION = 2
+BEHAVIOUR_STATE = ("last_time_failed", "running")  # attributes of behaviours kept between the steps
+OBJECT_CLASSES = {cls.__name__: cls for cls in (EnvironmentObject, FoodSource, Hub)}
+
+
+def _behaviours(node, path="", built=()):
+    """
+    (path, behaviour) of all the behaviours of the tree including sub-trees of the PPA behaviours. The path is made
+    of the child indices, "bt" steps into the sub-tree of a PPA behaviour. GoTo, GoAway, PPAMoveTowards and
+    PPAMoveAway build their sub-trees when initialised - the sub-trees with paths in built are built first.
+    """
+    yield path, node
+    bt_path = path + "/bt"
+    if getattr(node, "bt", False) is None and bt_path in built:
+        node.initialise()
+    for idx, child in enumerate(node.children):
+        yield from _behaviours(child, f"{path}/{idx}", built)
+    if getattr(node, "bt", None) is not None:
+        yield from _behaviours(node.bt.root, bt_path, built)
+
+
+def _tree_state(bt_wrapper):
+    """
+    [status, index of the current child, *BEHAVIOUR_STATE] of every slot of the flat tree, or of every node of the
+    tree by its path (see _behaviours).
+    """
+    flat = bt_wrapper.flat_tree
+    if flat is not None:
+        return [[flat.status[idx].name, flat.current[idx]] + [getattr(node, name, None) for name in BEHAVIOUR_STATE]
+                for idx, node in enumerate(flat.behaviours)]
+    state = dict()
+    for path, node in _behaviours(bt_wrapper.behaviour_tree.root):
+        current = getattr(node, "current_child", None)
+        state[path] = [node.status.name, node.children.index(current) if current is not None else None] + \
+                      [getattr(node, name, None) for name in BEHAVIOUR_STATE]
+    return state
+
+
+def _restore_tree_state(bt_wrapper, state):
+    flat = bt_wrapper.flat_tree
+    if flat is not None:
+        if len(state) != len(flat.behaviours):
+            raise ValueError(f"Saved state of {len(state)} behaviours does not match the flat tree of "
+                             f"{len(flat.behaviours)} behaviours")
+        nodes = dict(enumerate(flat.behaviours))
+        state = dict(enumerate(state))
+    else:
+        nodes = dict(_behaviours(bt_wrapper.behaviour_tree.root, built=state))
+        if nodes.keys() != state.keys():
+            raise ValueError(f"Saved state of behaviours {sorted(state.keys() - nodes.keys())} and the restored "
+                             f"behaviours {sorted(nodes.keys() - state.keys())} do not match")
+    for key, values in state.items():
+        node = nodes[key]
+        status, current = Status[values[0]], values[1]
+        if flat is not None:
+            flat.status[key], flat.current[key] = status, current
+        else:
+            node.status = status
+            if hasattr(node, "current_child"):
+                node.current_child = node.children[current] if current is not None else None
+        for name, value in zip(BEHAVIOUR_STATE, values[2:]):
+            if value is not None and hasattr(node, name):
+                setattr(node, name, value)
+
+
+class _Pool:
+    """
+    Individuals of all the agents, each stored once (individuals shared by several lists keep being shared).
+    """
+    def __init__(self):
+        self.records = list()
+        self.genomes = list()
+        self._index_of = dict()  # id(individual) -> record index
+
+    def add(self, ind):
+        if ind is None:
+            return None
+        idx = self._index_of.get(id(ind))
+        if idx is None:
+            idx = self._index_of[id(ind)] = len(self.records)
+            fitness = ind.fitness
+            self.records.append({"phenotype": ind.phenotype, "invalid": bool(ind.invalid), "shared": ind.shared,
+                                 "fitness": None if np.any(np.isnan(fitness)) else fitness})
+            self.genomes.append(np.asarray(ind.genome, dtype=np.int64))
+        return idx
+
+
+def save_checkpoint(backend, filename):
+    """
+    Writes the state of the simulation to the file (written to a temporary file first, so a crash while saving
+    keeps the previous checkpoint).
+    """
+    board = backend.board_model
+    arrays = {"types": board.types, "object_ids": board.object_ids, "occupancy": board.occupancy}
+
+    objects = list()  # descriptions of the objects other than agents
+    object_index = dict()  # object -> index to objects
+
+    def object_ref(obj):
+        if isinstance(obj, EvoAgent):
+            return {"agent": obj.name}
+        idx = object_index.get(obj)
+        if idx is None:
+            idx = object_index[obj] = len(objects)
+            objects.append({"class": type(obj).__name__, "name": obj.name, "type": obj.type.name,
+                            "radius": obj.radius, "placed": obj.placed,
+                            "position": [list(p) for p in obj.position] if obj.placed else list(obj.position),
+                            "food_limit": getattr(obj, "food_limit", None)})
+        return {"object": idx}
+
+    table = [None] + [object_ref(obj) if obj is not None else None for obj in board.object_table[1:]]
+
+    pool = _Pool()
+    agents = list()
+    store = backend.motion.store
+    for i, agent in enumerate(backend.agents):
+        local_map = agent.local_map
+        chunk_keys = sorted(local_map.chunks)
+        arrays[f"agent{i}_chunk_keys"] = np.array(chunk_keys, dtype=np.int32).reshape(-1, 2)
+        arrays[f"agent{i}_chunks"] = np.array([local_map.chunks[key] for key in chunk_keys], dtype=np.int32) \
+            .reshape(-1, local_map.chunk_size, local_map.chunk_size)
+        history = agent.position_history
+        arrays[f"agent{i}_history"] = np.array([(r, c, step) for (r, c), step in history.items()],
+                                               dtype=np.int64).reshape(-1, 3)
+        agents.append({
+            "name": agent.name, "sense_radius": agent.sense_radius, "max_speed": agent.max_speed,
+            "color": agent.color.name, "exchange_prob": agent.exchange_prob,
+            "genome_storage_threshold": agent.genotype_storage_threshold, "param_file": agent.param_file,
+            "position": list(agent.position),
+            "heading": [heading_code(h) for h in agent.heading] if isinstance(agent.heading, list)
+            else heading_code(agent.heading),
+            "goal": list(agent.goal.position) if agent.goal else None,
+            "next_step": list(agent.next_step) if agent.next_step else None,
+            "inventory": [object_ref(item) for item in agent.inventory],
+            "dropping_item": object_ref(agent.dropping_item) if agent.dropping_item else None,
+            "objects_of_interest": {item_type.name: [list(tile.position) for tile in tiles]
+                                    for item_type, tiles in agent.objects_of_interest.items() if tiles is not None},
+            "steps": agent.steps, "steps_without_evolution": agent.steps_without_evolution,
+            "exploration_sum": [agent.exploration_sum.total, agent.exploration_sum.step],
+            "local_map_objects": {obj_type.name: [list(pos) for pos in local_map.objects.positions(obj_type)]
+                                  for obj_type in ObjectType},
+            "individual": pool.add(agent.individual),
+            "individuals": [pool.add(ind) for ind in agent.individuals],
+            "exchanged_individuals": {name: pool.add(ind) for name, ind in agent.exchanged_individuals.items()},
+            "num_of_truly_exchanged_individuals": agent.num_of_truly_exchanged_individuals,
+            "walk_failed": bool(store.failed[store.index_of(agent)]) if agent in store else None,
+            "behaviour_state": _tree_state(agent.bt_wrapper) if agent.bt_wrapper.behaviour_tree else None,
+        })
+
+    arrays["genome_lengths"] = np.array([len(genome) for genome in pool.genomes], dtype=np.int64)
+    arrays["genomes"] = np.concatenate(pool.genomes) if pool.genomes else np.zeros(0, dtype=np.int64)
+    version, state, gauss = random.getstate()
+    arrays["random_state"] = np.array(state, dtype=np.uint64)
+    conflict_version, conflict_state, conflict_gauss = backend.conflict_random.getstate()
+    arrays["conflict_random_state"] = np.array(conflict_state, dtype=np.uint64)
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "dimension": board.dimension, "param_file": backend.param_file, "params": backend.params,
+        "seed": backend.seed, "deterministic": backend.deterministic, "step_number": backend.step_number,
+        "objects": objects, "object_table": table, "images": [[list(pos), image] for pos, image in board.images.items()],
+        "board_objects": {name: [object_ref(obj) for obj in objs] for name, objs in board.objects.items()},
+        "agents": agents, "individuals": pool.records,
+        "food_picked_history": [[name, list(agent_position), list(position)]
+                                for name, agent_position, position in backend.food_picked_history],
+        "food_dropped_history": [[name, list(position), into_hub]
+                                 for name, position, into_hub in backend.food_dropped_history],
+        "fitness_history": [list(line) for line in backend.fitness_history],
+        "random": [version, gauss], "conflict_random": [conflict_version, conflict_gauss],
+        "motion_random": backend.motion.rng.bit_generator.state,
+    }
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+
+    tmp = f"{filename}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp, filename)
+
+
+def load_checkpoint(filename, gui=None, params=None, **kwargs):
+    """
+    Creates TestBackend with the simulation state from the checkpoint, ready to continue from the next step
+    (call setup() and run_headless()/run() as usual).
+
+    :param gui: SimulationWindow or None for a headless run.
+    :param params: GE parameters (name -> value) overriding the ones of the params file (and of the checkpoint),
+    e.g. to fork one checkpoint into variants.
+    :param kwargs: Further TestBackend arguments; seed and deterministic default to the ones of the saved backend.
+    """
+    from swarm.backend import TestBackend
+
+    with np.load(filename) as data:
+        arrays = {key: data[key] for key in data.files}
+    meta = json.loads(arrays["meta"].tobytes().decode())
+    if meta["version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {meta['version']}")
+
+    overrides = dict(meta["params"] or {})
+    overrides.update(params or {})
+    kwargs.setdefault("seed", meta["seed"])
+    kwargs.setdefault("deterministic", meta["deterministic"])
+    backend = TestBackend(gui, dimension=meta["dimension"], params=overrides, **kwargs)
+    backend.param_file = meta["param_file"]
+    backend.step_number = meta["step_number"]
+    backend.new_board()
+
+    # Objects
+    objects = list()
+    for description in meta["objects"]:
+        obj = OBJECT_CLASSES[description["class"]](description["name"], ObjectType[description["type"]],
+                                                   description["radius"])
+        obj.placed = description["placed"]
+        obj.position = [tuple(p) for p in description["position"]] if obj.placed else description["position"]
+        if description["food_limit"] is not None:
+            obj.food_limit = description["food_limit"]
+        objects.append(obj)
+
+    # Agents
+    agents = dict()
+    for description in meta["agents"]:
+        agent = EvoAgent(description["name"], sense_radius=description["sense_radius"],
+                         max_speed=description["max_speed"], color=Color[description["color"]],
+                         exchange_prob=description["exchange_prob"],
+                         genome_storage_threshold=description["genome_storage_threshold"],
+                         params_file=description["param_file"])
+        agents[agent.name] = agent
+        backend.agents.append(agent)
+        backend.motion.store.add(agent)
+        agent.backend = backend
+        agent.load_GE_params(overrides)
+
+    def resolve(ref):
+        if ref is None:
+            return None
+        return agents[ref["agent"]] if "agent" in ref else objects[ref["object"]]
+
+    # Board
+    board = backend.board_model
+    table = [resolve(ref) for ref in meta["object_table"]]
+    board.set_object_table(table)  # same object ids as saved
+    object_ids = arrays["object_ids"]
+    for r, c in np.argwhere(object_ids != NO_OBJECT).tolist():
+        board.place_object(table[object_ids[r, c]], (r, c))
+    for obj in objects:
+        if obj.placed:
+            obj.tiles = [board.tile(r, c) for r, c in obj.position]
+    board.images = {tuple(pos): image for pos, image in meta["images"]}
+    board.objects = {name: [resolve(ref) for ref in refs] for name, refs in meta["board_objects"].items()}
+
+    # Individuals
+    offsets = np.concatenate(([0], np.cumsum(arrays["genome_lengths"])))
+    genomes = arrays["genomes"]
+    records = meta["individuals"]
+    individuals = dict()  # record index of a shared individual, or (agent name, record index) -> individual
+
+    def individual(agent, idx):
+        if idx is None:
+            return None
+        key = idx if records[idx]["shared"] else (agent.name, idx)
+        ind = individuals.get(key)
+        if ind is None:
+            record = records[idx]
+            ind = Individual(genomes[offsets[idx]:offsets[idx + 1]].tolist(), None, agent=agent)
+            ind.phenotype, ind.invalid = record["phenotype"], record["invalid"]
+            if record["fitness"] is not None:
+                ind.fitness = record["fitness"]
+            if record["shared"]:
+                ind = ind.snapshot()
+            individuals[key] = ind
+        return ind
+
+    for i, description in enumerate(meta["agents"]):
+        agent = agents[description["name"]]
+        agent.set_position(description["position"])
+        heading = description["heading"]
+        if isinstance(heading, list):  # broad heading
+            agent.heading = [HEADINGS[code] for code in heading]
+        else:
+            agent.heading = None if heading == NO_HEADING else HEADINGS[heading]
+        agent.goal = board.tile(*description["goal"]) if description["goal"] else None
+        agent.next_step = tuple(description["next_step"]) if description["next_step"] else None
+        agent.inventory = [resolve(ref) for ref in description["inventory"]]
+        agent.dropping_item = resolve(description["dropping_item"])
+        agent.objects_of_interest = {ObjectType[name]: [board.tile(*pos) for pos in positions]
+                                     for name, positions in description["objects_of_interest"].items()}
+        agent.steps = description["steps"]
+        agent.steps_without_evolution = description["steps_without_evolution"]
+        agent.exploration_sum = DecayedSum(agent.exploration_fitness_coeff["a"], agent.exploration_fitness_coeff["b"])
+        agent.exploration_sum.total, agent.exploration_sum.step = description["exploration_sum"]
+        agent.position_history = {(r, c): step for r, c, step in arrays[f"agent{i}_history"].tolist()}
+
+        agent.setup_logging()
+        local_map = agent.local_map = LocalMap(agent, board.dimension)
+        local_map.board = board
+        for key, chunk in zip(arrays[f"agent{i}_chunk_keys"].tolist(), arrays[f"agent{i}_chunks"]):
+            local_map.chunks[tuple(key)] = chunk.copy()
+        for name, positions in description["local_map_objects"].items():
+            for pos in positions:
+                local_map.objects.add(ObjectType[name], pos)
+
+        agent.individual = individual(agent, description["individual"])
+        agent.individuals = [individual(agent, idx) for idx in description["individuals"]]
+        agent.exchanged_individuals = {name: individual(agent, idx)
+                                       for name, idx in description["exchanged_individuals"].items()}
+        agent.num_of_truly_exchanged_individuals = description["num_of_truly_exchanged_individuals"]
+        agent.build_bt()
+        if description["walk_failed"] is not None:
+            backend.motion.store.failed[backend.motion.store.index_of(agent)] = description["walk_failed"]
+        if description["behaviour_state"]:
+            _restore_tree_state(agent.bt_wrapper, description["behaviour_state"])
+
+    # Histories
+    backend.food_picked_history = [(name, agent_position, tuple(position))
+                                   for name, agent_position, position in meta["food_picked_history"]]
+    backend.food_dropped_history = [(name, tuple(position), into_hub)
+                                    for name, position, into_hub in meta["food_dropped_history"]]
+    backend.fitness_history = [tuple(line) for line in meta["fitness_history"]]
+
+    # Random generators last, agents reseed the random module when loading their parameters
+    random.setstate((meta["random"][0], tuple(arrays["random_state"].tolist()), meta["random"][1]))
+    backend.conflict_random.setstate((meta["conflict_random"][0], tuple(arrays["conflict_random_state"].tolist()),
+                                      meta["conflict_random"][1]))
+    backend.motion.rng.bit_generator.state = meta["motion_random"]
+    return backend
@@ -81,6 +81,20 @@ default_params = {
     # Boolean flag for selecting whether or not mutation is confined to
     # within the used portion of the genome. Default set to True.
     'WITHIN_USED': True,
+    # Map the genomes created by initialisation, crossover and mutation
+    # together (algorithm.mapper.map_population) instead of one by one.
+    # Only for linear genome operations (GENOME_OPERATIONS). Individuals
+    # failing the checks of crossover/mutation are then redone after the
+    # whole population, so runs differ from the unbatched ones.
+    'BATCH_MAPPING': False,
+    # Record the state of the mapping every MAPPING_CHECKPOINTS codons, so
+    # that offspring of linear genome operations are re-mapped from the last
+    # state before the first changed codon. 0 = no checkpoints.
+    'MAPPING_CHECKPOINTS': 8,
+    # Store derivation trees as arrays (representation.arena_tree) instead
+    # of a Tree object per node. Only for subtree operations without
+    # attribute grammars.
+    'ARENA_TREES': False,
 
     # CROSSOVER
     # Set crossover operator.
@@ -184,6 +198,17 @@ default_params = {
     # Interaction Probability: how frequently the agents can interaction with
     # each other
     'INTERACTION_PROBABILITY': 0.5,
+    # Executor of the agents' behaviour trees: "py_trees" or "flat" (swarm.flatbt.FlatBT)
+    'BT_EXECUTOR': "py_trees",
+    # How agents step towards/away from hub and food: "greedy" (heading to the goal) or "fields" (shortest paths
+    # from the backend's NavigationService)
+    'NAVIGATION': "greedy",
+    # When agents evolve: "agent" (during their step) or "batched" (all together at the end of the simulation step,
+    # see swarm.evolution.EvolutionBatch)
+    'EVOLUTION': "agent",
+    # How agents random walk and walk to their goals: "agent" (sub-trees of PPARandomWalk, GoTo and GoAway) or
+    # "vectorised" (all together at the end of the simulation step, see swarm.population.MotionBatch)
+    'MOTION': "agent",
 
     # OTHER
     # Set machine name (useful for doing multiple runs)
@@ -0,0 +1,97 @@
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from fitness.evaluation import evaluate_fitness
+
+EvolutionRequest = namedtuple("EvolutionRequest", ("agent", "individuals", "reinitialised", "fitness_before"))
+
+
+class EvolutionBatch:
+    """
+    Evolution steps of all the agents evolving in one simulation step (agents with EVOLUTION "batched"), done
+    together by the backend at the end of the step (run()). Every agent keeps its own population and operators,
+    only the work is batched:
+    1) variation (selection, crossover, mutation, attribute check) of every agent, in order of the requests,
+    2) one evaluation of the new individuals of all the agents - individuals with a phenotype evaluated before
+    (in this batch or in the previous ones) get the known fitness if their agent has CACHE set, the rest is
+    evaluated by the fitness functions of their agents,
+    3) replacement and the choice of the new individual of every agent (BTs of the phenotypes seen before come
+    from the shared blueprint cache, see swarm.bt).
+    As with PonyGE's CACHE, fitness of the agents with CACHE set is assumed to depend only on the phenotype.
+    """
+    def __init__(self, backend, cache_size=10000):
+        self.backend = backend
+        self.requests = list()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # (fitness function, phenotype) -> (evaluated phenotype, fitness), LRU
+
+    def request(self, agent, individuals, reinitialised, fitness_before):
+        self.requests.append(EvolutionRequest(agent, individuals, reinitialised, fitness_before))
+
+    def run(self):
+        requests, self.requests = self.requests, list()
+        if not requests:
+            return
+
+        populations = [request.agent.variation(request.individuals) for request in requests]
+        self._evaluate(requests, populations)
+
+        for request, new_pop in zip(requests, populations):
+            agent = request.agent
+            agent.replace_population(new_pop)
+            agent.evolution_finished(len(request.individuals), request.reinitialised, request.fitness_before)
+
+    def _evaluate(self, requests, populations):
+        """
+        Sets fitness of the individuals of the new populations (in place).
+        """
+        jobs = list()  # (agent, population index, indices of the individuals to evaluate, their cache keys)
+        duplicates = list()  # (individual, cache key) of the individuals with phenotype evaluated in this batch
+        first = set()  # keys evaluated in this batch
+        for i, (request, new_pop) in enumerate(zip(requests, populations)):
+            fitness_function = type(request.agent.GE_params['FITNESS_FUNCTION'])
+            cache = request.agent.GE_params['CACHE']  # stochastic fitness functions are evaluated every time
+            indices, keys = list(), list()
+            for idx, ind in enumerate(new_pop):
+                key = None if ind.invalid or not cache else (fitness_function, ind.phenotype)
+                if key is None:
+                    indices.append(idx)
+                    keys.append(key)
+                elif key in first:
+                    duplicates.append((ind, key))
+                elif key in self.cache:
+                    self.cache.move_to_end(key)
+                    ind.phenotype, ind.fitness = self.cache[key]
+                else:
+                    first.add(key)
+                    indices.append(idx)
+                    keys.append(key)
+            if indices:
+                jobs.append((request.agent, i, indices, keys))
+
+        evaluated = [self._evaluate_job(populations, *job[:3]) for job in jobs]
+
+        results = dict()  # cache key -> (evaluated phenotype, fitness) of this batch
+        for (agent, i, indices, keys), individuals in zip(jobs, evaluated):
+            for idx, key, ind in zip(indices, keys, individuals):
+                populations[i][idx] = ind
+                if key is None:
+                    continue
+                results[key] = (ind.phenotype, ind.fitness)
+                if not np.any(np.isnan(ind.fitness)):  # as PonyGE's cache, only valid fitness values are kept
+                    self.cache[key] = results[key]
+                    if len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+
+        for ind, key in duplicates:
+            ind.phenotype, ind.fitness = results[key]
+
+    def _evaluate_job(self, populations, agent, i, indices):
+        timer = self.backend.timer
+        if timer:
+            phase_start = timer.start()
+        individuals = evaluate_fitness([populations[i][idx] for idx in indices], agent)
+        if timer:
+            timer.lap(agent.name, agent.steps, "evaluation", phase_start)
+        return individuals
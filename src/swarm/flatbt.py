@@ -0,0 +1,224 @@
+"""Flat interpreter of behaviour trees built by BTConstruct.
+
+The py_trees tree (including the sub-trees of the PPA behaviours) is compiled once into parallel lists indexed by
+node - opcode, children, memory flag and status/current child slots. Ticking walks these lists directly, with the same
+semantics as py_trees (Sequence, Selector, Inverter and Behaviour.tick/stop), but without generators, sub-tree
+rebuilds or new nodes per tick. Only update/initialise/terminate of the leaf behaviours are called.
+"""
+import py_trees
+from py_trees.common import Status
+from py_trees.composites import Sequence, Selector
+from py_trees.decorators import Inverter
+
+# Opcodes
+LEAF = 0
+SUBTREE = 1  # behaviour with its own sub-tree (PPA behaviours, GoTo, GoAway)
+SEQUENCE = 2
+SELECTOR = 3
+INVERTER = 4
+
+NO_CHILD = -1
+
+RUNNING = Status.RUNNING
+SUCCESS = Status.SUCCESS
+FAILURE = Status.FAILURE
+INVALID = Status.INVALID
+
+
+class FlatBT:
+    """
+    Behaviour tree compiled to flat lists, ticked instead of the py_trees tree (see BTConstruct.bt_from_xml).
+    Statuses are kept in the status slots, the py_trees nodes of the tree are not updated.
+    """
+    def __init__(self, tree: py_trees.trees.BehaviourTree):
+        self.opcodes = list()
+        self.children = list()
+        self.memory = list()
+        self.behaviours = list()  # py_trees node the slot was compiled from
+        self.subtree_end = list()  # SUBTREE: end of the slots of the sub-tree (they start right after the node)
+        self.rebuilt = list()  # SUBTREE: True if the behaviour builds its sub-tree anew in initialise()
+        self.status = list()
+        self.current = list()  # index of the current child (to children), NO_CHILD if None
+        # Slots counted by the BT feedback fitness (main tree only, see EvoAgent.compute_BT_feedback_fitness)
+        self.selectors = list()
+        self.postconditions = list()
+        self.root = self._compile(tree.root, main=True)
+
+    def _compile(self, node, main=False) -> int:
+        idx = len(self.opcodes)
+        self.opcodes.append(LEAF)
+        self.children.append(())
+        self.memory.append(getattr(node, "memory", False))
+        self.behaviours.append(node)
+        self.subtree_end.append(idx + 1)
+        self.rebuilt.append(False)
+        self.status.append(INVALID)
+        self.current.append(NO_CHILD)
+        if main:
+            if isinstance(node, Selector):
+                self.selectors.append(idx)
+            if node.name.split('_')[-1] == 'PostCnd':
+                self.postconditions.append(idx)
+
+        if isinstance(node, (Sequence, Selector)):
+            self.opcodes[idx] = SEQUENCE if isinstance(node, Sequence) else SELECTOR
+            self.children[idx] = tuple(self._compile(child, main) for child in node.children)
+        elif isinstance(node, Inverter):
+            self.opcodes[idx] = INVERTER
+            self.children[idx] = (self._compile(node.decorated, main),)
+        elif hasattr(node, "bt") and not getattr(node, "vectorised", False):
+            if node.bt is None:
+                # Sub-tree is created on every activation, build it once and reset its slots instead
+                node.initialise()
+                self.rebuilt[idx] = True
+            self.opcodes[idx] = SUBTREE
+            self.children[idx] = (self._compile(node.bt.root),)
+            self.subtree_end[idx] = len(self.opcodes)
+        return idx
+
+    def tick(self):
+        self._tick(self.root)
+
+    def _tick(self, idx):
+        opcode = self.opcodes[idx]
+        status = self.status
+        if opcode == LEAF:
+            behaviour = self.behaviours[idx]
+            if status[idx] != RUNNING:
+                behaviour.initialise()
+            new_status = behaviour.update()
+            if new_status != RUNNING:
+                behaviour.terminate(new_status)
+            status[idx] = new_status
+        elif opcode == SEQUENCE:
+            self._tick_sequence(idx)
+        elif opcode == SELECTOR:
+            self._tick_selector(idx)
+        elif opcode == INVERTER:
+            child = self.children[idx][0]
+            self._tick(child)
+            new_status = status[child]
+            if new_status == SUCCESS:
+                new_status = FAILURE
+            elif new_status == FAILURE:
+                new_status = SUCCESS
+            if new_status != RUNNING:
+                self._stop(idx, new_status)
+            status[idx] = new_status
+        else:
+            behaviour = self.behaviours[idx]
+            if status[idx] != RUNNING:
+                if self.rebuilt[idx]:
+                    for slot in range(idx + 1, self.subtree_end[idx]):
+                        status[slot] = INVALID
+                        self.current[slot] = NO_CHILD
+                else:
+                    behaviour.initialise()
+            root = self.children[idx][0]
+            self._tick(root)
+            new_status = status[root]
+            if new_status != RUNNING:
+                behaviour.terminate(new_status)
+            status[idx] = new_status
+
+    def _tick_sequence(self, idx):
+        status = self.status
+        children = self.children[idx]
+        memory = self.memory[idx]
+        index = 0
+        if status[idx] != RUNNING:
+            self.current[idx] = 0 if children else NO_CHILD
+            for child in children:
+                if status[child] != INVALID:
+                    self._stop(child, INVALID)
+        elif memory:
+            index = self.current[idx]
+        else:
+            self.current[idx] = 0 if children else NO_CHILD
+
+        if not children:
+            self.current[idx] = NO_CHILD
+            self._stop(idx, SUCCESS)
+            return
+
+        while index < len(children):
+            child = children[index]
+            self._tick(child)
+            if status[child] != SUCCESS:
+                status[idx] = status[child]
+                if not memory:
+                    for rest in children[index + 1:]:
+                        if status[rest] != INVALID:
+                            self._stop(rest, INVALID)
+                return
+            if index + 1 < len(children):
+                self.current[idx] = index + 1
+            index += 1
+        self._stop(idx, SUCCESS)
+
+    def _tick_selector(self, idx):
+        status = self.status
+        children = self.children[idx]
+        if status[idx] != RUNNING:
+            self.current[idx] = 0 if children else NO_CHILD
+
+        if not children:
+            self.current[idx] = NO_CHILD
+            self._stop(idx, FAILURE)
+            return
+
+        index = 0
+        if self.memory[idx]:
+            index = self.current[idx]
+            for child in children[:index]:
+                self._stop(child, INVALID)
+
+        previous = self.current[idx]
+        while index < len(children):
+            child = children[index]
+            self._tick(child)
+            if status[child] == RUNNING or status[child] == SUCCESS:
+                self.current[idx] = index
+                status[idx] = status[child]
+                if previous != index:
+                    # interrupted, invalidate everything at a lower priority
+                    for rest in children[index + 1:]:
+                        if status[rest] != INVALID:
+                            self._stop(rest, INVALID)
+                return
+            index += 1
+        status[idx] = FAILURE
+        self.current[idx] = len(children) - 1
+
+    def _stop(self, idx, new_status):
+        opcode = self.opcodes[idx]
+        if opcode == SEQUENCE or opcode == SELECTOR:
+            if new_status == INVALID:
+                self.current[idx] = NO_CHILD
+                for child in self.children[idx]:
+                    if self.status[child] != INVALID:
+                        self._stop(child, INVALID)
+        elif opcode == INVERTER:
+            child = self.children[idx][0]
+            if new_status == INVALID:
+                self._stop(child, INVALID)
+            if self.status[child] == RUNNING:
+                self._stop(child, INVALID)
+        else:
+            self.behaviours[idx].terminate(new_status)
+        self.status[idx] = new_status
+
+    def feedback(self, penalty=False):
+        """
+        Reward of the last tick - successful selectors and postconditions of the main tree, -2 for every failed one
+        if penalty is set.
+        """
+        reward = 0
+        status = self.status
+        for slots in (self.selectors, self.postconditions):
+            for idx in slots:
+                if status[idx] == SUCCESS:
+                    reward += 1
+                elif penalty and status[idx] == FAILURE:
+                    reward -= 2
+        return reward
@@ -1,95 +1,95 @@
+import itertools
 import sys
 
+import numpy as np
 from PyQt5 import QtCore
-from PyQt5.QtCore import pyqtSignal
+from PyQt5.QtCore import pyqtSignal, QRect
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
 from swarm.models import BoardModel
+from swarm.types import Color
 
 
 class QBoard(QWidget):
     """
-    Class representing Board on the screen
+    Board on the screen, one widget painting the board from an RGB array (one pixel per tile) scaled to the tiles.
+    Frames come from the backend thread as changes of the array (see SimulationWindow.push_frame), only the changed
+    tiles are repainted. Clicking a tile shows its info.
     """
     def __init__(self, parent=None, dimension=8):
         super().__init__(parent=parent)
         self.dimension = dimension
+        self.tile_size = max(800 // dimension, 1)
+        self.setFixedSize(self.tile_size * dimension, self.tile_size * dimension)
+        self.pixels = np.full((dimension, dimension, 3), 255, dtype=np.uint8)
+        # the image only refers to pixels, changes of the array are visible in the image
+        self.image = QImage(self.pixels.data, dimension, dimension, 3 * dimension, QImage.Format_RGB888)
+        self.images = dict()  # position -> image of the tile
+        self.pixmaps = dict()  # image file -> QPixmap
+        self.board_model = None
+
+    def apply_frame(self, rows, cols, colors, images):
+        """
+        Sets colors of the tiles at the positions (rows, cols) and images of the tiles, repaints the changed tiles.
+        """
+        self.pixels[rows, cols] = colors
+        changed = set(self.images.keys()) ^ set(images.keys())
+        self.images = images
+        if len(rows) + len(changed) > 256:
+            self.update()
+            return
+        region = QRegion()
+        size = self.tile_size
+        for r, c in itertools.chain(zip(rows.tolist(), cols.tolist()), changed):
+            region += QRect(c * size, r * size, size, size)
+        self.update(region)
 
+    def paintEvent(self, event: QPaintEvent) -> None:
+        size = self.tile_size
+        rect = event.rect()
+        # tiles intersecting the repainted area
+        c_min, r_min = rect.left() // size, rect.top() // size
+        c_max, r_max = min(rect.right() // size, self.dimension - 1), min(rect.bottom() // size, self.dimension - 1)
+        source = QRect(c_min, r_min, c_max - c_min + 1, r_max - r_min + 1)
+        target = QRect(c_min * size, r_min * size, source.width() * size, source.height() * size)
+
+        painter = QPainter()
+        painter.begin(self)
+        painter.drawImage(target, self.image, source)
+        for (r, c), image in self.images.items():
+            if r_min <= r <= r_max and c_min <= c <= c_max:
+                pixmap = self.pixmaps.get(image)
+                if pixmap is None:
+                    pixmap = self.pixmaps[image] = QPixmap(image)
+                painter.drawPixmap(QRect(c * size, r * size, size, size), pixmap)
+        if size >= 4:
+            # grid
+            painter.setPen(QtCore.Qt.darkGray)
+            for r in range(r_min, r_max + 2):
+                painter.drawLine(target.left(), r * size, target.right(), r * size)
+            for c in range(c_min, c_max + 2):
+                painter.drawLine(c * size, target.top(), c * size, target.bottom())
+        painter.end()
+
+    def tile_at(self, x, y):
         """
-        Init grid of tiles
+        Returns TileModel of the tile at the point of the widget, None if there is no board.
         """
-        grid = QGridLayout()
-        tiles = []
-        # create grid of tiles = environment
-        for x in range(self.dimension):
-            row = list()
-            for y in range(self.dimension):
-                square = QTile(self, position=(x, y))
-                row.append(square)
-                square.setFixedSize(800 // self.dimension, 800 // self.dimension)
-                grid.addWidget(square, x, y)
-                grid.setHorizontalSpacing(1)
-                grid.setVerticalSpacing(1)
-            tiles.append(row)
-        # reference to the tiles to be able to modify them
-        self.tiles = tiles
-        self.setLayout(grid)
-
-
-class QTile(QWidget):
-    def __init__(self, parent, position):
-        super().__init__(parent=parent)
-        # Tile abilities/perks
-        self.color = QtCore.Qt.white
-        self.image = None
-        self.hole = False
-        self.position = position
-        self.mouseReleaseEvent = self.print_info
-        self.tile_model = None
-
-    def print_info(self, event):
+        r, c = y // self.tile_size, x // self.tile_size
+        if self.board_model is None or not (0 <= r < self.dimension and 0 <= c < self.dimension):
+            return None
+        return self.board_model.tile(r, c)
+
+    def mouseReleaseEvent(self, event: QMouseEvent) -> None:
+        tile = self.tile_at(event.x(), event.y())
+        if tile is None:
+            return
         dlg = QMessageBox(self)
         dlg.setWindowTitle("Tile info")
-        dlg.setText(f"{self.tile_model}")
+        dlg.setText(f"{tile}")
         dlg.exec()
 
-    def set_image(self, img, img_type):
-        self.image = img
-        if img_type == "hole":
-            self.hole = True
-        else:
-            self.hole = False
-
-    def set_color(self, color):
-        self.color = color
-        self.update()
-
-    def paintEvent(self, event: QPaintEvent) -> None:
-        if self.hole:
-            painter = QPainter()
-            painter.begin(self)
-            pixmap = QPixmap(self.image)
-            painter.fillRect(self.rect(), self.color)
-
-            painter.drawPixmap(self.rect(), pixmap)
-
-            painter.end()
-        elif self.image:
-            painter = QPainter()
-            painter.begin(self)
-            pixmap = QPixmap(self.image)
-            painter.fillRect(self.rect(), self.color)
-
-            painter.drawPixmap(self.rect(), pixmap)
-
-            painter.end()
-        else:
-            painter = QPainter()
-            painter.begin(self)
-            painter.fillRect(self.rect(), self.color)
-            painter.end()
-
 
 class SimulationWindow(QMainWindow):
 
@@ -99,7 +99,7 @@ class SimulationWindow(QMainWindow):
     signal_stop = pyqtSignal()
     signal_end = pyqtSignal()
 
-    signal_update = pyqtSignal(BoardModel)
+    signal_frame = pyqtSignal(object, object, object, object, object)
 
     def __init__(self, dimension):
         super().__init__()
@@ -109,45 +109,61 @@ class SimulationWindow(QMainWindow):
 
         self.layout = QHBoxLayout()
         self.board = QBoard(dimension=dimension)
-        #self.reset_board(dimension)
         self.layout.addWidget(self.board)
         self.layout.addWidget(self.prepare_controls())
         mainWidget = QWidget()
         mainWidget.setLayout(self.layout)
         self.setCentralWidget(mainWidget)
         self.dimension = dimension
+        self.board_model = None  # board of the last frame, the next frame is a full one if the board changes
+        self.colors = dict()  # color -> RGB
+        self.images = dict()  # images of the tiles in the last frame
         #signals from GUI
         #signals to GUI
-        self.signal_update.connect(self._update)
-        self.update = self.signal_update.emit
-
-        #self.signal_add_hole.connect(self._draw_hole)
+        self.signal_frame.connect(self._apply_frame)
+        # Backend calls update(board_model) from its thread (at most GUI_FPS times per second)
+        self.update = self.push_frame
 
-        #self.draw_hole =self.signal_add_hole.emit
         self.show()
 
     def register_backend(self, backend):
         self.backend = backend
-        for r in range(len(self.backend.board_model.tiles)):
-            for c in range(len(self.backend.board_model.tiles)):
-                self.board.tiles[r][c].tile_model = self.backend.board_model.tiles[r][c]
+        self.board.board_model = backend.board_model
 
     def reset_board(self, dimension):
-        for r in range(dimension):
-            for c in range(dimension):
-                self.board.tiles[r][c].set_color(QtCore.Qt.white)
-
-
-    def _update(self, board_model):
-        for r in range(self.dimension):
-            for c in range(self.dimension):
-                tile_model = board_model.tiles[r][c]
-                if tile_model.image:
-                    self.board.tiles[r][c].set_image(tile_model.image, tile_model.type)
-                if tile_model.background:
-                    self.board.tiles[r][c].set_color(tile_model.background)
-    pass
-                # TODO here update all the GUI-related thingies for tiles - primarily their color/background and images
+        self.board_model = None
+
+    def push_frame(self, board_model: BoardModel):
+        """
+        Called in the backend thread - takes the tiles changed since the last frame (all of them for a new board)
+        and their colors, the GUI thread only copies them to the image.
+        """
+        if board_model is not self.board_model or board_model.dirty is None:
+            self.board_model = board_model
+            board_model.track_changes()
+            rows, cols = np.indices((board_model.dimension, board_model.dimension)).reshape(2, -1)
+        else:
+            dirty = board_model.take_changes()
+            if not dirty and board_model.images == self.images:
+                return
+            rows, cols = np.array(list(dirty), dtype=np.intp).reshape(-1, 2).T
+        palette = np.array([self._rgb(obj.color if obj else Color.WHITE) for obj in board_model.object_table],
+                           dtype=np.uint8)
+        colors = palette[board_model.object_ids[rows, cols]]
+        self.images = dict(board_model.images)
+        self.signal_frame.emit(board_model, rows, cols, colors, self.images)
+
+    def _rgb(self, color):
+        rgb = self.colors.get(color)
+        if rgb is None:
+            # Simulation models use Qt independent colors, convert them here
+            qcolor = QColor(color.value) if isinstance(color, Color) else QColor(color)
+            rgb = self.colors[color] = (qcolor.red(), qcolor.green(), qcolor.blue())
+        return rgb
+
+    def _apply_frame(self, board_model, rows, cols, colors, images):
+        self.board.board_model = board_model
+        self.board.apply_frame(rows, cols, colors, images)
 
     def prepare_controls(self):
         control_panel = QWidget()
@@ -1,5 +1,8 @@
 import random
-from math import degrees, asin, sqrt
+from functools import lru_cache
+from math import degrees, asin, sqrt, exp
+
+import numpy as np
 
 from swarm.types import Direction
 
@@ -26,6 +29,63 @@ def compute_area(radius):
     return area
 
 
+@lru_cache(maxsize=None)
+def manhattan_distances(radius):
+    """
+    Returns read-only table of shape (2*radius+1, 2*radius+1) with distances (in the compute_distance sense) of the
+    cells from the center.
+    """
+    offsets = np.abs(np.arange(-radius, radius + 1))
+    distances = offsets[:, None] + offsets[None, :]
+    distances.flags.writeable = False
+    return distances
+
+
+@lru_cache(maxsize=None)
+def manhattan_disk(radius):
+    """
+    Returns read-only boolean mask of shape (2*radius+1, 2*radius+1), True for cells no farther than radius
+    from the center.
+    """
+    mask = manhattan_distances(radius) <= radius
+    mask.flags.writeable = False
+    return mask
+
+
+class DecayedSum:
+    """
+    Running value of sum(a*e^(-b*(step - last_step))) over items (e.g. visited positions) with the step they were
+    last seen at, updated in O(1): the sum decays by e^(-b) per step and a refreshed item swaps its decayed
+    contribution for a fresh one.
+    """
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+        self.total = 0.0
+        self.step = 0  # step the total refers to
+
+    def reset(self):
+        self.total = 0.0
+
+    def _decay_to(self, step):
+        if step != self.step:
+            self.total *= exp(-self.b * (step - self.step))
+            self.step = step
+
+    def refresh(self, step, last_step=None):
+        """
+        Item seen at the step, last_step is when it was seen before (None if never).
+        """
+        self._decay_to(step)
+        if last_step is not None:
+            self.total -= self.a * exp(-self.b * (step - last_step))
+        self.total += self.a
+
+    def value(self, step):
+        self._decay_to(step)
+        return max(self.total, 0.0)
+
+
 def choose_direction(start, goal):
     # if diff in rows is bigger than in cols
     axis, delta = 0, 0
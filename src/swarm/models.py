@@ -1,23 +1,46 @@
+import numpy as np
 
-from PyQt5 import QtCore
-from swarm.types import ObjectType
+from swarm.math import manhattan_disk
+from swarm.spatial import SpatialIndex
+from swarm.types import ObjectType, Color
+
+# Object types stored in the type layer of the board; the code of a type is its index.
+OBJECT_TYPES = (ObjectType.GENERIC, ObjectType.AGENT, ObjectType.FOOD, ObjectType.HUB, ObjectType.NOTYPE)
+TYPE_CODES = {object_type: code for code, object_type in enumerate(OBJECT_TYPES)}
+NO_OBJECT = 0  # object id of an empty tile
 
 
 class BoardModel:
     """
 Generic BoardModel.
+
+The board is stored as three NumPy layers of shape (dimension, dimension):
+    types: code of the type of the object placed on the tile (see OBJECT_TYPES),
+    occupancy: True if there is an object on the tile,
+    object_ids: id of the object on the tile (index to object_table), NO_OBJECT for empty tiles.
+An object gets its id when it is placed and releases it with its last tile, the free ids are reused.
+TileModel instances are only lightweight views to these layers, created on demand (see tile() and tiles).
+Positions of the objects are also kept in a SpatialIndex (index) for nearest/radius queries per object type.
+Observers (e.g. NavigationService) are notified by static_changed(positions, obj, placed) after a static (not agent)
+object was placed or removed.
+Positions of all the changed tiles are collected in dirty once track_changes() was called (by the GUI, see
+take_changes()).
 """
-    def __init__(self, dimension):
-        tiles = list()
-        for r in range(dimension):
-            row = list()
-            for c in range(dimension):
-                row.append(TileModel((r, c)))
-            tiles.append(row)
-        self.tiles = tiles
+    def __init__(self, dimension, index_cell_size=8):
         self.dimension = dimension
-        # self.tiles[3][3].image = "img/dira.png"
-        # self.tiles[3][3].type = "hole"
+        self.types = np.zeros((dimension, dimension), dtype=np.int8)
+        self.occupancy = np.zeros((dimension, dimension), dtype=bool)
+        self.object_ids = np.full((dimension, dimension), NO_OBJECT, dtype=np.int32)
+        self.object_table = [None]  # object id -> object, None for free ids
+        self._object_id_of = dict()  # object -> object id
+        self._tile_counts = [0]  # object id -> number of tiles of the object
+        self._free_ids = list()
+        self.images = dict()  # sparse, position -> image
+        self.index = SpatialIndex(index_cell_size)
+        self.tiles = TileGrid(self)
+        self.observers = list()
+        self.dirty = None  # positions of the tiles changed since the last take_changes(), None = not tracked
+        # self.images[(3, 3)] = "img/dira.png"
 
         # Static/immovable objects in the environment - hub, obstacles...
         self.objects = dict()
@@ -28,41 +51,244 @@ Generic BoardModel.
         else:
             return list()
 
+    def tile(self, r, c) -> 'TileModel':
+        return TileModel(self, (r, c))
 
-class TileModel:
-    def __init__(self, position):
-        self.position = position
-        self.occupied = False
-        self.object = None
-        self.image = ""
-        self.background = None
-        self.type = ObjectType.GENERIC
-        self.props = {}
+    def get_object(self, position):
+        return self.object_table[self.object_ids[position[0], position[1]]]
 
-    def place_object(self, obj):
-        succ = False
-        if self.occupied:
-            succ = False
-        self.occupied = True
-        self.object = obj # whole object, not a type!
-        self.type = obj.type
-        self.background = obj.color  # TODO rozlisit mezi tim, kdyzz ma objekt jen color, jen image nebo oboji
-        succ = True
-        return succ
+    def register_object(self, obj) -> int:
+        """
+        Returns id of the object in the object_table, registering the object first if needed.
+        """
+        object_id = self._object_id_of.get(obj)
+        if object_id is None:
+            if self._free_ids:
+                object_id = self._free_ids.pop()
+                self.object_table[object_id] = obj
+            else:
+                object_id = len(self.object_table)
+                self.object_table.append(obj)
+                self._tile_counts.append(0)
+            self._object_id_of[obj] = object_id
+        return object_id
 
-    def remove_object(self, obj):
-        if not self.object:
+    def object_id(self, obj) -> int:
+        """
+        Returns id of the object, NO_OBJECT if it is not on the board.
+        """
+        return self._object_id_of.get(obj, NO_OBJECT)
+
+    def set_object_table(self, table):
+        """
+        Sets the ids of the objects (indices to the table, None for free ids) of a board to be restored, before
+        its objects are placed.
+        """
+        self.object_table = list(table)
+        self._object_id_of = {obj: object_id for object_id, obj in enumerate(table) if obj is not None}
+        self._tile_counts = [0] * len(table)
+        self._free_ids = [object_id for object_id in range(len(table) - 1, 0, -1) if table[object_id] is None]
+
+    def _remove_tiles(self, object_id, count=1):
+        """
+        Counts off tiles of the object, releasing its id with the last one.
+        """
+        self._tile_counts[object_id] -= count
+        if not self._tile_counts[object_id]:
+            del self._object_id_of[self.object_table[object_id]]
+            self.object_table[object_id] = None
+            self._free_ids.append(object_id)
+
+    def place_object(self, obj, position):
+        r, c = position
+        if self.occupancy[r, c]:
+            self.index.remove(OBJECT_TYPES[self.types[r, c]], (r, c))
+        self.index.add(obj.type, (r, c), obj)
+        object_id = self.register_object(obj)
+        replaced = self.object_ids[r, c]
+        if replaced != object_id:
+            self._tile_counts[object_id] += 1
+            if replaced != NO_OBJECT:
+                self._remove_tiles(replaced)
+        self.occupancy[r, c] = True
+        self.object_ids[r, c] = object_id  # whole object, not a type!
+        self.types[r, c] = TYPE_CODES[obj.type]
+        if self.dirty is not None:
+            self.dirty.add((r, c))
+        if obj.type != ObjectType.AGENT:
+            self._static_changed([(r, c)], obj, True)
+        return True
+
+    def remove_object(self, obj, position):
+        r, c = position
+        object_id = self.object_ids[r, c]
+        if object_id == NO_OBJECT:
             return False
-        if self.object != obj:
+        if self.object_table[object_id] != obj:
             raise TypeError("Object to remove is not the object placed here!")
-        obj = self.object  # backup to be able to call remove_part
-        self.object = None
+        self.occupancy[r, c] = False
+        self.object_ids[r, c] = NO_OBJECT
+        self.types[r, c] = TYPE_CODES[ObjectType.GENERIC]
+        self.index.remove(obj.type, (r, c))
+        self._remove_tiles(object_id)
+        if self.dirty is not None:
+            self.dirty.add((r, c))
         if not obj.type == ObjectType.AGENT:
-            obj.remove_part(self.position)
-        self.occupied = False
-        self.type = ObjectType.GENERIC
-        self.background = QtCore.Qt.white
+            obj.remove_part((r, c))
+            self._static_changed([(r, c)], obj, False)
         return True
 
+    def window(self, position, radius):
+        """
+        Returns the part of the board within the given (Manhattan) radius from the position as a tuple of slices
+        (usable to index the layers) and boolean mask of the same shape selecting the tiles within the radius.
+        Parts outside the board are clipped.
+        """
+        r, c = position
+        r_min, r_max = max(r - radius, 0), min(r + radius + 1, self.dimension)
+        c_min, c_max = max(c - radius, 0), min(c + radius + 1, self.dimension)
+        mask = manhattan_disk(radius)[r_min - r + radius:r_max - r + radius, c_min - c + radius:c_max - c + radius]
+        return (slice(r_min, r_max), slice(c_min, c_max)), mask
+
+    def is_free(self, position, radius):
+        """
+        True if no tile within the radius from the position is occupied.
+        """
+        area, mask = self.window(position, radius)
+        return not self.occupancy[area][mask].any()
+
+    def positions_within(self, position, radius):
+        """
+        Returns positions of all the tiles within the radius from the position, row by row.
+        """
+        area, mask = self.window(position, radius)
+        rows, cols = np.nonzero(mask)
+        return list(zip((rows + area[0].start).tolist(), (cols + area[1].start).tolist()))
+
+    def place_object_area(self, obj, position, radius):
+        """
+        Places the object on all the tiles within the radius from the position.
+        """
+        area, mask = self.window(position, radius)
+        rows, cols = np.nonzero(self.occupancy[area] & mask)
+        for r, c in zip((rows + area[0].start).tolist(), (cols + area[1].start).tolist()):
+            self.index.remove(OBJECT_TYPES[self.types[r, c]], (r, c))
+        positions = self.positions_within(position, radius)
+        for r, c in positions:
+            self.index.add(obj.type, (r, c), obj)
+        object_id = self.register_object(obj)
+        replaced = self.object_ids[area][mask]
+        replaced = replaced[replaced != object_id]
+        self._tile_counts[object_id] += len(replaced)
+        for replaced_id, count in zip(*np.unique(replaced[replaced != NO_OBJECT], return_counts=True)):
+            self._remove_tiles(int(replaced_id), int(count))
+        self.occupancy[area][mask] = True
+        self.object_ids[area][mask] = object_id
+        self.types[area][mask] = TYPE_CODES[obj.type]
+        if self.dirty is not None:
+            self.dirty.update(positions)
+        if obj.type != ObjectType.AGENT:
+            self._static_changed(positions, obj, True)
+
+    def track_changes(self):
+        """
+        Starts collecting positions of the changed tiles.
+        """
+        self.dirty = set()
+
+    def take_changes(self):
+        """
+        Returns positions of the tiles changed since the last call (or track_changes()) and starts collecting anew.
+        """
+        dirty, self.dirty = self.dirty, set()
+        return dirty
+
+    def _static_changed(self, positions, obj, placed):
+        for observer in self.observers:
+            observer.static_changed(positions, obj, placed)
+
+
+class TileGrid:
+    """
+    List-of-lists like access to the tiles of the board (board_model.tiles[r][c]), creating the views on demand.
+    """
+    def __init__(self, board):
+        self.board = board
+
+    def __len__(self):
+        return self.board.dimension
+
+    def __getitem__(self, r):
+        if not -self.board.dimension <= r < self.board.dimension:
+            raise IndexError("Board row index out of range")
+        return TileRow(self.board, r % self.board.dimension)
+
+    def __iter__(self):
+        for r in range(self.board.dimension):
+            yield TileRow(self.board, r)
+
+
+class TileRow:
+    def __init__(self, board, r):
+        self.board = board
+        self.r = r
+
+    def __len__(self):
+        return self.board.dimension
+
+    def __getitem__(self, c):
+        if not -self.board.dimension <= c < self.board.dimension:
+            raise IndexError("Board column index out of range")
+        return TileModel(self.board, (self.r, c % self.board.dimension))
+
+    def __iter__(self):
+        for c in range(self.board.dimension):
+            yield TileModel(self.board, (self.r, c))
+
+
+class TileModel:
+    """
+    View of one tile of the BoardModel. Holds no state itself, so it always reflects the current board.
+    """
+    __slots__ = ("board", "position")
+
+    def __init__(self, board, position):
+        self.board = board
+        self.position = position
+
+    @property
+    def occupied(self):
+        return bool(self.board.occupancy[self.position])
+
+    @property
+    def object(self):
+        return self.board.object_table[self.board.object_ids[self.position]]
+
+    @property
+    def type(self):
+        return OBJECT_TYPES[self.board.types[self.position]]
+
+    @property
+    def image(self):
+        return self.board.images.get(self.position, "")
+
+    @property
+    def background(self):
+        obj = self.object
+        # TODO rozlisit mezi tim, kdyzz ma objekt jen color, jen image nebo oboji
+        return obj.color if obj else Color.WHITE
+
+    def place_object(self, obj):
+        return self.board.place_object(obj, self.position)
+
+    def remove_object(self, obj):
+        return self.board.remove_object(obj, self.position)
+
+    def __eq__(self, other):
+        return isinstance(other, TileModel) and self.board is other.board and self.position == other.position
+
+    def __hash__(self):
+        return hash(self.position)
+
     def __repr__(self):
-        return f"Tile at {self.position}, occupied: {self.occupied}, object: {self.object}"
\ No newline at end of file
+        return f"Tile at {self.position}, occupied: {self.occupied}, object: {self.object}"
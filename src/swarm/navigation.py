@@ -0,0 +1,165 @@
+import heapq
+from collections import deque
+from threading import Lock
+
+import numpy as np
+
+from swarm.models import BoardModel, NO_OBJECT, TYPE_CODES
+from swarm.types import ObjectType, Direction
+
+UNREACHABLE = np.iinfo(np.int32).max
+NAVIGABLE_TYPES = (ObjectType.HUB, ObjectType.FOOD)
+# (row delta, column delta, heading) of the neighbouring tiles, in the order the ties are resolved
+NEIGHBOURS = ((-1, 0, Direction.UP), (0, 1, Direction.RIGHT), (1, 0, Direction.DOWN), (0, -1, Direction.LEFT))
+
+
+class NavigationService:
+    """
+    Distance fields to the static objects on the board (hub, food sources), shared by all the agents.
+
+    The field of an object holds the length of the shortest 4-neighbourhood path from every tile to the nearest tile
+    of the object (0 on the object), going around the other static objects (agents do not block the paths).
+    Fields are computed on the first request and repaired in place when the static objects change: freed tiles
+    (or new tiles of the object itself) only shorten the paths and are relaxed from; newly placed objects (or removed
+    tiles of the object itself) drop the distances of the tiles whose shortest paths went through them, which are
+    then relaxed from the rest of the field. A field is only dropped with the last tile of its object.
+    """
+    def __init__(self, board: BoardModel):
+        self.board = board
+        self.fields = dict()  # object -> distance field
+        self.lock = Lock()
+        board.observers.append(self)
+
+    def _blocked(self, obj):
+        """Tiles the paths to the object cannot go through."""
+        board = self.board
+        return board.occupancy & (board.types != TYPE_CODES[ObjectType.AGENT]) & \
+            (board.object_ids != board.object_id(obj))
+
+    def field(self, obj):
+        with self.lock:
+            field = self.fields.get(obj)
+            if field is None:
+                field = self.fields[obj] = self._compute(obj)
+            return field
+
+    def _compute(self, obj):
+        board = self.board
+        passable = ~self._blocked(obj)
+        reached = board.object_ids == board.object_id(obj)
+        field = np.full(reached.shape, UNREACHABLE, dtype=np.int32)
+        field[reached] = 0
+        frontier = reached.copy()
+        distance = 0
+        while frontier.any():
+            distance += 1
+            grown = np.zeros_like(frontier)
+            grown[1:] |= frontier[:-1]
+            grown[:-1] |= frontier[1:]
+            grown[:, 1:] |= frontier[:, :-1]
+            grown[:, :-1] |= frontier[:, 1:]
+            frontier = grown & passable & ~reached
+            field[frontier] = distance
+            reached |= frontier
+        return field
+
+    def _relax(self, obj, field, positions):
+        """Propagates shorter paths through the freed positions."""
+        blocked = self._blocked(obj)
+        dimension = self.board.dimension
+        queue = deque()
+        for r, c in positions:
+            if blocked[r, c]:
+                continue
+            for dr, dc, _ in NEIGHBOURS:
+                nr, nc = r + dr, c + dc
+                if 0 <= nr < dimension and 0 <= nc < dimension and field[nr, nc] != UNREACHABLE and \
+                        field[nr, nc] + 1 < field[r, c]:
+                    field[r, c] = field[nr, nc] + 1
+            if field[r, c] != UNREACHABLE:
+                queue.append((r, c))
+        while queue:
+            r, c = queue.popleft()
+            distance = field[r, c] + 1
+            for dr, dc, _ in NEIGHBOURS:
+                nr, nc = r + dr, c + dc
+                if 0 <= nr < dimension and 0 <= nc < dimension and not blocked[nr, nc] and distance < field[nr, nc]:
+                    field[nr, nc] = distance
+                    queue.append((nr, nc))
+
+    def _invalidate(self, field, positions):
+        """
+        Drops the distances of the positions (blocked or no longer tiles of the object) and of all the tiles whose
+        every shortest path went through them. Returns the tiles with dropped distances.
+        """
+        dimension = self.board.dimension
+        lost = {(r, c) for r, c in positions if field[r, c] != UNREACHABLE}
+        heap = [(int(field[r, c]), r, c) for r, c in lost]
+        heapq.heapify(heap)
+        # In order of the distances, so the tiles one step closer are decided before their neighbours
+        while heap:
+            distance, r, c = heapq.heappop(heap)
+            for dr, dc, _ in NEIGHBOURS:
+                nr, nc = r + dr, c + dc
+                if not (0 <= nr < dimension and 0 <= nc < dimension) or field[nr, nc] != distance + 1 or \
+                        (nr, nc) in lost:
+                    continue
+                supported = False
+                for sr, sc, _ in NEIGHBOURS:
+                    mr, mc = nr + sr, nc + sc
+                    if 0 <= mr < dimension and 0 <= mc < dimension and field[mr, mc] == distance and \
+                            (mr, mc) not in lost:
+                        supported = True
+                        break
+                if not supported:
+                    lost.add((nr, nc))
+                    heapq.heappush(heap, (distance + 1, nr, nc))
+        for r, c in lost:
+            field[r, c] = UNREACHABLE
+        return lost
+
+    def static_changed(self, positions, obj, placed):
+        """
+        Called by the board after a static (not agent) object was placed on or removed from the positions.
+        """
+        with self.lock:
+            for target, field in list(self.fields.items()):
+                if self.board.object_id(target) == NO_OBJECT:
+                    del self.fields[target]  # the last tile of the object was removed or taken by another object
+                elif placed == (target is obj):
+                    # the object grew or other tiles got free -> paths can only get shorter
+                    if placed:
+                        for r, c in positions:
+                            field[r, c] = 0
+                    self._relax(target, field, positions)
+                else:
+                    # other tiles got blocked or the object shrank -> paths through them are found again
+                    self._relax(target, field, self._invalidate(field, positions))
+
+    def next_step(self, goal_position, position, towards=True):
+        """
+        Returns (position, heading) of the free neighbouring tile on the shortest path to the static object at
+        goal_position (farthest from it if not towards), (position, None) if already next to it.
+        None if there is no such object or no such step.
+        """
+        board = self.board
+        obj = board.get_object(goal_position)
+        if obj is None or obj.type not in NAVIGABLE_TYPES:
+            return None
+        field = self.field(obj)
+        r, c = position
+        best, best_distance = None, field[r, c]
+        if best_distance == UNREACHABLE:
+            return None
+        if towards and best_distance <= 1:
+            return (r, c), None
+        for dr, dc, heading in NEIGHBOURS:
+            nr, nc = r + dr, c + dc
+            if not (0 <= nr < board.dimension and 0 <= nc < board.dimension) or board.occupancy[nr, nc]:
+                continue
+            distance = field[nr, nc]
+            if distance == UNREACHABLE:
+                continue
+            if (towards and distance < best_distance) or (not towards and distance > best_distance):
+                best, best_distance = ((nr, nc), heading), distance
+        return best
@@ -1,17 +1,105 @@
+import numpy as np
+
+from swarm.models import OBJECT_TYPES
+from swarm.spatial import SpatialIndex
 from swarm.types import Direction, ObjectType
-from swarm.math import  compute_distance
+from swarm.math import manhattan_distances
 
-from typing import Dict, Set
+from typing import Dict, Optional, Tuple
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
     from swarm.agent import EvoAgent
-    from swarm.models import TileModel
+    from swarm.models import TileModel, BoardModel
+
+
+class SensedArea:
+    """
+    Compact result of sensing: window of the board around the center, clipped to the board, with the disk mask and
+    the distances from the center (both taken from tables precomputed per radius), snapshot of the object types in
+    the window and the list of occupied cells together with their distances.
+    Cells are addressed relatively to the full (2*radius+1)^2 square centered at the center.
+    """
+    def __init__(self, board: 'BoardModel', center, radius):
+        self.board = board
+        self.center = tuple(center)
+        self.radius = radius
+        self.size = 2 * radius + 1
+        self.area, self.mask = board.window(self.center, radius)
+        # position of the (clipped) window in the full square
+        self.offset = (self.area[0].start - self.center[0] + radius, self.area[1].start - self.center[1] + radius)
+        self.distances = manhattan_distances(radius)[self.offset[0]:self.offset[0] + self.mask.shape[0],
+                                                     self.offset[1]:self.offset[1] + self.mask.shape[1]]
+        self.types = board.types[self.area].copy()
+
+        rows, cols = np.nonzero(board.occupancy[self.area] & self.mask)
+        self.occupied = [(r, c, OBJECT_TYPES[self.types[r, c]], int(self.distances[r, c]))
+                         for r, c in zip(rows.tolist(), cols.tolist())]  # window coordinates, type, distance
+
+    def abs_position(self, r, c):
+        """Absolute position of the cell given by window coordinates."""
+        return r + self.area[0].start, c + self.area[1].start
+
+    def positions(self):
+        """Absolute positions of all the sensed cells."""
+        rows, cols = np.nonzero(self.mask)
+        return zip((rows + self.area[0].start).tolist(), (cols + self.area[1].start).tolist())
+
+    def cell(self, r, c):
+        """
+        Tile at the position relative to the full square, None if it lies outside the board or the sensed disk.
+        """
+        r -= self.offset[0]
+        c -= self.offset[1]
+        if 0 <= r < self.mask.shape[0] and 0 <= c < self.mask.shape[1] and self.mask[r, c]:
+            return self.board.tile(*self.abs_position(r, c))
+        return None
+
+
+class NeighbourhoodGrid:
+    """
+    Matrix-like access to the sensed tiles (grid[r][c], None outside the board or the sensed disk).
+    The tiles are created on demand.
+    """
+    def __init__(self, sensed: SensedArea):
+        self.sensed = sensed
+
+    def __len__(self):
+        return self.sensed.size
+
+    def __getitem__(self, r):
+        if not -self.sensed.size <= r < self.sensed.size:
+            raise IndexError("Neighbourhood row index out of range")
+        return NeighbourhoodRow(self.sensed, r % self.sensed.size)
+
+    def __iter__(self):
+        for r in range(self.sensed.size):
+            yield NeighbourhoodRow(self.sensed, r)
+
+
+class NeighbourhoodRow:
+    def __init__(self, sensed: SensedArea, r):
+        self.sensed = sensed
+        self.r = r
+
+    def __len__(self):
+        return self.sensed.size
+
+    def __getitem__(self, c):
+        if not -self.sensed.size <= c < self.sensed.size:
+            raise IndexError("Neighbourhood column index out of range")
+        return self.sensed.cell(self.r, c % self.sensed.size)
+
+    def __iter__(self):
+        for c in range(self.sensed.size):
+            yield self.sensed.cell(self.r, c)
+
 
 class Neighbourhood:
     def __init__(self, neighbourhood=None):
         if neighbourhood is None:
             self.neighbourhood = list()  # matrix
+            self.sensed = None
             self.valid = False
             self.radius = 0
             self.center = None
@@ -23,48 +111,38 @@ class Neighbourhood:
 
     def __str__(self):
         s = "  "
-        for i in range(len(self.neighbourhood)):
+        for i in range(self.size):
             s += str(i) + (" " if i < 10 else "")
         s += "\n"
-        cnt_r = 0
-        for r in self.neighbourhood:
-            s += str(cnt_r) + (" " if cnt_r < 10 else "")
-            cnt_r += 1
-            for tile in r:
-                if not tile:
-                    s += "_" + " "
+        if not self.sensed:
+            return s
+        for r in range(self.size):
+            s += str(r) + (" " if r < 10 else "")
+            wr = r - self.sensed.offset[0]
+            for c in range(self.size):
+                wc = c - self.sensed.offset[1]
+                if 0 <= wr < self.sensed.mask.shape[0] and 0 <= wc < self.sensed.mask.shape[1] and self.sensed.mask[wr, wc]:
+                    s += str(OBJECT_TYPES[self.sensed.types[wr, wc]].value) + " "
                 else:
-                    s += str(tile.type.value) + " "
+                    s += "_" + " "
             s += "\n"
         return s
 
-    def set_neighbourhood(self, neighbourhood):
-        self.neighbourhood = neighbourhood
+    def set_neighbourhood(self, sensed: SensedArea):
+        self.sensed = sensed
+        self.neighbourhood = NeighbourhoodGrid(sensed)
         self.valid = True
-        self.radius = len(self.neighbourhood) // 2
+        self.radius = sensed.radius
         self.center = (self.radius, self.radius)
-        self.center_abs_coordinates = self.neighbourhood[self.center[0]][self.center[1]].position
-        self.size = len(self.neighbourhood)
+        self.center_abs_coordinates = sensed.center
+        self.size = sensed.size
         self.objects = {t: [] for t in (ObjectType.AGENT, ObjectType.HUB, ObjectType.FOOD)}
 
-        for row in self.neighbourhood:
-            for cell in row:
-                if cell and cell.occupied:
-                    distance = compute_distance(self.center_abs_coordinates, cell.position)
-                    if not self.objects[cell.type]:
-                        self.objects[cell.type] = [(cell, distance)]
-                    else:
-                        self.objects[cell.type].append((cell, distance))
-
+        for r, c, obj_type, distance in sensed.occupied:
+            self.objects[obj_type].append((sensed.board.tile(*sensed.abs_position(r, c)), distance))
 
     def get(self, obj_type: ObjectType):
-        cells_with_object = list()
-        for row in self.neighbourhood:
-            for cell in row:
-                if cell and cell.occupied:
-                    if cell.object.type == obj_type:
-                        cells_with_object.append(cell)
-
+        cells_with_object = [cell for cell, _ in self.objects.get(obj_type, ())]
         return len(cells_with_object) > 0, cells_with_object
 
     def get_relative_pos(self, abs_pos):
@@ -111,23 +189,38 @@ class Neighbourhood:
 
 
 class LocalMap:
-    def __init__(self, agent, size):
+    """
+    Agent's memory of the board. Only the explored part is stored: the board is split into square chunks and
+    a chunk (array with the step in which every of its cells was seen last, 0 = never) is allocated when
+    the agent senses any of its cells for the first time. Objects seen are kept in a SpatialIndex.
+    """
+    def __init__(self, agent, size, chunk_size=16):
         self.size = size
         self.agent: EvoAgent = agent
-        self.map = [[None for _ in range(size)] for _ in range(size)]
-        # helper dict to store coordinates of objects of each type
-        self.objects: Dict[ObjectType, Set[(int, int)]] = {t: set() for t in (ObjectType.AGENT, ObjectType.HUB, ObjectType.FOOD)}
+        self.board = None  # set by the first update
+        self.chunk_size = chunk_size
+        self.chunks: Dict[Tuple[int, int], np.ndarray] = dict()
+        # helper index to store coordinates of objects of each type
+        self.objects = SpatialIndex()
 
     def __str__(self):
+        """
+        Prints the explored part of the map (bounding box of the allocated chunks) with absolute coordinates.
+        """
+        if not self.chunks:
+            return "  \n"
+        r_min = min(key[0] for key in self.chunks) * self.chunk_size
+        r_max = min((max(key[0] for key in self.chunks) + 1) * self.chunk_size, self.size)
+        c_min = min(key[1] for key in self.chunks) * self.chunk_size
+        c_max = min((max(key[1] for key in self.chunks) + 1) * self.chunk_size, self.size)
         s = "  "
-        for i in range(len(self.map)):
+        for i in range(c_min, c_max):
             s += str(i) + (" " if i < 10 else "")
         s += "\n"
-        cnt_r = 0
-        for r in self.map:
-            s += str(cnt_r) + (" " if cnt_r < 10 else "")
-            cnt_r += 1
-            for tile in r:
+        for r in range(r_min, r_max):
+            s += str(r) + (" " if r < 10 else "")
+            for c in range(c_min, c_max):
+                tile = self.get_tile((r, c))
                 if not tile:
                     s += "_" + " "
                 else:
@@ -135,10 +228,22 @@ class LocalMap:
             s += "\n"
         return s
 
-    def set_tile(self, tile, pos):
-        if not pos:
-            pos = tile.position
-        self.map[pos[0]][pos[1]] = tile
+    def last_seen(self, pos) -> int:
+        """
+        Returns the step in which the position was sensed last time, 0 if never.
+        """
+        chunk = self.chunks.get((pos[0] // self.chunk_size, pos[1] // self.chunk_size))
+        if chunk is None:
+            return 0
+        return int(chunk[pos[0] % self.chunk_size, pos[1] % self.chunk_size])
+
+    def get_tile(self, pos) -> Optional['TileModel']:
+        """
+        Returns the tile at the position if it was already explored, else None.
+        """
+        if self.last_seen(pos):
+            return self.board.tile(pos[0], pos[1])
+        return None
 
     def get_objects(self, object_type: ObjectType, max_distance=None):
         """
@@ -146,14 +251,27 @@ class LocalMap:
         """
         if not max_distance:
             max_distance = self.size
-        return_list = list()
-        for pos in self.objects[object_type]:
-            distance = compute_distance(self.agent.position, pos)
-            if distance <= max_distance:
-                return_list.append(self.map[pos[0]][pos[1]])
-        return return_list
-
+        return [self.board.tile(*pos) for pos, _, _ in self.objects.within(object_type, self.agent.position, max_distance)]
 
+    def _mark_seen(self, sensed: SensedArea, step):
+        """
+        Writes the step as the last seen step of all the sensed cells, chunk by chunk.
+        """
+        cs = self.chunk_size
+        r_start, r_stop = sensed.area[0].start, sensed.area[0].stop
+        c_start, c_stop = sensed.area[1].start, sensed.area[1].stop
+        for chunk_r in range(r_start // cs, (r_stop - 1) // cs + 1):
+            for chunk_c in range(c_start // cs, (c_stop - 1) // cs + 1):
+                # intersection of the chunk and the sensed window, in absolute coordinates
+                r0, r1 = max(r_start, chunk_r * cs), min(r_stop, (chunk_r + 1) * cs)
+                c0, c1 = max(c_start, chunk_c * cs), min(c_stop, (chunk_c + 1) * cs)
+                mask = sensed.mask[r0 - r_start:r1 - r_start, c0 - c_start:c1 - c_start]
+                if not mask.any():
+                    continue
+                chunk = self.chunks.get((chunk_r, chunk_c))
+                if chunk is None:
+                    chunk = self.chunks[(chunk_r, chunk_c)] = np.zeros((cs, cs), dtype=np.int32)
+                chunk[r0 - chunk_r * cs:r1 - chunk_r * cs, c0 - chunk_c * cs:c1 - chunk_c * cs][mask] = step
 
     def get_next_tile_in_dir(self, curr_pos, direction):
         next_tile = None
@@ -184,16 +302,21 @@ class LocalMap:
         return next_tile
     
     def update(self, neighbourhood: Neighbourhood) -> None:
-        for row in neighbourhood.neighbourhood:
-            for cell in row:
-                if cell:
-                    self.map[cell.position[0]][cell.position[1]] = cell
-                    if cell.occupied:  # update present objects
-                        self.objects[cell.type].add(tuple(cell.position))
-                    elif not cell.occupied:  # update removed objects
-                        for obj_type in self.objects:
-                            if tuple(cell.position) in self.objects[obj_type]:
-                                self.objects[obj_type].remove(tuple(cell.position)) 
-                # else not needed because no cell can be unsetted; even non occupied cell is a cell, not None
-        
-        
\ No newline at end of file
+        self.board = neighbourhood.sensed.board
+        # Steps are counted from 1, 0 means "never seen"
+        self._mark_seen(neighbourhood.sensed, max(self.agent.steps, 1))
+
+        # Apply only the changes of the objects within the sensed area
+        occupied = set()
+        for cells in neighbourhood.objects.values():
+            occupied.update(tuple(cell.position) for cell, _ in cells)
+        for obj_type, cells in neighbourhood.objects.items():
+            known = {pos for pos, _, _ in
+                     self.objects.within(obj_type, neighbourhood.center_abs_coordinates, neighbourhood.radius)}
+            # new objects
+            for cell, _ in cells:
+                if tuple(cell.position) not in known:
+                    self.objects.add(obj_type, cell.position)
+            # removed objects = sensed positions that are not occupied anymore
+            for pos in known - occupied:
+                self.objects.remove(obj_type, pos)
@@ -1,7 +1,6 @@
-from swarm.types import ObjectType
+from swarm.types import ObjectType, Color
 #from swarm.models import TileModel, BoardModel
 from swarm.math import compute_distance, compute_area
-from PyQt5 import QtCore
 
 
 class EnvironmentObject:
@@ -14,18 +13,15 @@ class EnvironmentObject:
         self.tiles = list()
         self.radius = radius
 
-        self.color = QtCore.Qt.black
+        self.color = Color.BLACK
         self.image = None
 
     def set_place(self, position, board_model):
         self.placed = True
         self.position = list()
-        for row in board_model.tiles:
-            for tile in row:
-                dist = compute_distance(position, tile.position)
-                if dist <= self.radius:
-                    self.tiles.append(tile)
-                    self.position.append(tile.position)
+        for r, c in board_model.positions_within(position, self.radius):
+            self.tiles.append(board_model.tile(r, c))
+            self.position.append((r, c))
 
     def remove_part(self, position):
         removed = False
@@ -50,7 +46,7 @@ class EnvironmentObject:
 class FoodSource(EnvironmentObject):
     def __init__(self, name, object_type=ObjectType.FOOD, radius=1, food_limit=0):
         super(FoodSource, self).__init__(name, object_type, radius)
-        self.color = QtCore.Qt.green
+        self.color = Color.GREEN
 
         if food_limit == 0:
             self.food_limit = compute_area(self.radius)
@@ -65,5 +61,5 @@ class FoodSource(EnvironmentObject):
 class Hub(EnvironmentObject):
     def __init__(self, name, object_type, radius):
         super(Hub, self).__init__(name, object_type, radius)
-        self.color = QtCore.Qt.darkRed
+        self.color = Color.DARK_RED
 
@@ -0,0 +1,262 @@
+"""
+Struct-of-arrays view of the agents and vectorised versions of the primitive motion behaviours.
+
+Agents with MOTION "vectorised" do not random walk or walk to their goals one by one: PPARandomWalk, GoTo and GoAway
+only enqueue an intent to the backend's MotionBatch and all the intents of a simulation step are done at once by the
+kernels below (random_walk, next_steps, resolve_moves), working on the rows of the AgentStore arrays instead of the
+agents' attributes and neighbourhoods.
+"""
+import numpy as np
+
+from swarm.models import TYPE_CODES
+from swarm.types import Direction, ObjectType
+
+# Heading codes, index to DELTAS
+HEADINGS = (Direction.UP, Direction.RIGHT, Direction.DOWN, Direction.LEFT)
+HEADING_CODES = {heading: code for code, heading in enumerate(HEADINGS)}
+NO_HEADING = -1
+DELTAS = np.array([(-1, 0), (0, 1), (1, 0), (0, -1)], dtype=np.int32)  # (row, column) step in the heading
+REVERSE = np.array([2, 3, 0, 1])
+# Direction.broad_direction of the headings, in the same order
+BROAD = np.array([[0, 3, 1], [0, 2, 1], [2, 3, 1], [0, 2, 3]])
+NO_POSITION = -1
+GOAL_TYPES = (TYPE_CODES[ObjectType.FOOD], TYPE_CODES[ObjectType.HUB])
+
+
+def heading_code(heading):
+    """
+    Code of the heading of an agent (Direction, broad heading = list of directions or None).
+    """
+    if isinstance(heading, (list, tuple)):
+        heading = heading[0] if heading else None
+    return HEADING_CODES.get(heading, NO_HEADING)
+
+
+class AgentStore:
+    """
+    State of the agents used by the motion kernels, one row per agent: position, heading code, carry state, goal
+    position (NO_POSITION if none), whether the agent walks towards the goal (or away from it) and whether the last
+    random walk failed. Rows are allocated by add() when the
+    agents are registered. Rows are refreshed from the agents by pull() and written back by push(), the agents'
+    attributes stay the state the rest of the simulation uses.
+    """
+    def __init__(self, capacity=64):
+        self.agents = list()
+        self._index_of = dict()  # agent -> row
+        self.positions = np.zeros((capacity, 2), dtype=np.int32)
+        self.headings = np.full(capacity, NO_HEADING, dtype=np.int8)
+        self.carrying = np.zeros(capacity, dtype=bool)
+        self.goals = np.full((capacity, 2), NO_POSITION, dtype=np.int32)
+        self.towards = np.ones(capacity, dtype=bool)
+        self.failed = np.zeros(capacity, dtype=bool)
+
+    def __contains__(self, agent):
+        return agent in self._index_of
+
+    def add(self, agent):
+        idx = self._index_of[agent] = len(self.agents)
+        self.agents.append(agent)
+        if idx == len(self.headings):
+            self._grow()
+
+    def index_of(self, agent) -> int:
+        return self._index_of[agent]
+
+    def _grow(self):
+        for name in ("positions", "headings", "carrying", "goals", "towards", "failed"):
+            array = getattr(self, name)
+            grown = np.empty((2 * len(array),) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            grown[len(array):] = {"goals": NO_POSITION, "headings": NO_HEADING, "towards": True}.get(name, 0)
+            setattr(self, name, grown)
+
+    def pull(self, rows):
+        for idx in rows.tolist():
+            agent = self.agents[idx]
+            self.positions[idx] = agent.position
+            self.headings[idx] = heading_code(agent.heading)
+            self.carrying[idx] = bool(agent.inventory)
+
+    def push(self, rows, board):
+        for idx in rows.tolist():
+            agent = self.agents[idx]
+            agent.set_position(self.positions[idx].tolist())
+            heading = self.headings[idx]
+            if heading != NO_HEADING:
+                agent.heading = HEADINGS[heading]
+            goal = self.goals[idx]
+            agent.goal = board.tile(int(goal[0]), int(goal[1])) if goal[0] != NO_POSITION else None
+
+
+def random_walk(board, positions, headings, failed, radius, change_prob, rng):
+    """
+    RandomWalk of many agents: heading is changed with probability change_prob (percent), or if the last walk failed,
+    goal is the first occupied tile within radius in the heading. Returns (headings, goals, found), goals of the agents
+    without any occupied tile in sight (found False) are NO_POSITION.
+    """
+    n = len(positions)
+    change = (rng.integers(1, 101, n) <= change_prob) | failed | (headings == NO_HEADING)
+    headings = np.where(change, rng.integers(0, 4, n), headings)
+    steps = np.arange(1, int(radius.max(initial=0)) + 1)
+    rays = positions[:, None, :] + steps[None, :, None] * DELTAS[headings][:, None, :]  # (agent, distance, 2)
+    inside = ((rays >= 0) & (rays < board.dimension)).all(axis=2) & (steps[None, :] <= radius[:, None])
+    clipped = np.clip(rays, 0, board.dimension - 1)
+    occupied = board.occupancy[clipped[..., 0], clipped[..., 1]] & inside
+    found = occupied.any(axis=1)
+    goals = rays[np.arange(n), occupied.argmax(axis=1)]
+    goals[~found] = NO_POSITION
+    return headings, goals, found
+
+
+def headings_towards(positions, goals):
+    """
+    heading_from_pos of many agents (towards the goals), as heading codes.
+    """
+    dy = goals[:, 0] - positions[:, 0]
+    dx = goals[:, 1] - positions[:, 1]
+    angle = np.degrees(np.arctan2(-dy, dx)) % 360
+    headings = np.zeros(len(positions), dtype=np.int64)  # UP, also angles between the sectors as in heading_from_pos
+    headings[(135 <= angle) & (angle <= 224)] = HEADING_CODES[Direction.LEFT]
+    headings[(225 <= angle) & (angle <= 314)] = HEADING_CODES[Direction.DOWN]
+    headings[(angle >= 315) | (angle <= 44)] = HEADING_CODES[Direction.RIGHT]
+    return headings
+
+
+def next_steps(board, positions, goals, towards=True):
+    """
+    SetNextStep of many agents (greedy navigation): one step in the heading to the goal if the tile is free, else
+    the step in the broad heading closest to the goal (farthest from it if not towards).
+    Returns (next steps, headings, success), agents without any free step keep their positions.
+    """
+    n = len(positions)
+    rows = np.arange(n)
+    headings = headings_towards(positions, goals)
+    if towards:
+        candidates = np.column_stack((headings, BROAD[headings]))  # direct heading first
+    else:
+        candidates = BROAD[REVERSE[headings]]
+    steps = positions[:, None, :] + DELTAS[candidates]  # (agent, candidate, 2)
+    inside = ((steps >= 0) & (steps < board.dimension)).all(axis=2)
+    clipped = np.clip(steps, 0, board.dimension - 1)
+    valid = inside & ~board.occupancy[clipped[..., 0], clipped[..., 1]]
+    distances = np.abs(steps - goals[:, None, :]).sum(axis=2)
+    if towards:
+        # direct heading if possible, else the closest of the broad ones (first on ties, as the stable sort)
+        distances[:, 0] = -1
+        choice = np.where(valid, distances, np.iinfo(np.int32).max).argmin(axis=1)
+    else:
+        choice = np.where(valid, distances, -1).argmax(axis=1)
+    success = valid[rows, choice]
+    chosen = np.where(success, candidates[rows, choice], headings)
+    return np.where(success[:, None], steps[rows, choice], positions), chosen, success
+
+
+def resolve_moves(board, positions, targets):
+    """
+    Collision-checked moves of many agents in the order of the arrays: an agent moves if the target is on the board,
+    is free and no agent before it moves to the same tile. Returns the mask of the agents that move.
+    """
+    inside = ((targets >= 0) & (targets < board.dimension)).all(axis=1)
+    clipped = np.clip(targets, 0, board.dimension - 1)
+    free = inside & ~board.occupancy[clipped[:, 0], clipped[:, 1]] & (targets != positions).any(axis=1)
+    moves = np.zeros(len(targets), dtype=bool)
+    candidates = np.flatnonzero(free)
+    _, first = np.unique(clipped[candidates, 0] * board.dimension + clipped[candidates, 1], return_index=True)
+    moves[candidates[first]] = True
+    return moves
+
+
+class MotionBatch:
+    """
+    Random walks (PPARandomWalk) and steps to goals (GoTo, GoAway) of the agents with MOTION "vectorised", done
+    together by the backend at the end of the simulation step (run()), in order of the requests: random_walk for the
+    walks, next_steps towards (or away from) the goal and resolve_moves. As with Move, agents next to food or hub
+    they walk to do not move. Agents with NAVIGATION "fields" step to their goals by the navigation service, as
+    SetNextStep does.
+    Intents are optimistic - the behaviours succeed when enqueuing, the result shows in the agent's position, heading
+    and goal after the step (and in its trace).
+    """
+    def __init__(self, backend, seed=None):
+        self.backend = backend
+        self.store = AgentStore()
+        self.rng = np.random.default_rng(seed)
+        self.requests = list()  # (store row, change probability or None, goal position, towards)
+
+    def request(self, agent, change_prob):
+        self.requests.append((self.store.index_of(agent), change_prob, None, True))
+
+    def request_goal(self, agent, goal, towards=True):
+        self.requests.append((self.store.index_of(agent), None, tuple(goal), towards))
+
+    def run(self):
+        requests, self.requests = self.requests, list()
+        if not requests:
+            return
+        store = self.store
+        board = self.backend.board_model
+        rows = np.array([request[0] for request in requests], dtype=np.intp)
+        walks = np.array([request[1] is not None for request in requests])
+        store.pull(rows)
+        positions = store.positions[rows]
+        headings = store.headings[rows]
+        store.goals[rows] = [request[2] or (NO_POSITION, NO_POSITION) for request in requests]
+        store.towards[rows] = [request[3] for request in requests]
+
+        walkers = rows[walks]
+        found = np.zeros(len(walkers), dtype=bool)
+        if len(walkers):
+            change_prob = np.array([request[1] for request in requests if request[1] is not None])
+            radius = np.array([store.agents[idx].sense_radius for idx in walkers.tolist()])
+            walk_headings, walk_goals, found = random_walk(board, positions[walks], headings[walks],
+                                                           store.failed[walkers], radius, change_prob, self.rng)
+            store.failed[walkers] = ~found
+            store.goals[walkers] = walk_goals
+            headings[walks] = walk_headings
+
+        goals = store.goals[rows]
+        towards = store.towards[rows]
+        walking = np.flatnonzero(~walks)
+        walking = np.sort(np.concatenate((walking, np.flatnonzero(walks)[found])))
+        steps = positions[walking].copy()
+        step_headings = headings[walking].copy()
+        success = np.zeros(len(walking), dtype=bool)
+        for direction in (True, False):
+            group = towards[walking] == direction
+            if group.any():
+                steps[group], step_headings[group], success[group] = next_steps(
+                    board, positions[walking[group]], goals[walking[group]], direction)
+        # agents next to the food or hub they walk to stay (Move)
+        goal_types = board.types[goals[walking, 0], goals[walking, 1]]
+        arrived = np.isin(goal_types, GOAL_TYPES) & (np.abs(goals[walking] - positions[walking]).sum(axis=1) == 1)
+        navigation = self.backend.navigation
+        for i in np.flatnonzero(~walks[walking] & ~arrived).tolist():
+            if store.agents[rows[walking[i]]].GE_params["NAVIGATION"] != "fields":
+                continue
+            position = tuple(positions[walking[i]].tolist())
+            step = navigation.next_step(tuple(goals[walking[i]].tolist()), position, bool(towards[walking[i]]))
+            if step and step[0] == position:  # already next to the object (Move)
+                arrived[i] = True
+            elif step:
+                steps[i], heading = step
+                step_headings[i] = HEADING_CODES[heading] if heading else step_headings[i]
+                success[i] = True
+        headings[walking] = step_headings
+        store.headings[rows] = headings
+        store.goals[rows[walking[arrived]]] = NO_POSITION
+        movers = walking[success & ~arrived]
+        targets = steps[success & ~arrived]
+        moved = resolve_moves(board, positions[movers], targets)
+
+        trace = self.backend.trace
+        for idx, position, target, ok in zip(rows[movers].tolist(), positions[movers].tolist(), targets.tolist(),
+                                              moved.tolist()):
+            agent = store.agents[idx]
+            agent.next_step = tuple(target)
+            if ok:
+                board.remove_object(agent, position)
+                board.place_object(agent, target)
+                store.positions[idx] = target
+                agent.neighbourhood.valid = False
+            if trace:
+                trace.move(agent.name, agent.steps, position, target, ok)
+        store.push(rows, board)
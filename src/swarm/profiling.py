@@ -0,0 +1,132 @@
+import csv
+import itertools
+import json
+import time
+from threading import Lock
+
+import numpy as np
+
+# Measured phases of the simulation; the code of a phase is its index.
+PHASES = ("sense", "exchange", "bt_tick", "fitness", "selection", "crossover", "mutation", "attribute_check",
+          "evaluation", "replacement", "initialisation", "gui")
+PHASE_CODES = {phase: code for code, phase in enumerate(PHASES)}
+BACKEND = "backend"  # owner of the phases not done by an agent (GUI updates)
+
+
+class PhaseTimer:
+    """
+    Wall and CPU time spent in the phases of the simulation.
+
+    Every measurement is stored in a ring buffer of the last capacity records (step, owner, phase, wall, cpu) and
+    added to the totals of its owner (agent name or BACKEND), which are kept for the whole run.
+    CPU time is the time of the measuring thread, so it is correct also while other threads (GUI) run.
+    The backend holds the timer in backend.timer, None if timing is off - the measured code only checks it:
+
+        timer = self.backend.timer
+        if timer:
+            start = timer.start()
+        ...
+        if timer:
+            start = timer.lap(self.name, self.steps, "sense", start)
+    """
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        self.steps = np.zeros(self.capacity, dtype=np.int32)
+        self.owners = np.zeros(self.capacity, dtype=np.int32)
+        self.phases = np.zeros(self.capacity, dtype=np.int8)
+        self.wall = np.zeros(self.capacity, dtype=np.float64)
+        self.cpu = np.zeros(self.capacity, dtype=np.float64)
+        self.owner_names = list()
+        self._owner_ids = dict()  # owner name -> index to owner_names
+        self._owner_lock = Lock()
+        self.totals = dict()  # owner name -> array of (count, wall, cpu) per phase
+        self._counter = itertools.count()  # next() is atomic, threads get distinct slots
+
+    def _owner_id(self, owner):
+        owner_id = self._owner_ids.get(owner)
+        if owner_id is None:
+            with self._owner_lock:
+                owner_id = self._owner_ids.get(owner)
+                if owner_id is None:
+                    self.totals[owner] = np.zeros((len(PHASES), 3))
+                    self.owner_names.append(owner)
+                    owner_id = self._owner_ids[owner] = len(self.owner_names) - 1
+        return owner_id
+
+    @staticmethod
+    def start():
+        return time.perf_counter(), time.thread_time()
+
+    def lap(self, owner, step, phase, start):
+        """
+        Records the time from start (see start()) as spent in the phase, returns start of the next phase.
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        self.record(owner, step, phase, wall - start[0], cpu - start[1])
+        return wall, cpu
+
+    def record(self, owner, step, phase, wall, cpu):
+        owner_id = self._owner_id(owner)
+        code = PHASE_CODES[phase]
+        slot = next(self._counter) % self.capacity
+        self.steps[slot] = step
+        self.owners[slot] = owner_id
+        self.phases[slot] = code
+        self.wall[slot] = wall
+        self.cpu[slot] = cpu
+        totals = self.totals[owner][code]
+        totals[0] += 1
+        totals[1] += wall
+        totals[2] += cpu
+
+    def records(self):
+        """
+        Returns (steps, owners, phases, wall, cpu) arrays of the buffered records, oldest first.
+        """
+        count = next(self._counter)
+        self._counter = itertools.count(count)
+        if count <= self.capacity:
+            order = np.arange(count)
+        else:
+            order = np.roll(np.arange(self.capacity), -(count % self.capacity))
+        return self.steps[order], self.owners[order], self.phases[order], self.wall[order], self.cpu[order]
+
+    def summary(self):
+        """
+        Returns dict with the totals per owner and phase and the wall/cpu time per step and phase (summed over
+        the owners, from the buffered records only).
+        """
+        per_owner = {owner: {phase: {"count": int(totals[code][0]), "wall": totals[code][1], "cpu": totals[code][2]}
+                             for code, phase in enumerate(PHASES) if totals[code][0]}
+                     for owner, totals in self.totals.items()}
+        steps, _, phases, wall, cpu = self.records()
+        per_step = dict()
+        if len(steps):
+            first = int(steps.min())
+            shape = (int(steps.max()) - first + 1, len(PHASES))
+            step_wall, step_cpu = np.zeros(shape), np.zeros(shape)
+            np.add.at(step_wall, (steps - first, phases), wall)
+            np.add.at(step_cpu, (steps - first, phases), cpu)
+            for code, phase in enumerate(PHASES):
+                if step_wall[:, code].any() or step_cpu[:, code].any():
+                    per_step[phase] = {"wall": step_wall[:, code].tolist(), "cpu": step_cpu[:, code].tolist()}
+            per_step["first_step"] = first
+        return {"phases": list(PHASES), "per_owner": per_owner, "per_step": per_step}
+
+    def export_csv(self, filename):
+        """
+        Writes the buffered records to a CSV file, one record per line.
+        """
+        steps, owners, phases, wall, cpu = self.records()
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("step", "owner", "phase", "wall", "cpu"))
+            for row in zip(steps.tolist(), owners.tolist(), phases.tolist(), wall.tolist(), cpu.tolist()):
+                writer.writerow((row[0], self.owner_names[row[1]], PHASES[row[2]], row[3], row[4]))
+
+    def export_json(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.summary(), f, indent=1)
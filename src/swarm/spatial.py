@@ -0,0 +1,128 @@
+from typing import Dict, List, Tuple
+
+from swarm.types import ObjectType
+
+
+class SpatialIndex:
+    """
+    Uniform grid (spatial hash) of positions of objects, kept separately for every ObjectType.
+    The grid is split into square buckets of cell_size x cell_size positions, so radius and nearest neighbour
+    queries only visit the buckets around the queried position - the cost depends on the number of objects
+    nearby, not on the size of the board or the number of all objects.
+    Distances are computed the same way as compute_distance (Manhattan distance).
+    """
+    def __init__(self, cell_size=8):
+        self.cell_size = cell_size
+        # type -> bucket -> position -> object
+        self.buckets: Dict[ObjectType, Dict[Tuple[int, int], Dict[Tuple[int, int], object]]] = dict()
+        self.counts: Dict[ObjectType, int] = dict()
+
+    def _bucket(self, position):
+        return position[0] // self.cell_size, position[1] // self.cell_size
+
+    def add(self, obj_type: ObjectType, position, obj=None):
+        position = (position[0], position[1])
+        bucket = self.buckets.setdefault(obj_type, dict()).setdefault(self._bucket(position), dict())
+        if position not in bucket:
+            self.counts[obj_type] = self.counts.get(obj_type, 0) + 1
+        bucket[position] = obj
+
+    def remove(self, obj_type: ObjectType, position) -> bool:
+        position = (position[0], position[1])
+        buckets = self.buckets.get(obj_type)
+        if not buckets:
+            return False
+        key = self._bucket(position)
+        bucket = buckets.get(key)
+        if not bucket or position not in bucket:
+            return False
+        del bucket[position]
+        if not bucket:
+            del buckets[key]
+        self.counts[obj_type] -= 1
+        return True
+
+    def move(self, obj_type: ObjectType, old_position, new_position, obj=None):
+        self.remove(obj_type, old_position)
+        self.add(obj_type, new_position, obj)
+
+    def count(self, obj_type: ObjectType) -> int:
+        return self.counts.get(obj_type, 0)
+
+    def positions(self, obj_type: ObjectType):
+        for bucket in self.buckets.get(obj_type, dict()).values():
+            yield from bucket.keys()
+
+    def within(self, obj_type: ObjectType, position, radius) -> List[Tuple[Tuple[int, int], object, int]]:
+        """
+        Returns (position, object, distance) for every object of the type no farther than radius from the position,
+        ordered by position (row by row).
+        """
+        buckets = self.buckets.get(obj_type)
+        if not buckets:
+            return []
+        r, c = position
+        hits = list()
+        if len(buckets) <= ((2 * radius) // self.cell_size + 2) ** 2:
+            # Fewer buckets than the queried area covers, faster to check them all
+            candidates = buckets.values()
+        else:
+            r_min, c_min = self._bucket((r - radius, c - radius))
+            r_max, c_max = self._bucket((r + radius, c + radius))
+            candidates = [buckets[(br, bc)] for br in range(r_min, r_max + 1) for bc in range(c_min, c_max + 1)
+                          if (br, bc) in buckets]
+        for bucket in candidates:
+            for pos, obj in bucket.items():
+                distance = abs(pos[0] - r) + abs(pos[1] - c)
+                if distance <= radius:
+                    hits.append((pos, obj, distance))
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+    def nearest(self, obj_type: ObjectType, position, k=1, max_distance=None) -> List[Tuple[Tuple[int, int], object, int]]:
+        """
+        Returns (position, object, distance) for (at most) k objects of the type closest to the position, ordered by
+        distance (ties by position). Objects farther than max_distance (if set) are ignored.
+        """
+        buckets = self.buckets.get(obj_type)
+        if not buckets or k <= 0:
+            return []
+        center = self._bucket(position)
+        # no bucket can be farther (in buckets) than this
+        max_ring = max(max(abs(br - center[0]), abs(bc - center[1])) for br, bc in buckets.keys())
+        hits = list()
+        ring = 0
+        while ring <= max_ring:
+            for key in self._ring(center, ring):
+                bucket = buckets.get(key)
+                if not bucket:
+                    continue
+                for pos, obj in bucket.items():
+                    distance = abs(pos[0] - position[0]) + abs(pos[1] - position[1])
+                    if max_distance is None or distance <= max_distance:
+                        hits.append((pos, obj, distance))
+            # everything not visited yet is farther than ring * cell_size
+            bound = ring * self.cell_size
+            if max_distance is not None and bound >= max_distance:
+                break
+            if len(hits) >= k:
+                hits.sort(key=lambda hit: (hit[2], hit[0]))
+                if hits[k - 1][2] <= bound:
+                    break
+            ring += 1
+        hits.sort(key=lambda hit: (hit[2], hit[0]))
+        return hits[:k]
+
+    @staticmethod
+    def _ring(center, ring):
+        """Buckets at the given Chebyshev distance (in buckets) from the center bucket."""
+        if ring == 0:
+            yield center
+            return
+        r, c = center
+        for bc in range(c - ring, c + ring + 1):
+            yield r - ring, bc
+            yield r + ring, bc
+        for br in range(r - ring + 1, r + ring):
+            yield br, c - ring
+            yield br, c + ring
@@ -0,0 +1,201 @@
+"""
+Headless sweeps of swarm simulations over a grid of parameters and seeds.
+
+The sweep is described by a JSON file:
+
+    {"param_file": "AG_params.txt", "steps": 500, "seeds": [1, 2, 3],
+     "grid": {"agents": [50, 100], "sense_radius": [5, 10], "BETA": [0.1, 0.5], "PENALTY": [false, true],
+              "EXPLORATION_FITNESS_FUNCTION": ["linear", "exponential"], "MAX_STEPS_WITHOUT_EVOLUTION": [100, 200]}}
+
+Keys of the grid in lower case are settings of the simulation (SIMULATION_SETTINGS), the rest are GE parameters
+overriding the ones of the params file. Every combination is run with every seed (seed of the backend and
+RANDOM_SEED of the agents) in a process pool, each run in its own process with optional time and memory limits:
+
+    python -m swarm.sweep sweep.json [--name NAME] [--processes N] [--time-limit S] [--memory-limit MB]
+
+Runs log to ../results/NAME/run_<id> and leave their result in run.json there. The id is a hash of the run's
+settings, steps and params file, so a sweep invoked again reuses the finished runs and only does the missing (or
+failed) ones. All the results are merged to ../results/NAME/sweep.csv, one row per run and step: settings of the run,
+avg and best fitness (fitness_history of the backend) and the food stats of the whole run.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import resource
+import signal
+import sys
+import time
+from multiprocessing import Pool
+
+# Settings of the simulation that can be swept (grid key -> default), other grid keys are GE parameters
+SIMULATION_SETTINGS = {"agents": 100, "sense_radius": 10, "board_size": 100, "food_position": [32, 32]}
+FINISHED = "finished"
+COLUMNS = ("step", "avg_fitness", "best_fitness", "food_picked", "food_dropped", "food_inside_base", "duration",
+           "max_rss", "status")
+
+
+def expand_grid(grid, seeds):
+    """
+    Returns settings of all the runs of the sweep (dicts: grid key -> value, plus seed), one per combination
+    of the grid values and seed.
+    """
+    keys = sorted(grid)
+    return [dict(zip(keys, values), seed=seed)
+            for values in itertools.product(*(grid[key] for key in keys)) for seed in seeds]
+
+
+def run_id(config, param_file, steps) -> str:
+    with open(param_file) as f:
+        param_text = f.read()
+    key = json.dumps({"config": config, "params": param_text, "steps": steps}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def _timeout(signum, frame):
+    raise TimeoutError("Time limit of the run exceeded")
+
+
+def run_simulation(config, param_file, steps, folder, time_limit=None, memory_limit=None):
+    """
+    Runs one simulation of the sweep headless (in the calling process, limits are set for the whole process)
+    and returns its result, also written to run.json in the folder (relative to ../results).
+
+    :param time_limit: Wall time limit of the run in seconds, None = unlimited.
+    :param memory_limit: Address space limit of the process in MB, None = unlimited.
+    """
+    from swarm.backend import TestBackend
+
+    sys.argv = sys.argv[:1]  # PonyGE would parse the sweep's arguments
+    if memory_limit:
+        limit = int(memory_limit) * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if time_limit:
+        signal.signal(signal.SIGALRM, _timeout)
+        signal.setitimer(signal.ITIMER_REAL, time_limit)
+
+    settings = dict(SIMULATION_SETTINGS)
+    params = {"LOG_FOLDER": folder, "RANDOM_SEED": config["seed"]}
+    for key, value in config.items():
+        if key in settings:
+            settings[key] = value
+        elif key != "seed":
+            params[key] = value
+
+    result = {"config": config, "param_file": param_file, "steps": steps, "status": FINISHED}
+    start = time.perf_counter()
+    try:
+        backend = TestBackend(None, deterministic=True, level=logging.WARNING, dimension=settings["board_size"],
+                              seed=config["seed"], params=params)
+        backend.setup_simulation(settings["agents"], param_file, sense_radius=settings["sense_radius"],
+                                 food_position=settings["food_position"])
+        stats = backend.run_headless(steps)
+        result.update({name: stats[name] for name in ("food_picked", "food_dropped", "food_inside_base")})
+        result["fitness_history"] = [list(line) for line in stats["fitness_history"]]
+    except TimeoutError:
+        result["status"] = "timeout"
+    except MemoryError:
+        result["status"] = "memory"
+    except Exception as e:
+        result["status"] = f"error: {e!r}"
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    result["duration"] = time.perf_counter() - start
+    result["max_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # kB
+
+    os.makedirs(f"../results/{folder}", exist_ok=True)
+    with open(f"../results/{folder}/run.json", "w") as f:
+        json.dump(result, f)
+    return result
+
+
+def _run_job(job):
+    return run_simulation(*job)
+
+
+def load_result(folder):
+    """
+    Returns the result of a run from run.json in its folder, None if there is none.
+    """
+    try:
+        with open(f"../results/{folder}/run.json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def run_sweep(grid, seeds, param_file, steps, name, processes=None, time_limit=None, memory_limit=None):
+    """
+    Runs all the runs of the sweep which have not finished yet and returns results of all of them (list of dicts,
+    in order of expand_grid).
+    """
+    configs = expand_grid(grid, seeds)
+    folders = [f"{name}/run_{run_id(config, param_file, steps)}" for config in configs]
+    results = [load_result(folder) for folder in folders]
+    jobs = [(config, param_file, steps, folder, time_limit, memory_limit)
+            for config, folder, result in zip(configs, folders, results)
+            if result is None or result["status"] != FINISHED]
+    print(f"Sweep {name}: {len(configs)} runs, {len(configs) - len(jobs)} reused, {len(jobs)} to run",
+          file=sys.stderr)
+
+    if jobs:
+        # One process per run - the limits apply to the run only and PonyGE's global state is not shared
+        with Pool(processes=processes, maxtasksperchild=1) as pool:
+            for done, result in enumerate(pool.imap_unordered(_run_job, jobs), start=1):
+                print(f"[{done}/{len(jobs)}] {result['config']}: {result['status']} ({result['duration']:.1f} s)",
+                      file=sys.stderr)
+        results = [load_result(folder) or {"config": config, "status": "failed"}
+                   for config, folder in zip(configs, folders)]
+    return results
+
+
+def results_table(results):
+    """
+    Merges results of the runs to one table (pandas.DataFrame): a row per run and step, runs that did not finish
+    have one row without the step and stats.
+    """
+    import pandas as pd
+
+    keys = sorted({key for result in results for key in result["config"]})
+    columns = {key: list() for key in ("run",) + tuple(keys) + COLUMNS}
+    for idx, result in enumerate(results):
+        history = result.get("fitness_history") or [(None, None)]
+        for step, (avg_fitness, best_fitness) in enumerate(history, start=1):
+            columns["run"].append(idx)
+            for key in keys:
+                columns[key].append(result["config"].get(key))
+            columns["step"].append(step if result["status"] == FINISHED else None)
+            columns["avg_fitness"].append(avg_fitness)
+            columns["best_fitness"].append(best_fitness)
+            for key in COLUMNS[3:]:
+                columns[key].append(result.get(key))
+    return pd.DataFrame(columns)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Runs a sweep of headless swarm simulations.")
+    parser.add_argument("sweep", help="JSON file with param_file, steps, seeds and grid of the sweep")
+    parser.add_argument("--name", help="name of the sweep, its results go to ../results/NAME "
+                                       "(default: name of the sweep file)")
+    parser.add_argument("--processes", type=int, help="number of runs in parallel (default: number of CPUs)")
+    parser.add_argument("--time-limit", type=float, help="wall time limit of one run in seconds")
+    parser.add_argument("--memory-limit", type=float, help="memory (address space) limit of one run in MB")
+    args = parser.parse_args(args)
+
+    with open(args.sweep) as f:
+        sweep = json.load(f)
+    name = args.name or os.path.splitext(os.path.basename(args.sweep))[0]
+    results = run_sweep(sweep.get("grid", {}), sweep.get("seeds", [None]), sweep["param_file"], sweep["steps"], name,
+                        args.processes, args.time_limit, args.memory_limit)
+
+    table = results_table(results)
+    filename = f"../results/{name}/sweep.csv"
+    table.to_csv(filename, index=False)
+    finished = sum(result["status"] == FINISHED for result in results)
+    print(f"{finished}/{len(results)} runs finished, results written to {filename}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
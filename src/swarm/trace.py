@@ -0,0 +1,220 @@
+"""
+Structured event trace of the simulation.
+
+Agents and the backend append typed events (step, move, pick, drop, evolve, fitness) to one shared EventTrace
+instead of formatting text log lines. Events are only tuples in a deque until the writer thread packs them to a binary
+file (see FORMATS). The text form is rendered only when the trace is read:
+
+    python -m swarm.trace ../results/latest/trace.bin [--agent NAME] [--output FOLDER]
+
+prints the log of one agent, or writes logs of all the agents to the output folder (one file per agent, named
+the same as the per-agent log files).
+"""
+import argparse
+import os
+import struct
+import sys
+import threading
+from collections import deque
+
+MAGIC = b"SWTRACE1"
+
+# Event kinds
+NAME = 0  # agent name registered to an agent id, written by the writer before the first event of the agent
+STEP = 1
+MOVE = 2
+PICK = 3
+DROP = 4
+EVOLVE = 5
+FITNESS = 6
+
+# Binary layout of the events (after the kind byte), every event starts with agent id and agent's step number.
+FORMATS = {
+    NAME: struct.Struct("<HH"),  # agent id, length of the utf-8 name following
+    STEP: struct.Struct("<HIiiId"),  # row, column, steps without evolution, fitness at the start of the step
+    MOVE: struct.Struct("<HIiiii?"),  # from row, column, to row, column, moved
+    PICK: struct.Struct("<HIii?"),  # row, column of the item, picked
+    DROP: struct.Struct("<HIii??"),  # row, column, into hub, dropped
+    EVOLVE: struct.Struct("<HI?Idd"),  # reinitialised, number of genomes, fitness before, fitness after
+    FITNESS: struct.Struct("<HIddd"),  # exploration fitness, BT feedback fitness, fitness
+}
+KIND = struct.Struct("<B")
+
+
+class EventTrace:
+    """
+    Shared buffer of the events. Recording methods only append a tuple to a deque (thread safe), so they can be
+    called from any thread. Events are written to the file by a daemon thread every
+    flush_interval seconds and on close().
+    """
+    def __init__(self, flush_interval=0.5):
+        self.flush_interval = flush_interval
+        self.events = deque()
+        self.file = None
+        self._agent_ids = dict()  # agent name -> agent id, used by the writer only
+        self._writer = None
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+
+    def open(self, filename):
+        """
+        Starts writing to the file. Events recorded before are kept and written too. If the file already contains
+        a trace (e.g. restarted simulation), events are appended to it.
+        """
+        self.file = open(filename, "ab")
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self._agent_ids = dict()
+        self._stop.clear()
+        self._writer = threading.Thread(target=self._run, name="trace_writer", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        if self._writer:
+            self._stop.set()
+            self._writer.join()
+            self._writer = None
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            if not self.file:
+                return
+            chunks = list()
+            events = self.events
+            while events:
+                event = events.popleft()
+                kind, name = event[0], event[1]
+                agent_id = self._agent_ids.get(name)
+                if agent_id is None:
+                    agent_id = self._agent_ids[name] = len(self._agent_ids)
+                    encoded = name.encode()
+                    chunks.append(KIND.pack(NAME) + FORMATS[NAME].pack(agent_id, len(encoded)) + encoded)
+                chunks.append(KIND.pack(kind) + FORMATS[kind].pack(agent_id, *event[2:]))
+            self.file.write(b"".join(chunks))
+            self.file.flush()
+
+    # Recording
+
+    def step(self, agent, step, position, steps_without_evolution, fitness):
+        self.events.append((STEP, agent, step, position[0], position[1], steps_without_evolution, fitness))
+
+    def move(self, agent, step, old_position, new_position, moved):
+        self.events.append((MOVE, agent, step, old_position[0], old_position[1], new_position[0], new_position[1],
+                            moved))
+
+    def pick(self, agent, step, position, picked):
+        self.events.append((PICK, agent, step, position[0], position[1], picked))
+
+    def drop(self, agent, step, position, into_hub, dropped):
+        self.events.append((DROP, agent, step, position[0], position[1], into_hub, dropped))
+
+    def evolve(self, agent, step, reinitialised, num_of_genomes, fitness_before, fitness_after):
+        self.events.append((EVOLVE, agent, step, reinitialised, num_of_genomes, fitness_before, fitness_after))
+
+    def fitness(self, agent, step, exploration_fitness, bt_feedback_fitness, fitness):
+        self.events.append((FITNESS, agent, step, exploration_fitness, bt_feedback_fitness, fitness))
+
+
+def read_trace(filename):
+    """
+    Yields the events of the trace file as tuples (kind, agent name, step, fields...) in the order they were written.
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{filename} is not a trace file")
+    names = dict()
+    offset = len(MAGIC)
+    while offset < len(data):
+        kind = data[offset]
+        offset += KIND.size
+        fields = FORMATS[kind].unpack_from(data, offset)
+        offset += FORMATS[kind].size
+        if kind == NAME:
+            agent_id, length = fields
+            names[agent_id] = data[offset:offset + length].decode()
+            offset += length
+        else:
+            yield (kind, names[fields[0]]) + fields[1:]
+
+
+def render(event):
+    """
+    Returns the event as lines of the agent's text log (same format as the log files).
+    """
+    kind, name, step = event[:3]
+    if kind == STEP:
+        row, column, steps_without_evolution, fitness = event[3:]
+        return [f"INFO:[S{step}] Step {step}",
+                f"DEBUG:[POS] Position: {[row, column]}",
+                f"DEBUG:[SWE{steps_without_evolution}] Step without evolution {steps_without_evolution}",
+                f"DEBUG:[F] Current fitness at the start: {fitness}"]
+    elif kind == MOVE:
+        old_position, new_position, moved = event[3:5], event[5:7], event[7]
+        if moved:
+            return [f"DEBUG:{name} moved from {old_position} to {new_position}"]
+        return [f"DEBUG:[CONFLICT] {name} cannot move from {old_position} to {new_position}"]
+    elif kind == PICK:
+        position, picked = event[3:5], event[5]
+        if picked:
+            return [f"DEBUG:[PCK] {name} picked item at {position}"]
+        return [f"DEBUG:[CONFLICT] {name} cannot pick item at {position}"]
+    elif kind == DROP:
+        position, into_hub, dropped = event[3:5], event[5], event[6]
+        lines = [f"DEBUG:[DRP] {name} drops item at {position}" + ("" if dropped else ", not dropped")]
+        if into_hub and dropped:
+            lines.append(f"INFO:{name} dropped food to the base")
+        return lines
+    elif kind == EVOLVE:
+        reinitialised, num_of_genomes, fitness_before, fitness_after = event[3:]
+        if reinitialised:
+            first = "DEBUG:[EVO] Reached MAX_STEPS_WITHOUT_EVOLUTION, reinitialising genome (exchanged genomes retained)."
+        else:
+            first = "DEBUG:[EVO] Performing evolution step"
+        return [first, f"DEBUG:[EVO] Evolution step finished ({num_of_genomes} genomes, fitness {fitness_before} -> "
+                       f"{fitness_after})"]
+    elif kind == FITNESS:
+        exploration_fitness, bt_feedback_fitness, fitness = event[3:]
+        return [f"DEBUG:[F] EX: {exploration_fitness}, BT: {bt_feedback_fitness}, BETA*previous+current: {fitness}"]
+    raise ValueError(f"Unknown event kind {kind}")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Reconstructs per-agent logs from a trace of the simulation.")
+    parser.add_argument("trace", help="trace file (trace.bin in the results folder)")
+    parser.add_argument("--agent", help="print log of this agent only")
+    parser.add_argument("--output", help="folder for the logs of all the agents (default: trace_logs next to the "
+                                         "trace file)")
+    args = parser.parse_args(args)
+
+    if args.agent:
+        for event in read_trace(args.trace):
+            if event[1] == args.agent:
+                print("\n".join(render(event)))
+        return
+
+    output = args.output or os.path.join(os.path.dirname(args.trace), "trace_logs")
+    os.makedirs(output, exist_ok=True)
+    files = dict()
+    try:
+        for event in read_trace(args.trace):
+            f = files.get(event[1])
+            if f is None:
+                f = files[event[1]] = open(os.path.join(output, event[1]), "w")
+            f.write("\n".join(render(event)) + "\n")
+    finally:
+        for f in files.values():
+            f.close()
+    print(f"Logs of {len(files)} agents written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -72,4 +72,14 @@ class Direction(enum.Enum):
         elif direction == Direction.LEFT:
             ret = Direction.RIGHT
         return ret
-    
\ No newline at end of file
+
+
+class Color(enum.Enum):
+    """
+    Colors of the objects on the board. Values are hex RGB codes, so the simulation itself does not depend on Qt and
+    the GUI can convert them to QColor when rendering.
+    """
+    BLACK = "#000000"
+    WHITE = "#ffffff"
+    GREEN = "#00ff00"
+    DARK_RED = "#800000"
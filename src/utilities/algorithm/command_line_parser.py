@@ -250,6 +250,30 @@ def parse_cmd_args(arguments):
                         help='Boolean flag for selecting whether or not '
                              'mutation is confined to within the used portion '
                              'of the genome. Default set to True.')
+    parser.add_argument('--batch_mapping',
+                        dest='BATCH_MAPPING',
+                        default=None,
+                        action='store_true',
+                        help='Boolean flag for mapping the genomes created '
+                             'by the operators together, population by '
+                             'population. Only for linear genome '
+                             'operations. Default set to False.')
+    parser.add_argument('--mapping_checkpoints',
+                        dest='MAPPING_CHECKPOINTS',
+                        type=int,
+                        help='Sets the number of codons between checkpoints '
+                             'of the mapping, offspring of linear genome '
+                             'operations are re-mapped from the last '
+                             'checkpoint before the first changed codon. '
+                             'Requires int value, 0 = no checkpoints.')
+    parser.add_argument('--arena_trees',
+                        dest='ARENA_TREES',
+                        default=None,
+                        action='store_true',
+                        help='Boolean flag for storing derivation trees as '
+                             'arrays instead of a Tree object per node. Not '
+                             'used with attribute grammars. Default set to '
+                             'False.')
 
     # CROSSOVER
     parser.add_argument('--crossover',
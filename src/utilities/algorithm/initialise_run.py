@@ -9,6 +9,10 @@ from time import time
 from utilities.stats import trackers
 from utilities.stats.file_io import generate_folders_and_files
 
+# Instances of stateless fitness functions shared by all agents in a process.
+# The key is the module path of the fitness function.
+fitness_function_registry = {}
+
 
 def initialise_run_params(create_files, agent=None):
     """
@@ -242,8 +246,15 @@ def get_fit_func_imports(agent=None):
         # Import module and attribute and save.
         agent.GE_params[op] = return_attr_from_module(module_name, attr_name)
 
-        # Initialise fitness function.
-        agent.GE_params[op] = agent.GE_params[op]()
+        if getattr(agent.GE_params[op], "stateless", False):
+            # Stateless fitness functions are shared by all agents.
+            if module_name not in fitness_function_registry:
+                fitness_function_registry[module_name] = agent.GE_params[op]()
+            agent.GE_params[op] = fitness_function_registry[module_name]
+
+        else:
+            # Initialise fitness function.
+            agent.GE_params[op] = agent.GE_params[op]()
 
 
 def return_attr_from_module(module_name, attr_name):